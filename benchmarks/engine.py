@@ -0,0 +1,84 @@
+"""
+End-to-end ripper runs on synthetic data with different execution backends.
+
+    python benchmarks/engine.py --scale small --threads 4
+
+For each backend, reports the wall time and the amount of array data moved to / from workers for each stage
+(from the profiling report). With the "auto" backend, only BAM decoding (pileup) moves data between processes.
+"""
+import argparse
+import json
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from biom import ripper
+from biom.ripper.core.config import PeakCallingConfig, Scaling
+from biom.sam import synthetic
+
+SCALES = {
+    "tiny": dict(contigs={"1": 200_000, "2": 100_000, "3": 50_000}, fragments=20_000),
+    "small": dict(contigs={"1": 2_000_000, "2": 1_000_000, "3": 500_000}, fragments=200_000),
+    "medium": dict(contigs={"1": 20_000_000, "2": 10_000_000, "3": 5_000_000}, fragments=2_000_000),
+}
+BACKENDS = ("loky", "threading", "auto")
+
+
+def prepare(folder: Path, scale: str, seed: int):
+    params = SCALES[scale]
+    treatment = synthetic.Design(**params, spliced=0.2, hotspots=50, enrichment=0.3, seed=seed)
+    control = synthetic.Design(**params, spliced=0.2, seed=seed + 1)
+    synthetic.write(folder / "treatment.bam", treatment)
+    synthetic.write(folder / "control.bam", control)
+    return sum(params["contigs"].values())
+
+
+def config(folder: Path, geffsize: int, backend: str, threads: int) -> PeakCallingConfig:
+    output = folder / backend
+    for x in "pv", "fdr", "profile":
+        output.joinpath(x).mkdir(parents=True, exist_ok=True)
+    return PeakCallingConfig(
+        treatment=[folder / "treatment.bam"], control=[folder / "control.bam"], contigs=None, geffsize=geffsize,
+        process=PeakCallingConfig.ProcessingParams(
+            stranding="f/s", scaling=Scaling(np.float32(1), np.float32(1)),
+            extsize=defaultdict(lambda: [0, 500, 2000]), threads=threads, backend=backend,
+            inflags=3, exflags=2820, minmapq=1
+        ),
+        callp=PeakCallingConfig.PeakCallingParams(qvcutoff=0.05, pvcutoff=0.01, fecutoff=1.5),
+        saveto=PeakCallingConfig.Saveto(
+            title="engine", pileup=None, enrichment=None, pvtrack=None, pvpeaks=output / "pv",
+            fdrpeaks=output / "fdr", profile=output / "profile"
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", action="append", choices=BACKENDS, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="biom-engine-") as tmpdir:
+        folder = Path(tmpdir)
+        geffsize = prepare(folder, args.scale, args.seed)
+
+        for backend in args.backend or BACKENDS:
+            cfg = config(folder, geffsize, backend, args.threads)
+            start = time.perf_counter()
+            ripper.run(cfg)
+            elapsed = time.perf_counter() - start
+
+            with open(cfg.saveto.profile / "engine.profile.json") as stream:
+                report = json.load(stream)
+            moved = {x["name"]: (x["sent"] + x["received"]) / 2 ** 20 for x in report["stages"] if x["ntasks"]}
+            print(f"{backend:<10} {elapsed:8.2f}s  moved {sum(moved.values()):9.1f}MB  " +
+                  "  ".join(f"{k}={v:.1f}MB" for k, v in moved.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Build & query cost of gindex.Index on a synthetic annotation (RepeatMasker-like short & GENCODE-like long intervals).
+
+    python benchmarks/gindex.py [intervals] [queries]
+
+Queries are answered one by one (Index.overlap) and in a single batch (Index.overlap_many). Two-block records
+are annotated one by one (Annotator.annotate) and in bulk (Annotator.annotate_many), with and without the
+precomputed partition, and with the annotation cache for repeated records. The same queries are joined with the
+index (gindex.join) and their starts are matched to the 3 nearest intervals (Index.nearest). If intervaltree is
+installed, the same queries are measured for a plain IntervalTree as a reference.
+"""
+import sys
+import time
+
+import numpy as np
+
+from biom.gindex import Annotator, Index
+from biom.gindex.join import Queries, join
+
+
+def main(intervals: int = 1_000_000, queries: int = 100_000):
+    rng = np.random.default_rng(42)
+    contiglen = intervals * 500
+    # 90% short repeats & 10% long genes
+    lengths = np.where(rng.random(intervals) < 0.9, rng.integers(50, 1_000, intervals),
+                       rng.integers(1_000, 500_000, intervals))
+    starts = rng.integers(0, contiglen, intervals)
+    names = [f"element-{x}" for x in rng.integers(0, 10_000, intervals).tolist()]
+    records = list(zip(["1"] * intervals, ["+"] * intervals, starts.tolist(), (starts + lengths).tolist(), names))
+
+    qstarts = rng.integers(0, contiglen, queries)
+    qends = qstarts + rng.integers(1, 2_000, queries)
+
+    begin = time.perf_counter()
+    index = Index.build(records)
+    built = time.perf_counter()
+    for s, e in zip(qstarts.tolist()[:10_000], qends.tolist()[:10_000]):
+        index.overlap("1", "+", s, e)
+    single = (time.perf_counter() - built) / 10_000
+    batch = time.perf_counter()
+    hits = index.overlap_many("1", "+", qstarts, qends)
+    batch = (time.perf_counter() - batch) / queries
+    print(f"Index: build {built - begin:.2f}s, overlap {single * 1e6:.1f}us/query, "
+          f"overlap_many {batch * 1e6:.2f}us/query, {hits.indptr[-1]} hits")
+
+    annotator = Annotator(index)
+    nrecords = queries // 2
+    offsets = np.arange(0, 2 * nrecords + 1, 2)
+    begin = time.perf_counter()
+    for ind in range(0, 2_000, 2):
+        annotator.annotatei("1", "+", [(qstarts[ind], qends[ind]), (qstarts[ind + 1], qends[ind + 1])])
+    single = (time.perf_counter() - begin) / 1_000
+    begin = time.perf_counter()
+    annotator.annotate_many("1", "+", qstarts[:2 * nrecords], qends[:2 * nrecords], offsets)
+    bulk = (time.perf_counter() - begin) / nrecords
+    print(f"Annotator: annotate {single * 1e6:.1f}us/record, annotate_many {bulk * 1e6:.2f}us/record")
+
+    begin = time.perf_counter()
+    annotator = Annotator(index, precompute=True)
+    built = time.perf_counter()
+    for ind in range(0, 2_000, 2):
+        annotator.annotatei("1", "+", [(qstarts[ind], qends[ind]), (qstarts[ind + 1], qends[ind + 1])])
+    single = (time.perf_counter() - built) / 1_000
+    begin_many = time.perf_counter()
+    annotator.annotate_many("1", "+", qstarts[:2 * nrecords], qends[:2 * nrecords], offsets)
+    bulk = (time.perf_counter() - begin_many) / nrecords
+    print(f"Annotator(precompute=True): partition {built - begin:.2f}s, annotate {single * 1e6:.1f}us/record, "
+          f"annotate_many {bulk * 1e6:.2f}us/record")
+
+    # PCR duplicates & highly expressed exons: 1000 records drawn from 100 distinct block structures
+    annotator = Annotator(index, cache=1_024)
+    duplicates = rng.integers(0, 100, 1_000).tolist()
+    begin = time.perf_counter()
+    for ind in duplicates:
+        annotator.annotatei("1", "+", [(qstarts[2 * ind], qends[2 * ind]), (qstarts[2 * ind + 1], qends[2 * ind + 1])])
+    cached = (time.perf_counter() - begin) / len(duplicates)
+    info = annotator.cache_info()
+    print(f"Annotator(cache=1024): annotate {cached * 1e6:.1f}us/record, {info.hits} hits, {info.misses} misses")
+
+    peaks = Queries.build(["1"] * queries, ["+"] * queries, qstarts, qends)
+    begin = time.perf_counter()
+    pairs = join(index, peaks)
+    print(f"join: {(time.perf_counter() - begin) * 1e6 / queries:.2f}us/query, {len(pairs)} pairs")
+
+    begin = time.perf_counter()
+    nearest = index.nearest("1", "+", qstarts, k=3)
+    print(f"nearest(k=3): {(time.perf_counter() - begin) * 1e6 / queries:.2f}us/query, "
+          f"median distance {np.median(np.abs(nearest.distances[:, 0])):.0f}bp")
+
+    try:
+        from intervaltree import IntervalTree
+    except ImportError:
+        return
+
+    begin = time.perf_counter()
+    tree = IntervalTree()
+    for _, _, s, e, name in records:
+        tree.addi(s, e, name)
+    built = time.perf_counter()
+    for s, e in zip(qstarts.tolist()[:10_000], qends.tolist()[:10_000]):
+        tree.overlap(s, e)
+    single = (time.perf_counter() - built) / 10_000
+    print(f"IntervalTree: build {built - begin:.2f}s, overlap {single * 1e6:.1f}us/query")
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:]))
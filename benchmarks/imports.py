@@ -0,0 +1,66 @@
+"""
+Import time of biom packages in a fresh interpreter, i.e. the fixed cost paid by every short-lived task.
+
+    python benchmarks/imports.py
+    python benchmarks/imports.py --repeat 10 --budget biom.ripper=0.05
+
+Exits with a non-zero status if the median import time of any package exceeds its budget (in seconds).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+BUDGETS = {
+    "biom": 0.1,
+    "biom.ripper": 0.1,
+    "biom.gindex": 0.1,
+    "biom.ensembl": 0.1,
+    "biom.repmasker": 0.1,
+    "biom.sam": 0.1,
+}
+# Heavy dependencies that must not be imported eagerly
+HEAVY = ("numba", "scipy", "pandas", "pyBigWig", "pysam", "joblib", "MACS3", "pybedtools", "intervaltree")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {package}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "heavy": [x for x in {heavy!r} if x in sys.modules]}}))
+"""
+
+
+def measure(package: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", SCRIPT.format(package=package, heavy=HEAVY)],
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", action="append", default=[], help="Override the budget: package=seconds")
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for x in args.budget:
+        package, seconds = x.split("=")
+        budgets[package] = float(seconds)
+
+    failed = []
+    for package, budget in budgets.items():
+        runs = [measure(package) for _ in range(args.repeat)]
+        median = statistics.median(x["elapsed"] for x in runs)
+        heavy = sorted(set().union(*(x["heavy"] for x in runs)))
+        status = "OK" if median <= budget and not heavy else "FAIL"
+        if status == "FAIL":
+            failed.append(package)
+        print(f"{package:<16} {median * 1000:8.1f}ms  budget {budget * 1000:6.0f}ms  {status}"
+              f"{'  eager: ' + ', '.join(heavy) if heavy else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Benchmarks for the ripper building blocks on synthetic paired-end data.
+
+    python benchmarks/ripper.py --output bench.json
+    python benchmarks/ripper.py --output new.json --compare bench.json
+
+Each benchmark is executed once to warm up (numba compilation, OS caches) and then timed `--repeat` times.
+The best wall time and peak traced memory (numpy allocations) are reported.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+import biom
+from biom.ripper.core import fragments, functors, io, pileup
+from biom.ripper.core.config import PeakCallingConfig
+from biom.ripper.core.pipeline.pipeline import Results
+from biom.sam import synthetic
+
+SCALES = {
+    "tiny": dict(contigs={"1": 200_000, "2": 100_000}, fragments=20_000),
+    "small": dict(contigs={"1": 2_000_000, "2": 1_000_000}, fragments=200_000),
+    "medium": dict(contigs={"1": 20_000_000, "2": 10_000_000}, fragments=2_000_000),
+}
+INFLAGS, EXFLAGS, MINMAPQ = 3, 2820, 1
+CONTIG = "1"
+
+
+@dataclass(frozen=True)
+class Measurement:
+    # Wall time of the first (warmup) call and all timed repeats, in seconds
+    warmup: float
+    times: list[float]
+    # Peak memory traced by tracemalloc during a single call, in bytes
+    memory: int
+
+    def summary(self) -> Dict[str, Any]:
+        return {"warmup": self.warmup, "best": min(self.times), "times": self.times, "memory": self.memory}
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Measurement:
+    start = time.perf_counter()
+    fn()
+    warmup = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Measurement(warmup, times, memory)
+
+
+def prepare(folder: Path, scale: str, seed: int) -> Dict[str, Any]:
+    params = SCALES[scale]
+    treatment = synthetic.Design(**params, spliced=0.2, multimappers=0.1, hotspots=50, enrichment=0.3, seed=seed)
+    control = synthetic.Design(**params, spliced=0.2, multimappers=0.1, seed=seed + 1)
+    synthetic.write(folder / "treatment.bam", treatment)
+    synthetic.write(folder / "control.bam", control)
+
+    deductor = fragments.strdeductors.get("f/s")
+    data = {"folder": folder, "deductor": deductor, "contiglen": np.int32(params["contigs"][CONTIG])}
+    for title in "treatment", "control":
+        blocks, _ = fragments.loadfrom([folder / f"{title}.bam"], deductor, CONTIG, INFLAGS, EXFLAGS, MINMAPQ)
+        data[title] = blocks.fwd
+    return data
+
+
+def benchmarks(data: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+    folder, contiglen = data["folder"], data["contiglen"]
+
+    def bampereader():
+        reader = fragments.BAMPEReader(folder / "treatment.bam", INFLAGS, EXFLAGS, MINMAPQ).fetch(CONTIG)
+        return sum(len(x) for x in reader)
+
+    pairs = [pair for bundle in fragments.BAMPEReader(folder / "treatment.bam", INFLAGS, EXFLAGS, MINMAPQ)
+             .fetch(CONTIG) for pair in bundle]
+
+    def blocksbuilder():
+        builder = fragments.seqblocks.AlignedBlocksBuilder("+")
+        for lmate, rmate in pairs:
+            builder.add(lmate, rmate)
+        return builder.finalize()
+
+    # Precompute inputs for downstream stages
+    trtpileup = pileup.calculate(CONTIG, contiglen, data["treatment"], 0)
+    cntpileups = [pileup.calculate(CONTIG, contiglen, data["control"], ext) for ext in (0, 500, 5000)]
+    cntpileup = pileup.merge.by_max(cntpileups, np.float32(0.1))
+    workload = Results(CONTIG, contiglen, "+", trtpileup, cntpileup)
+    fe = functors.foldenrichment.calculate(workload)
+    pv, pvcounts = functors.pvalues.calculate(workload)
+    pqtable = functors.qvalues.make_pqtable([pvcounts])
+    qv = functors.qvalues.apply_pqtable(pv, pqtable)
+    peaks = functors.callpeaks.PeakCalingWorkload.build(
+        [pv], [qv], [fe], PeakCallingConfig.PeakCallingParams(qvcutoff=0.05, fecutoff=1.5)
+    )
+
+    def tobigwig():
+        fwd = functors.Result(CONTIG, int(contiglen), "+", fe.track)
+        rev = functors.Result(CONTIG, int(contiglen), "-", fe.track)
+        return io.tobigwig([fwd, rev], folder, "benchmark")
+
+    return {
+        "fragments.BAMPEReader": bampereader,
+        "fragments.AlignedBlocksBuilder": blocksbuilder,
+        "pileup.calculate": lambda: pileup.calculate(CONTIG, contiglen, data["control"], 500),
+        "pileup.merge.by_max": lambda: pileup.merge.by_max(
+            [pileup.Pileup(x.id, x.interend.copy(), x.values.copy()) for x in cntpileups], np.float32(0.1)
+        ),
+        "functors.foldenrichment": lambda: functors.foldenrichment.calculate(workload),
+        "functors.pvalues": lambda: functors.pvalues.calculate(workload),
+        "functors.qvalues.make_pqtable": lambda: functors.qvalues.make_pqtable([pvcounts]),
+        "functors.qvalues.apply_pqtable": lambda: functors.qvalues.apply_pqtable(pv, pqtable),
+        "functors.callpeaks": lambda: functors.callpeaks.calculate(peaks[0]),
+        "io.tobigwig": tobigwig,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any], threshold: float) -> bool:
+    regressions = False
+    print(f"\nComparison with biom {previous['version']} (threshold: {threshold:.0%})")
+    for name, cur in current["results"].items():
+        prev = previous["results"].get(name)
+        if prev is None:
+            continue
+        tratio, mratio = cur["best"] / prev["best"], (cur["memory"] + 1) / (prev["memory"] + 1)
+        flag = ""
+        if tratio > 1 + threshold or mratio > 1 + threshold:
+            flag = "  <-- REGRESSION"
+            regressions = True
+        print(f"{name:<36}time x{tratio:6.2f}  memory x{mratio:6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--filter", type=str, default=None, help="Run only benchmarks containing this substring")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = defaultdict(dict)
+    with tempfile.TemporaryDirectory(prefix="biom-benchmarks-") as tmpdir:
+        data = prepare(Path(tmpdir), args.scale, args.seed)
+        for name, fn in benchmarks(data).items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(fn, args.repeat).summary()
+            r = results[name]
+            print(f"{name:<36}best {r['best']:8.4f}s  warmup {r['warmup']:8.4f}s  memory {r['memory'] / 2 ** 20:8.1f}MB")
+
+    report = {
+        "version": biom.__version__,
+        "python": sys.version,
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+
+    if args.compare:
+        with open(args.compare) as stream:
+            previous = json.load(stream)
+        if compare(report, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
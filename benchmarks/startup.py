@@ -0,0 +1,61 @@
+"""
+Startup cost of ripper numba kernels in a fresh process (e.g. a new loky worker).
+
+    python benchmarks/startup.py
+
+Each scenario runs in a new interpreter and measures the time to import kernels and run each of them once:
+* cold - empty numba cache (new node / new version), everything is compiled from scratch
+* cached - numba cache is populated (e.g. by `python -m biom.ripper.core.kernels warmup`)
+* aot - ahead-of-time compiled kernels (`python -m biom.ripper.core.kernels build`), if available
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = """
+import json, time
+start = time.perf_counter()
+import numpy as np
+from biom.ripper.core import kernels
+from biom.ripper.core.fragments import AlignedBlocks
+from biom.ripper.core.functors import foldenrichment, qvalues
+from biom.ripper.core.pileup import Pileup, calculate, merge
+from biom.ripper.core.pipeline.pipeline import Results
+imported = time.perf_counter()
+
+blocks = AlignedBlocks.from_tuples("+", [[(1, 4), (5, 7)], [(2, 9)]])
+pileups = [calculate("1", np.int32(20), [blocks], ext) for ext in (0, 5)]
+merged = merge.by_max(pileups)
+control = merge.by_max([calculate("1", np.int32(20), [blocks], 0)], np.float32(0.5))
+foldenrichment.calculate(Results("1", 20, "+", merged, control))
+qvalues.make_pqtable([{1.5: 10, 0.5: 5}])
+called = time.perf_counter()
+print(json.dumps({"import": imported - start, "first-call": called - imported, "total": called - start,
+                  "aot": kernels.status()}))
+"""
+
+
+def _run(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", SCRIPT], env={**os.environ, **env},
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="biom-numba-cache-") as cache:
+        env = {"NUMBA_CACHE_DIR": cache, "BIOM_DISABLE_AOT": "1"}
+        results["cold"] = _run(env)
+        results["cached"] = _run(env)
+        results["aot"] = _run({"NUMBA_CACHE_DIR": cache})
+
+    for scenario, r in results.items():
+        aot = sum(r["aot"].values())
+        print(f"{scenario:<8} import {r['import']:6.2f}s  first call {r['first-call']:6.2f}s  "
+              f"total {r['total']:6.2f}s  ({aot}/{len(r['aot'])} AOT kernels)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
 __version__ = "0.0.13"
 
+from ._lazy import attach
 from .range import Range
+
+# Subpackages are imported on first access, e.g. `biom.ripper`, to keep `import biom` cheap
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["ensembl", "gindex", "paths", "repmasker", "ripper", "sam"],
+    attributes={"Range": ".range", "RangeArray": ".rangearray"}
+)
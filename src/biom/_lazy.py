@@ -0,0 +1,48 @@
+import importlib
+import sys
+from types import ModuleType
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+class _Package(ModuleType):
+    # Exported attributes might share names with submodules, e.g. biom.ripper.run (function) vs
+    # biom.ripper.run (module). The import system binds a submodule to its parent package upon the first import,
+    # which must not shadow the exported attribute.
+    _shadowed: frozenset = frozenset()
+
+    def __setattr__(self, name, value):
+        if name in self._shadowed and isinstance(value, ModuleType) and value.__name__ == f"{self.__name__}.{name}":
+            return
+        super().__setattr__(name, value)
+
+
+def attach(package: str, submodules: Iterable[str] = (), attributes: Dict[str, str] = None) \
+        -> Tuple[Callable, Callable, List[str]]:
+    """
+    Lazy (PEP 562) exports for a package: returns module-level __getattr__, __dir__ and __all__.
+
+    Submodules are imported on first access, while attributes map an exported name to the relative module
+    defining it, e.g. {"Index": ".index"}. Resolved attributes are cached in the package namespace.
+    """
+    submodules = set(submodules)
+    attributes = attributes if attributes else {}
+    __all__ = sorted(submodules | attributes.keys())
+
+    module = sys.modules[package]
+    module.__class__ = _Package
+    module._shadowed = frozenset(attributes)
+
+    def __getattr__(name: str):
+        if name in submodules:
+            return importlib.import_module(f"{package}.{name}")
+        if name not in attributes:
+            raise AttributeError(f"module '{package}' has no attribute '{name}'")
+
+        value = getattr(importlib.import_module(attributes[name], package), name)
+        setattr(module, name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(module)) | set(__all__))
+
+    return __getattr__, __dir__, __all__
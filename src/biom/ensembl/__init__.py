@@ -1,3 +1,5 @@
-from . import gene, transcript
-from .assembly import Assembly
-from .loader import Loader
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["gene", "transcript"], attributes={"Assembly": ".assembly", "Loader": ".loader"}
+)
@@ -1,2 +1,5 @@
-from .attributes import Attribute
-from .descriptor import Descriptor
+from ..._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, attributes={"Attribute": ".attributes", "Descriptor": ".descriptor"}
+)
@@ -1,3 +1,7 @@
-from . import annotate
-from .annotate import Annotator
-from .index import Index, from_bed, merge
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["annotate", "join", "loader", "partition"],
+    attributes={"Annotator": ".annotate", "Index": ".index", "from_bed": ".index", "merge": ".index",
+                "load": ".loader", "Partition": ".partition"}
+)
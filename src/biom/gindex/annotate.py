@@ -1,9 +1,15 @@
 import math
-from collections import defaultdict
-from typing import Iterable, Any, Union, Literal, Callable
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Any, Union, Literal, Callable, Optional
+
+import numpy as np
+import numpy.typing as npt
 
 from .index import Index, AnnotationIntervals
+from .partition import Partition
 from ..range import Range
+from ..rangearray import RangeArray
 
 AnnotateFn = Callable[['Annotator', dict[Any, float]], Any]
 AnnotateStrategy = Union[
@@ -19,6 +25,59 @@ DisambiguateStrategy = Union[
     DisambiguateFn
 ]
 
+# Code of the empty annotation in bulk results
+EMPTY = -1
+# Relative tolerance for ties between annotation weights in bulk results
+TIE_RTOL = 1e-9
+
+
+@dataclass(frozen=True, slots=True)
+class Fractions:
+    # CSR-style sparse matrix: annotation fractions of the i-th record are [indptr[i], indptr[i + 1])
+    indptr: npt.NDArray[np.int64]
+    # Annotation codes (see Index.categories, EMPTY for the empty annotation) sorted within each record
+    codes: npt.NDArray[np.int32]
+    fractions: npt.NDArray[np.float64]
+
+    def __len__(self) -> int:
+        return self.indptr.size - 1
+
+
+@dataclass(frozen=True, slots=True)
+class CacheInfo:
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class _LRUCache:
+    # Plain LRU dict with hit/miss counters, unlike functools.lru_cache it pickles together with the Annotator
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Any, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, compute: Callable[[], Any]) -> Any:
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        result = self.entries[key] = compute()
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return result
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
 
 class Annotator:
     index: Index
@@ -29,10 +88,16 @@ class Annotator:
     def __init__(
             self, index: Index, empty: Any = "NA",
             disambiguation: DisambiguateStrategy = "proportional",
-            annotation: AnnotateStrategy = "nms"
+            annotation: AnnotateStrategy = "nms",
+            precompute: bool = False,
+            cache: int = 0
     ):
         self.index = index
         self.empty = empty
+        # Precomputed disjoint segments of the index, replaces per-block proportional disambiguation
+        self.partition: Optional[Partition] = None
+        # Vectorized reduction for annotate_many, None for custom strategies
+        self._reduce: Optional[Callable[['Annotator', '_Weights'], Any]] = None
 
         match disambiguation:
             case "proportional":
@@ -45,40 +110,153 @@ class Annotator:
         match annotation:
             case "nms":
                 self.annotatefn = nms
+                self._reduce = _nms_many
             case "frac-overlap":
                 self.annotatefn = frac_overlap
+                self._reduce = _frac_overlap_many
             # case "coverage":
             #     self.collapsefn = coverage
             case ("priority", scoring):
                 self.annotatefn = priority(scoring)
+                self._reduce = _priority_many(scoring)
             case _:
                 self.annotatefn = annotation
 
-    def annotate(self, contig: str, strand: str, blocks: Iterable[Range]) -> Any:
+        if self.disambigfn is not proportional:
+            assert not precompute, "Only proportional disambiguation can be precomputed"
+            self._reduce = None
+        elif precompute:
+            self.partition = Partition.build(index)
+
+        # LRU cache of final annotations keyed by (contig, strand, blocks) with up to `cache` entries, 0 disables it.
+        # Only pure strategies (see `pure`) can be cached.
+        self._cache: Optional[_LRUCache] = None
+        if cache > 0:
+            if not (getattr(self.disambigfn, "pure", False) and getattr(self.annotatefn, "pure", False)):
+                raise ValueError(
+                    "Only pure disambiguation & annotation strategies can be cached, see gindex.annotate.pure"
+                )
+            self._cache = _LRUCache(cache)
+
+    def annotate(self, contig: str, strand: str, blocks: Union[Iterable[Range], RangeArray]) -> Any:
+        if isinstance(blocks, RangeArray):
+            starts, ends = blocks.starts.tolist(), blocks.ends.tolist()
+        else:
+            blocks = list(blocks)
+            starts, ends = [bl.start for bl in blocks], [bl.end for bl in blocks]
+        return self._annotate(contig, strand, starts, ends)
+
+    def _annotate(self, contig: str, strand: str, starts: list[int], ends: list[int]) -> Any:
+        if self._cache is None:
+            return self._compute(contig, strand, starts, ends)
+        starts, ends = tuple(starts), tuple(ends)
+        result = self._cache.get(
+            (contig, strand, starts, ends), lambda: self._compute(contig, strand, starts, ends)
+        )
+        # Cached results are shared, callers get their own copy of mutable ones (e.g. frac-overlap dicts)
+        return dict(result) if isinstance(result, dict) else result
+
+    def _compute(self, contig: str, strand: str, starts: list[int], ends: list[int]) -> Any:
+        # Blocks are plain coordinates, Range objects are created only for the custom disambiguation
+        if self.partition is not None:
+            return self.annotatefn(self, self._partitioned(contig, strand, starts, ends))
+
         overlap = defaultdict(int)
-        for bl in blocks:
-            intervals = self.index.overlap(contig, strand, bl.start, bl.end)
+        for start, end in zip(starts, ends):
+            intervals = self.index.overlap(contig, strand, start, end)
             match len(intervals):
                 case 0:
-                    overlap[self.empty] += len(bl)
+                    overlap[self.empty] += end - start
                 case 1:
-                    anno, length = intervals.annotation[0], len(intervals.intervals[0])
+                    anno, length = intervals.annotation[0], int(intervals.intervals.lengths()[0])
                     overlap[anno] += length
 
-                    diff = len(bl) - length
+                    diff = end - start - length
                     if diff > 0:
                         overlap[self.empty] += diff
                 case _:
-                    self.disambigfn(self, intervals, bl, overlap)
+                    self.disambigfn(self, intervals, Range(start, end), overlap)
 
-        assert math.isclose(sum(overlap.values()), sum(len(bl) for bl in blocks), abs_tol=1e-6)
+        assert math.isclose(sum(overlap.values()), sum(ends) - sum(starts), abs_tol=1e-6)
         return self.annotatefn(self, overlap)
 
+    def _partitioned(self, contig: str, strand: str, starts: list[int], ends: list[int]) -> dict[Any, float]:
+        # Proportional overlap computed from precomputed segments
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        pieces = self.partition.pieces(contig, strand, starts, ends)
+
+        overlap = defaultdict(int)
+        # Zero-length blocks have no pieces, but the per-block path (_compute) still reports them as the empty
+        # annotation with zero length. Keep the key, so records made only of such blocks are annotated as empty.
+        if np.any(starts == ends):
+            overlap.setdefault(self.empty, 0)
+        categories = self.index.categories
+        for setid, length in zip(pieces.sets.tolist(), pieces.lengths.tolist()):
+            members = self.partition.members(setid).tolist()
+            if not members:
+                overlap[self.empty] += length
+            else:
+                weight = length / len(members)
+                for code in members:
+                    overlap[categories[code]] += weight
+        return overlap
+
     def annotatei(self, contig: str, strand: str, blocks: Iterable[tuple[int, int]]) -> Any:
-        blocks = [Range(start, end) for start, end in blocks]
-        return self.annotate(contig, strand, blocks)
+        blocks = list(blocks)
+        return self._annotate(contig, strand, [start for start, _ in blocks], [end for _, end in blocks])
+
+    def annotate_many(self, contig: str, strand: str, starts: npt.ArrayLike, ends: npt.ArrayLike,
+                      record_offsets: npt.ArrayLike) -> Any:
+        """
+        Bulk annotation of records in the AlignedBlocks layout: blocks of the i-th record are
+        [starts[j], ends[j]) for j in [record_offsets[i], record_offsets[i + 1]).
+
+        Built-in strategies are vectorized and return annotation codes (see `decode`): an array with a code for
+        each record for "nms" & "priority" or a sparse Fractions matrix for "frac-overlap". Ties (up to TIE_RTOL)
+        are resolved in favour of the annotation met first along the record. Custom strategies fall back to
+        `annotate` (and its cache, if enabled) and return a list of results.
+        """
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        offsets = np.asarray(record_offsets, dtype=np.int64)
+        assert starts.shape == ends.shape and starts.ndim == 1 and np.all(ends >= starts)
+        assert offsets.ndim == 1 and offsets.size >= 1 and offsets[0] == 0 and offsets[-1] == starts.size
+
+        if self._reduce is None:
+            starts, ends = starts.tolist(), ends.tolist()
+            return [
+                self._annotate(contig, strand, starts[st: en], ends[st: en])
+                for st, en in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+            ]
+        if self.partition is not None:
+            weights = _partitioned_many(
+                self.partition, len(self.index.categories) + 1, contig, strand, starts, ends, offsets
+            )
+        else:
+            weights = _proportional_many(self.index, contig, strand, starts, ends, offsets)
+        return self._reduce(self, weights)
+
+    def cache_info(self) -> Optional[CacheInfo]:
+        # Hits, misses & size of the annotation cache, None if it's disabled
+        return self._cache.info() if self._cache is not None else None
+
+    def cache_clear(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+    def decode(self, codes: npt.ArrayLike) -> list[Any]:
+        return [self.empty if x == EMPTY else self.index.categories[x] for x in np.asarray(codes).tolist()]
+
 
+def pure(fn: Callable) -> Callable:
+    """
+    Mark a disambiguation or annotation strategy as pure: its result depends only on the arguments (and the
+    annotator's index), so Annotator can cache it.
+    """
+    fn.pure = True
+    return fn
 
+
+@pure
 def nms(_: Annotator, overlap: dict[Any, float]) -> Any:
     return max(overlap.items(), key=lambda x: x[1])[0]
 
@@ -87,6 +265,7 @@ def nms(_: Annotator, overlap: dict[Any, float]) -> Any:
 #     return overlap
 
 
+@pure
 def frac_overlap(_: Annotator, overlap: dict[Any, float]) -> Any:
     total = sum(overlap.values())
     return {k: v / total for k, v in overlap.items()}
@@ -95,12 +274,14 @@ def frac_overlap(_: Annotator, overlap: dict[Any, float]) -> Any:
 def priority(scoring: tuple[Any, ...]) -> AnnotateFn:
     scoring = {k: ind for ind, k in enumerate(scoring)}
 
+    @pure
     def job(_: Annotator, overlap: dict[Any, float]) -> Any:
         return min(overlap.items(), key=lambda x: scoring[x[0]])[0]
 
     return job
 
 
+@pure
 def proportional(self: Annotator, intervals: AnnotationIntervals, rng: Range, overlap: dict[Any, float]) -> None:
     stepwise = intervals.to_steps(rng)
     for ind, anno in enumerate(stepwise.annotation):
@@ -112,6 +293,174 @@ def proportional(self: Annotator, intervals: AnnotationIntervals, rng: Range, ov
             for a in anno:
                 overlap[a] += weight
 
+
+@dataclass(frozen=True, slots=True)
+class _Weights:
+    # Total overlap (bp) for each observed (record, annotation code) pair sorted by (record, code)
+    records: npt.NDArray[np.int64]
+    codes: npt.NDArray[np.int32]
+    weights: npt.NDArray[np.float64]
+    # Rank of the first occurrence along the record, used to break ties
+    first: npt.NDArray[np.int64]
+    # Total number of records
+    total: int
+
+
+def _proportional_many(index: Index, contig: str, strand: str, starts: npt.NDArray[np.int64],
+                       ends: npt.NDArray[np.int64], offsets: npt.NDArray[np.int64]) -> _Weights:
+    # Vectorized proportional: each block is split into elementary segments by clipped hit boundaries, a segment
+    # is shared equally by distinct annotations covering it or goes to the empty annotation if nothing covers it.
+    # Hits of the same annotation are merged within blocks first, so that shares can be summed with prefix sums
+    # over segments instead of expanding every hit to all segments it covers.
+    nblocks = starts.size
+    hits = index.overlap_many(contig, strand, starts, ends)
+    hitblock = np.repeat(np.arange(nblocks), np.diff(hits.indptr))
+    hitcode = hits.codes.astype(np.int64)
+
+    # Positions are encoded relative to the block start: group * span + (position - block start)
+    span = int((ends - starts).max(initial=0)) + 1
+
+    # Merge overlapping hits of the same annotation within each block. Hits are sorted by (block, start) already.
+    ncodes = len(index.categories) + 1
+    order = np.argsort(hitblock * ncodes + hitcode, kind='stable')
+    hitblock, hitcode, hitstarts, hitends = hitblock[order], hitcode[order], hits.starts[order], hits.ends[order]
+    newgroup = np.ones(hitblock.size, dtype=bool)
+    newgroup[1:] = (hitblock[1:] != hitblock[:-1]) | (hitcode[1:] != hitcode[:-1])
+    offset = (np.cumsum(newgroup) - 1) * span - starts[hitblock]
+    encstarts, encends = hitstarts + offset, hitends + offset
+    # Encoded positions grow across groups => a hit starts a new interval if it begins after all previous ends
+    reach = np.maximum.accumulate(encends)
+    merged = np.flatnonzero(encstarts > np.concatenate([[-1], reach[:-1]]))
+    mblock, mcode = hitblock[merged], hitcode[merged]
+    mstarts = hitstarts[merged]
+    mends = np.maximum.reduceat(encends, merged) - offset[merged] if merged.size else mstarts
+
+    def keys(block: npt.NDArray[np.int64], position: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+        return block * span + (position - starts[block])
+
+    # Unique boundaries within each block ordered by (block, position)
+    blockids = np.arange(nblocks)
+    boundaries = np.unique(np.concatenate([
+        keys(blockids, starts), keys(blockids, ends), keys(mblock, mstarts), keys(mblock, mends)
+    ]))
+    bblock = boundaries // span
+    # Segment [boundaries[i], boundaries[i + 1]) exists if both boundaries belong to the same block
+    seglen = np.append(np.where(bblock[:-1] == bblock[1:], np.diff(boundaries), 0), 0)
+
+    # Number of distinct annotations covering each segment & prefix sums of their shares
+    first = np.searchsorted(boundaries, keys(mblock, mstarts))
+    last = np.searchsorted(boundaries, keys(mblock, mends))
+    covered = np.cumsum(
+        np.bincount(first, minlength=boundaries.size) - np.bincount(last, minlength=boundaries.size)
+    )
+    shares = np.divide(seglen, covered, out=np.zeros(seglen.size), where=covered > 0)
+    prefix = np.concatenate([[0], np.cumsum(shares)])
+
+    # Segments without hits go to the empty annotation. Zero-length blocks contribute the empty annotation with
+    # zero weight, like in `annotate`; they are ordered right before segments of the following blocks.
+    empty = np.flatnonzero((covered == 0) & (seglen > 0))
+    nullblocks = np.flatnonzero(ends == starts)
+    nullbounds = np.searchsorted(boundaries, keys(nullblocks, starts[nullblocks]))
+
+    # Rank along the record, used to break ties
+    rank = np.concatenate([2 * first + 1, 2 * empty + 1, 2 * nullbounds])
+    blocks = np.concatenate([mblock, bblock[empty], nullblocks])
+    codes = np.concatenate([mcode, np.full(empty.size + nullblocks.size, EMPTY, dtype=np.int64)])
+    weights = np.concatenate([
+        prefix[last] - prefix[first], seglen[empty].astype(np.float64), np.zeros(nullblocks.size)
+    ])
+
+    return _aggregate(blocks, codes, weights, rank, offsets, ncodes)
+
+
+def _partitioned_many(partition: Partition, ncodes: int, contig: str, strand: str, starts: npt.NDArray[np.int64],
+                      ends: npt.NDArray[np.int64], offsets: npt.NDArray[np.int64]) -> _Weights:
+    # Same as _proportional_many, but blocks are split by precomputed segments with known annotation sets
+    pieces = partition.pieces(contig, strand, starts, ends)
+    sizes = partition.sizes()[pieces.sets]
+    # Members of each piece's annotation set, gaps (empty set) go to the empty annotation
+    count = np.maximum(sizes, 1)
+    total = int(count.sum())
+    shift = np.repeat(np.cumsum(count) - count, count)
+    member = np.repeat(partition.setptr[pieces.sets], count) + (np.arange(total) - shift)
+    codes = np.full(total, EMPTY, dtype=np.int64)
+    covered = np.repeat(sizes > 0, count)
+    codes[covered] = partition.codes[member[covered]]
+
+    # Zero-length blocks contribute the empty annotation with zero weight, like in `annotate`
+    nullblocks = np.flatnonzero(ends == starts)
+    rank = np.concatenate([2 * np.repeat(np.arange(pieces.queries.size), count) + 1,
+                           2 * np.searchsorted(pieces.queries, nullblocks)])
+    blocks = np.concatenate([np.repeat(pieces.queries, count), nullblocks])
+    codes = np.concatenate([codes, np.full(nullblocks.size, EMPTY, dtype=np.int64)])
+    weights = np.concatenate([np.repeat(pieces.lengths / count, count), np.zeros(nullblocks.size)])
+    return _aggregate(blocks, codes, weights, rank, offsets, ncodes)
+
+
+def _aggregate(blocks: npt.NDArray[np.int64], codes: npt.NDArray[np.int64], weights: npt.NDArray[np.float64],
+               rank: npt.NDArray[np.int64], offsets: npt.NDArray[np.int64], ncodes: int) -> _Weights:
+    # Sum weights for each (record, code) in the order along the record
+    blockrecord = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))
+    keys = blockrecord[blocks] * ncodes + (codes - EMPTY)
+    order = np.argsort(rank, kind='stable')
+    order = order[np.argsort(keys[order], kind='stable')]
+    keys, rank, codes, weights = keys[order], rank[order], codes[order], weights[order]
+    head = np.ones(keys.size, dtype=bool)
+    head[1:] = keys[1:] != keys[:-1]
+    groups = np.cumsum(head) - 1
+    return _Weights(
+        keys[head] // ncodes, codes[head].astype(np.int32), np.bincount(groups, weights=weights), rank[head],
+        offsets.size - 1
+    )
+
+
+def _select(w: _Weights, scores: npt.NDArray[Any]) -> npt.NDArray[np.int32]:
+    # Code with the minimal score for each record, the first one in (record, code) order among equals
+    result = np.full(w.total, EMPTY, dtype=np.int32)
+    if w.records.size == 0:
+        return result
+    heads = np.flatnonzero(np.diff(w.records, prepend=-1))
+    best = np.repeat(np.minimum.reduceat(scores, heads), np.diff(heads, append=w.records.size))
+    selected = np.flatnonzero(scores == best)
+    first = np.diff(w.records[selected], prepend=-1) != 0
+    result[w.records[selected[first]]] = w.codes[selected[first]]
+    return result
+
+
+def _nms_many(_: Annotator, w: _Weights) -> npt.NDArray[np.int32]:
+    if w.records.size == 0:
+        return np.full(w.total, EMPTY, dtype=np.int32)
+    # Max weight for each record, ties are resolved by the first occurrence. Weights are sums of fractions, so
+    # they are compared up to the rounding error.
+    heads = np.flatnonzero(np.diff(w.records, prepend=-1))
+    best = np.repeat(np.maximum.reduceat(w.weights, heads), np.diff(heads, append=w.records.size))
+    return _select(w, np.where(w.weights >= best * (1 - TIE_RTOL), w.first, np.iinfo(np.int64).max))
+
+
+def _frac_overlap_many(_: Annotator, w: _Weights) -> Fractions:
+    indptr = np.zeros(w.total + 1, dtype=np.int64)
+    np.cumsum(np.bincount(w.records, minlength=w.total), out=indptr[1:])
+    totals = np.bincount(w.records, weights=w.weights, minlength=w.total)[w.records]
+    fractions = np.divide(w.weights, totals, out=np.zeros_like(w.weights), where=totals > 0)
+    return Fractions(indptr, w.codes, fractions)
+
+
+def _priority_many(scoring: tuple[Any, ...]) -> Callable[[Annotator, _Weights], npt.NDArray[np.int32]]:
+    scoring = {k: ind for ind, k in enumerate(scoring)}
+
+    def job(self: Annotator, w: _Weights) -> npt.NDArray[np.int32]:
+        # Rank of each code shifted by one to fit EMPTY, unknown annotations are ranked -1
+        ranks = np.asarray(
+            [scoring.get(self.empty, -1)] + [scoring.get(x, -1) for x in self.index.categories], dtype=np.int64
+        )
+        ranks = ranks[w.codes - EMPTY]
+        if np.any(ranks < 0):
+            missing = w.codes[np.flatnonzero(ranks < 0)[0]]
+            raise KeyError(self.decode([missing])[0])
+        return _select(w, ranks)
+
+    return job
+
 # def overlap_to_new_category(category: Any) -> DisambiguateFn:
 #     def job(_: Annotator, __: AnnotationIntervals, ___: Range, ____: dict[Any, float]) -> Any:
 #         return category
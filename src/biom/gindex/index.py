@@ -1,30 +1,47 @@
+import json
+import pickle
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Any
+from typing import TYPE_CHECKING, Callable, Any, Iterable, Literal, Optional
 
-from intervaltree import IntervalTree
-from pybedtools import BedTool, Interval as BedInterval
+import numpy as np
+import numpy.typing as npt
 from sortedcontainers import SortedList
 
 from ..range import Range
+from ..rangearray import RangeArray
 
+if TYPE_CHECKING:
+    from pybedtools import Interval as BedInterval
 
-def bedname(it: BedInterval) -> Any:
+Direction = Literal["upstream", "downstream"]
+
+# Intervals are grouped by length classes: k-th class holds intervals of [4^k, 4^(k+1)) bp. Within a class,
+# the max interval length bounds how far left of a query overlapping intervals might start.
+CLASS_BASE_LOG2 = 2
+# Coordinates are packed with length classes into int64 sort keys
+MAX_POSITION_LOG2 = 40
+MAX_POSITION = 1 << MAX_POSITION_LOG2
+
+
+def bedname(it: 'BedInterval') -> Any:
     return it.name
 
 
-def from_bed(bed: Path, datafn: Callable[[BedInterval], Any] = bedname) -> 'Index':
-    itrees = {}
-    for it in BedTool(bed):
-        key = (it.chrom, it.strand)
-        tree = itrees.get(key, None)
-        if tree is None:
-            tree = IntervalTree()
-            tree.addi(it.start, it.end, data=datafn(it))
-            itrees[key] = tree
-        else:
-            tree.addi(it.start, it.end, data=datafn(it))
-    return Index(itrees)
+def from_bed(bed: Path, datafn: Callable[['BedInterval'], Any] = bedname) -> 'Index':
+    if datafn is bedname:
+        from . import loader
+        return loader.load(bed, "name", "bed")
+
+    # Custom annotations need BedTool intervals. pybedtools is slow to import, load it only when needed.
+    try:
+        from pybedtools import BedTool
+    except ImportError as e:
+        raise ImportError(
+            "Custom `datafn` requires pybedtools, install it with `pip install biom[bedtools]`"
+        ) from e
+
+    return Index.build((it.chrom, it.strand, it.start, it.end, datafn(it)) for it in BedTool(bed))
 
 
 def merge(*indices: 'Index') -> 'Index':
@@ -33,20 +50,18 @@ def merge(*indices: 'Index') -> 'Index':
     elif len(indices) == 1:
         return indices[0]
 
-    keys = set()
-    for ind in indices:
-        keys |= ind.itrees.keys()
+    # Shared categories: codes of each index are remapped to positions in the merged list
+    codes: dict[Any, int] = {}
+    remaps = [
+        np.asarray([codes.setdefault(x, len(codes)) for x in ind.categories], dtype=np.int32) for ind in indices
+    ]
 
-    itrees = {}
+    keys = dict.fromkeys(key for ind in indices for key in ind.intervals)
+    intervals = {}
     for key in keys:
-        merged = set()
-        for ind in indices:
-            tree = ind.itrees.get(key, None)
-            if tree is not None:
-                merged |= set(tree)
-
-        itrees[key] = IntervalTree(merged)
-    return Index(itrees)
+        parts = [(ind.intervals[key], remap) for ind, remap in zip(indices, remaps) if key in ind.intervals]
+        intervals[key] = Intervals.merge([it for it, _ in parts], [remap[it.codes] for it, remap in parts])
+    return Index(intervals, list(codes))
 
 
 @dataclass(frozen=True, slots=True)
@@ -60,21 +75,17 @@ class AnnotationSteps:
 
 @dataclass(frozen=True, slots=True)
 class AnnotationIntervals:
-    intervals: list[Range]
+    intervals: RangeArray
     annotation: list[Any]
 
     def to_steps(self, rng: Range) -> AnnotationSteps:
-        boundaries = {rng.start, rng.end}
-        for it in self.intervals:
-            boundaries.add(it.start)
-            boundaries.add(it.end)
-
-        boundaries = SortedList(boundaries)
+        starts, ends = self.intervals.starts.tolist(), self.intervals.ends.tolist()
+        boundaries = SortedList({rng.start, rng.end, *starts, *ends})
 
         annotation = [set() for _ in range(len(boundaries) - 1)]
 
-        for it, anno in zip(self.intervals, self.annotation):
-            st, en = boundaries.bisect_left(it.start), boundaries.bisect_left(it.end)
+        for start, end, anno in zip(starts, ends, self.annotation):
+            st, en = boundaries.bisect_left(start), boundaries.bisect_left(end)
             for stanno in annotation[st:en]:
                 stanno.add(anno)
 
@@ -84,23 +95,352 @@ class AnnotationIntervals:
         return len(self.intervals)
 
 
+@dataclass(frozen=True, slots=True)
+class Overlaps:
+    # CSR-style batched overlaps: hits of the i-th query are [indptr[i], indptr[i + 1])
+    indptr: npt.NDArray[np.int64]
+    # Hit intervals clipped to the query, sorted by start within each query
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    # Annotation codes (see Index.categories) & positions of hits in the Intervals arrays
+    codes: npt.NDArray[np.int32]
+    hits: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return self.indptr.size - 1
+
+    @staticmethod
+    def empty(queries: int) -> 'Overlaps':
+        i64 = np.empty(0, dtype=np.int64)
+        return Overlaps(np.zeros(queries + 1, dtype=np.int64), i64, i64, np.empty(0, dtype=np.int32), i64)
+
+
+@dataclass(frozen=True, slots=True)
+class Nearest:
+    # k nearest intervals for each query ordered by distance, hits[i, j] = -1 if there are less than j + 1 of them
+    hits: npt.NDArray[np.int64]
+    codes: npt.NDArray[np.int32]
+    # Signed distances: 0 for overlaps, > 0 for intervals downstream of the query (on the index strand), < 0 for
+    # upstream ones. Book-ended intervals are at distance 1, like in bedtools closest.
+    distances: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return self.hits.shape[0]
+
+    @staticmethod
+    def empty(queries: int, k: int) -> 'Nearest':
+        return Nearest(
+            np.full((queries, k), -1, dtype=np.int64), np.full((queries, k), -1, dtype=np.int32),
+            np.zeros((queries, k), dtype=np.int64)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Flanks:
+    # Intervals ordered by start & by end: starts = Intervals.starts[bystart], ends = Intervals.ends[byend]
+    bystart: npt.NDArray[np.int64]
+    starts: npt.NDArray[np.int64]
+    byend: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+
+
+@dataclass(frozen=True, slots=True)
+class Intervals:
+    # Unique (start, end, code) intervals sorted by (length class, start)
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    codes: npt.NDArray[np.int32]
+    # Intervals of the k-th length class are [classes[k], classes[k + 1]), maxlen[k] - the longest among them
+    classes: npt.NDArray[np.int64]
+    maxlen: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return self.starts.size
+
+    @staticmethod
+    def build(starts: npt.ArrayLike, ends: npt.ArrayLike, codes: npt.ArrayLike) -> 'Intervals':
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        codes = np.asarray(codes, dtype=np.int32)
+        if np.any(ends <= starts):
+            raise ValueError("Null or negative intervals are not allowed")
+        if starts.size and (starts.min() < 0 or ends.max() >= MAX_POSITION):
+            raise ValueError(f"Interval coordinates must be in [0, {MAX_POSITION})")
+        return Intervals._sorted(starts, ends, codes)
+
+    @staticmethod
+    def merge(parts: list['Intervals'], codes: list[npt.NDArray[np.int32]]) -> 'Intervals':
+        """
+        Merge intervals with codes already remapped to a shared categories list. Each part is a sorted run, so
+        the final sort is a k-way merge of runs.
+        """
+        return Intervals._sorted(
+            np.concatenate([x.starts for x in parts]), np.concatenate([x.ends for x in parts]),
+            np.concatenate(codes).astype(np.int32, copy=False)
+        )
+
+    @staticmethod
+    def _sorted(starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64],
+                codes: npt.NDArray[np.int32]) -> 'Intervals':
+        lengths = ends - starts
+        lenclass = np.floor(np.log2(lengths)).astype(np.int64) // CLASS_BASE_LOG2
+
+        # Stable sort by (length class, start) finds & merges presorted runs. Ties are rare & sorted separately
+        # by (end, code) to put identical entries next to each other.
+        key = (lenclass << MAX_POSITION_LOG2) | starts
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        tied = np.zeros(key.size, dtype=bool)
+        tied[1:] = key[1:] == key[:-1]
+        tied[:-1] |= tied[1:]
+        if tied.any():
+            subset = order[tied]
+            order[tied] = subset[np.lexsort((codes[subset], ends[subset], key[tied]))]
+        starts, ends, codes, lengths, lenclass = \
+            starts[order], ends[order], codes[order], lengths[order], lenclass[order]
+
+        # Identical (start, end, annotation) entries are stored once
+        unique = np.ones(starts.size, dtype=bool)
+        unique[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1]) | (codes[1:] != codes[:-1])
+        starts, ends, codes, lengths, lenclass = \
+            starts[unique], ends[unique], codes[unique], lengths[unique], lenclass[unique]
+
+        classes = np.flatnonzero(np.diff(lenclass, prepend=-1))
+        maxlen = np.maximum.reduceat(lengths, classes) if classes.size else np.empty(0, dtype=np.int64)
+        return Intervals(starts, ends, codes, np.append(classes, starts.size), maxlen)
+
+    def overlap(self, starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64]) -> Overlaps:
+        queries, hits = [], []
+        for cls, maxlen in enumerate(self.maxlen.tolist()):
+            first, last = self.classes[cls], self.classes[cls + 1]
+            clsstarts = self.starts[first: last]
+            # Overlapping intervals start in (qstart - maxlen, qend)
+            lo = np.searchsorted(clsstarts, starts - maxlen, side='right')
+            hi = np.searchsorted(clsstarts, ends, side='left')
+            # Empty queries overlap nothing
+            counts = np.where(ends > starts, np.maximum(hi - lo, 0), 0)
+            total = counts.sum()
+            if total == 0:
+                continue
+
+            qind = np.repeat(np.arange(starts.size), counts)
+            # lo[q], lo[q] + 1, ..., hi[q] - 1 for each query
+            shift = np.repeat(np.cumsum(counts) - counts, counts)
+            candidates = first + np.repeat(lo, counts) + (np.arange(total) - shift)
+            keep = self.ends[candidates] > starts[qind]
+            queries.append(qind[keep])
+            hits.append(candidates[keep])
+
+        if not hits:
+            return Overlaps.empty(starts.size)
+        # Order hits by (query, start): hits of each class are sorted that way already
+        queries, hits = np.concatenate(queries), np.concatenate(hits)
+        if len(self.maxlen) > 1:
+            order = np.argsort(self.starts[hits], kind='stable')
+            order = order[np.argsort(queries[order], kind='stable')]
+            queries, hits = queries[order], hits[order]
+
+        indptr = np.zeros(starts.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(queries, minlength=starts.size), out=indptr[1:])
+        return Overlaps(
+            indptr, np.maximum(self.starts[hits], starts[queries]), np.minimum(self.ends[hits], ends[queries]),
+            self.codes[hits], hits
+        )
+
+
+    def flanks(self) -> Flanks:
+        bystart = np.argsort(self.starts, kind='stable')
+        byend = np.argsort(self.ends, kind='stable')
+        return Flanks(bystart, self.starts[bystart], byend, self.ends[byend])
+
+    def nearest(self, flanks: Flanks, starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64], k: int,
+                reverse: bool, direction: Optional[Direction]) -> Nearest:
+        """
+        k nearest intervals for each query: overlapping intervals first, then flanking ones are merged from both
+        sides in the order of distance (left side wins ties). `reverse` - the index strand is reversed (-).
+        """
+        result = Nearest.empty(starts.size, k)
+        overlaps = self.overlap(starts, ends)
+        noverlaps = np.diff(overlaps.indptr)
+
+        # Closest flanking intervals: the first one starting at/after the query end & the last one ending at/before
+        # the query start. Exhausted sides are marked with out-of-range positions.
+        total = len(self)
+        right = np.searchsorted(flanks.starts, ends, side='left')
+        left = np.searchsorted(flanks.ends, starts, side='right') - 1
+        if direction is not None:
+            # Upstream is on the left for the forward strand
+            if (direction == "upstream") != reverse:
+                right[:] = total
+            else:
+                left[:] = -1
+
+        unreachable = np.iinfo(np.int64).max
+        for j in range(k):
+            overlapping = j < noverlaps
+            ind = np.flatnonzero(overlapping)
+            result.hits[ind, j] = overlaps.hits[overlaps.indptr[ind] + j]
+
+            ldist = np.where(left >= 0, starts - flanks.ends[np.maximum(left, 0)] + 1, unreachable)
+            rdist = np.where(right < total, flanks.starts[np.minimum(right, total - 1)] - ends + 1, unreachable)
+            takeleft = ~overlapping & (ldist <= rdist) & (ldist != unreachable)
+            takeright = ~overlapping & ~takeleft & (rdist != unreachable)
+
+            result.hits[takeleft, j] = flanks.byend[left[takeleft]]
+            result.distances[takeleft, j] = -ldist[takeleft]
+            result.hits[takeright, j] = flanks.bystart[right[takeright]]
+            result.distances[takeright, j] = rdist[takeright]
+            left[takeleft] -= 1
+            right[takeright] += 1
+
+        if reverse:
+            np.negative(result.distances, out=result.distances)
+        found = result.hits >= 0
+        result.codes[found] = self.codes[result.hits[found]]
+        return result
+
+
 class Index:
-    itrees: dict[tuple[str, str], IntervalTree]
+    """
+    Genomic index of annotated intervals for each (contig, strand), see Intervals.
+    Annotations are stored as integer codes, i.e. positions in `categories`. Annotations must be hashable.
+
+    Indices can be saved to a folder of flat .npy arrays (see `save`) and loaded back as memory-mapped arrays.
+    Memory-mapped indices are pickled as a reference to the folder, i.e. worker processes map the same pages
+    instead of receiving copies.
+    """
+    # Folder layout: intervals of all (contig, strand) pairs are concatenated in flat arrays
+    META = "index.json"
+    ARRAYS = ("starts", "ends", "codes")
+    CATEGORIES = "categories.pkl"
+
+    intervals: dict[tuple[str, str], Intervals]
+    categories: list[Any]
+
+    def __init__(self, intervals: Optional[dict[tuple[str, str], Intervals]] = None,
+                 categories: Optional[list[Any]] = None):
+        self.intervals = intervals if intervals is not None else {}
+        self.categories = categories if categories is not None else []
+        self._codes: Optional[dict[Any, int]] = None
+        # Intervals sorted by start & end for nearest queries, built on first use
+        self._flanks: dict[tuple[str, str], Flanks] = {}
+        # Folder of the memory-mapped arrays, if any
+        self._mmapped: Optional[Path] = None
 
-    def __init__(self, itrees=None):
-        if itrees is None:
-            itrees = {}
-        self.itrees = itrees
+    def __reduce__(self):
+        if self._mmapped is not None:
+            return Index.load, (self._mmapped, True)
+        return Index, (self.intervals, self.categories)
+
+    def save(self, folder: Path):
+        folder.mkdir(parents=True, exist_ok=True)
+        keys = list(self.intervals)
+        offsets = np.cumsum([0] + [len(self.intervals[k]) for k in keys]).tolist()
+        for name in self.ARRAYS:
+            chunks = [getattr(self.intervals[k], name) for k in keys]
+            dtype = np.int32 if name == "codes" else np.int64
+            np.save(folder / f"{name}.npy", np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype))
+
+        with open(folder / self.CATEGORIES, 'wb') as stream:
+            pickle.dump(self.categories, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            "keys": [list(k) for k in keys], "offsets": offsets,
+            "classes": [self.intervals[k].classes.tolist() for k in keys],
+            "maxlen": [self.intervals[k].maxlen.tolist() for k in keys],
+        }
+        with open(folder / self.META, 'w') as stream:
+            json.dump(meta, stream)
+
+    @staticmethod
+    def load(folder: Path, mmap: bool = True) -> 'Index':
+        with open(folder / Index.META) as stream:
+            meta = json.load(stream)
+        with open(folder / Index.CATEGORIES, 'rb') as stream:
+            categories = pickle.load(stream)
+        # Indices are never modified => read-only mapping
+        arrays = [np.load(folder / f"{name}.npy", mmap_mode='r' if mmap else None) for name in Index.ARRAYS]
+
+        intervals = {}
+        offsets = meta["offsets"]
+        for ind, (contig, strand) in enumerate(meta["keys"]):
+            start, end = offsets[ind], offsets[ind + 1]
+            starts, ends, codes = (x[start: end] for x in arrays)
+            intervals[(contig, strand)] = Intervals(
+                starts, ends, codes, np.asarray(meta["classes"][ind], dtype=np.int64),
+                np.asarray(meta["maxlen"][ind], dtype=np.int64)
+            )
+
+        index = Index(intervals, categories)
+        if mmap:
+            index._mmapped = folder.resolve()
+        return index
+
+    @staticmethod
+    def build(records: Iterable[tuple[str, str, int, int, Any]]) -> 'Index':
+        """
+        Index (contig, strand, start, end, annotation) records.
+        """
+        codes: dict[Any, int] = {}
+        grouped: dict[tuple[str, str], tuple[list[int], list[int], list[int]]] = {}
+        for contig, strand, start, end, annotation in records:
+            code = codes.setdefault(annotation, len(codes))
+            group = grouped.get((contig, strand))
+            if group is None:
+                group = grouped[(contig, strand)] = ([], [], [])
+            group[0].append(start)
+            group[1].append(end)
+            group[2].append(code)
+
+        intervals = {key: Intervals.build(*group) for key, group in grouped.items()}
+        return Index(intervals, list(codes))
+
+    def encode(self, annotation: Any) -> Optional[int]:
+        if self._codes is None or len(self._codes) != len(self.categories):
+            self._codes = {x: ind for ind, x in enumerate(self.categories)}
+        return self._codes.get(annotation)
 
     def overlap(self, contig: str, strand: str, start: int, end: int) -> AnnotationIntervals:
-        index = self.itrees.get((contig, strand), None)
+        index = self.intervals.get((contig, strand), None)
         if index is None:
-            return AnnotationIntervals([], [])
-
-        hits, annotation = [], []
-        for it in index.overlap(start, end):
-            hits.append(Range(
-                max(start, it.begin), min(end, it.end)
-            ))
-            annotation.append(it.data)
-        return AnnotationIntervals(hits, annotation)
+            return AnnotationIntervals(RangeArray.empty(), [])
+
+        hits = index.overlap(np.asarray([start], dtype=np.int64), np.asarray([end], dtype=np.int64))
+        annotation = [self.categories[x] for x in hits.codes.tolist()]
+        return AnnotationIntervals(RangeArray(hits.starts, hits.ends), annotation)
+
+    def overlap_many(self, contig: str, strand: str, starts: npt.ArrayLike, ends: npt.ArrayLike) -> Overlaps:
+        """
+        Batched overlap queries [starts[i], ends[i]), see Overlaps for the output format.
+        """
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        assert starts.shape == ends.shape and starts.ndim == 1
+        index = self.intervals.get((contig, strand), None)
+        if index is None:
+            return Overlaps.empty(starts.size)
+        return index.overlap(starts, ends)
+
+    def closest(self, contig: str, strand: str, starts: npt.ArrayLike, ends: npt.ArrayLike, k: int = 1,
+                direction: Optional[Direction] = None) -> Nearest:
+        """
+        k nearest intervals for each query [starts[i], ends[i]), see Nearest. `direction` limits flanking intervals
+        to upstream or downstream ones relative to the strand ('.' is treated as forward), overlaps are always
+        reported.
+        """
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        assert starts.shape == ends.shape and starts.ndim == 1 and np.all(ends > starts) and k >= 1
+        assert direction in (None, "upstream", "downstream")
+        index = self.intervals.get((contig, strand), None)
+        if index is None:
+            return Nearest.empty(starts.size, k)
+
+        flanks = self._flanks.get((contig, strand), None)
+        if flanks is None:
+            flanks = self._flanks[(contig, strand)] = index.flanks()
+        return index.nearest(flanks, starts, ends, k, strand == "-", direction)
+
+    def nearest(self, contig: str, strand: str, positions: npt.ArrayLike, k: int = 1,
+                direction: Optional[Direction] = None) -> Nearest:
+        """
+        k nearest intervals for each position, see closest.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.closest(contig, strand, positions, positions + 1, k, direction)
@@ -0,0 +1,151 @@
+"""
+Bulk join of query intervals (e.g. peaks) with an Index: all overlapping (query, indexed interval) pairs.
+
+Queries are split by contig & strand and each group is answered with a single batched Index query, so the cost
+is a sort-merge over both interval sets plus the output size. Contigs can be processed in parallel threads.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Literal, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from .index import Index
+
+# same - only intervals on the query strand, ignore - intervals on any strand, opposite - on the opposite strand
+Strandness = Literal["same", "ignore", "opposite"]
+OPPOSITE = {"+": "-", "-": "+"}
+
+
+@dataclass(frozen=True, slots=True)
+class Queries:
+    contigs: npt.NDArray[np.str_]
+    strands: npt.NDArray[np.str_]
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return self.starts.size
+
+    @staticmethod
+    def build(contigs: npt.ArrayLike, strands: npt.ArrayLike, starts: npt.ArrayLike,
+              ends: npt.ArrayLike) -> 'Queries':
+        contigs, strands = np.asarray(contigs, dtype=np.str_), np.asarray(strands, dtype=np.str_)
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        assert contigs.shape == strands.shape == starts.shape == ends.shape and starts.ndim == 1
+        assert np.all(ends >= starts)
+        return Queries(contigs, strands, starts, ends)
+
+    @staticmethod
+    def from_file(path: Path, fmt: Optional[str] = None) -> 'Queries':
+        # BED, GTF or GFF3, plain or gzipped (e.g. narrowPeak files are BED)
+        from . import loader
+
+        contigs, strands, starts, ends = [], [], [], []
+        for chunk in loader.chunks(path, "name", fmt):
+            contigs.append(np.asarray(chunk.contigs, dtype=np.str_)[chunk.contig])
+            strands.append(np.asarray(chunk.strands, dtype=np.str_)[chunk.strand])
+            starts.append(chunk.starts)
+            ends.append(chunk.ends)
+        if not starts:
+            return Queries.build([], [], [], [])
+        return Queries(np.concatenate(contigs), np.concatenate(strands), np.concatenate(starts), np.concatenate(ends))
+
+
+@dataclass(frozen=True, slots=True)
+class Pairs:
+    # Overlapping pairs sorted by (query, start): queries[i] is a position in the Queries
+    queries: npt.NDArray[np.int64]
+    # Indexed intervals & their annotation codes (see Index.categories)
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    codes: npt.NDArray[np.int32]
+    # Overlap length in bp
+    overlaps: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return self.queries.size
+
+    @staticmethod
+    def empty() -> 'Pairs':
+        i64 = np.empty(0, dtype=np.int64)
+        return Pairs(i64, i64, i64, np.empty(0, dtype=np.int32), i64)
+
+    @staticmethod
+    def concatenate(parts: list['Pairs']) -> 'Pairs':
+        if not parts:
+            return Pairs.empty()
+        return Pairs(*(np.concatenate([getattr(x, f.name) for x in parts]) for f in fields(Pairs)))
+
+    def take(self, indices: npt.NDArray[np.int64]) -> 'Pairs':
+        return Pairs(*(getattr(self, f.name)[indices] for f in fields(Pairs)))
+
+
+def _targets(index: Index, contig: str, strand: str, strandness: Strandness) -> list[str]:
+    match strandness:
+        case "same":
+            return [strand]
+        case "opposite":
+            return [OPPOSITE[strand]] if strand in OPPOSITE else []
+        case "ignore":
+            return [s for c, s in index.intervals if c == contig]
+        case _:
+            raise ValueError(f"Unknown strandness: {strandness}")
+
+
+def _contig(index: Index, queries: Queries, contig: str, members: npt.NDArray[np.int64],
+            strandness: Strandness, minfrac: float, reciprocal: bool) -> Pairs:
+    parts = []
+    strands = queries.strands[members]
+    for strand in np.unique(strands).tolist():
+        group = members[strands == strand]
+        starts, ends = queries.starts[group], queries.ends[group]
+        for target in _targets(index, contig, strand, strandness):
+            intervals = index.intervals.get((contig, target), None)
+            if intervals is None:
+                continue
+            hits = intervals.overlap(starts, ends)
+            local = np.repeat(np.arange(group.size), np.diff(hits.indptr))
+            overlaps = hits.ends - hits.starts
+            tstarts, tends = intervals.starts[hits.hits], intervals.ends[hits.hits]
+
+            keep = overlaps >= minfrac * (ends - starts)[local]
+            if reciprocal:
+                keep &= overlaps >= minfrac * (tends - tstarts)
+            parts.append(Pairs(group[local[keep]], tstarts[keep], tends[keep], hits.codes[keep], overlaps[keep]))
+
+    return Pairs.concatenate(parts)
+
+
+def join(index: Index, queries: Union[Queries, Path], strandness: Strandness = "same", minfrac: float = 0,
+         reciprocal: bool = False, threads: int = 1) -> Pairs:
+    """
+    All pairs of overlapping query & indexed intervals, queries are Queries or a BED/GTF/GFF3 file.
+    Pairs are kept if the overlap covers at least `minfrac` of the query (and of the indexed interval if
+    `reciprocal`). Empty queries overlap nothing. With strandness="same", unstranded (".") queries match
+    unstranded intervals only. Contigs are processed by up to `threads` threads.
+    """
+    assert 0 <= minfrac <= 1
+    if not isinstance(queries, Queries):
+        queries = Queries.from_file(queries)
+    contigs, inverse = np.unique(queries.contigs, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(contigs.size + 1))
+    workloads = [(contig, order[bounds[ind]: bounds[ind + 1]]) for ind, contig in enumerate(contigs.tolist())]
+
+    def job(workload: tuple[str, npt.NDArray[np.int64]]) -> Pairs:
+        return _contig(index, queries, *workload, strandness, minfrac, reciprocal)
+
+    if threads > 1 and len(workloads) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            parts = list(pool.map(job, workloads))
+    else:
+        parts = [job(x) for x in workloads]
+    pairs = Pairs.concatenate(parts)
+
+    # Sort by (query, start)
+    order = np.argsort(pairs.starts, kind='stable')
+    order = order[np.argsort(pairs.queries[order], kind='stable')]
+    return pairs.take(order)
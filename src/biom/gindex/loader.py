@@ -0,0 +1,192 @@
+"""
+Chunked loader of BED, GTF & GFF3 annotations (plain or gzipped) straight into gindex.Index.
+
+Files are parsed in large blocks by the pandas C parser; contigs, strands & annotations are read as categoricals,
+so each chunk is turned into integer arrays without creating a Python object per line.
+"""
+import gzip
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Literal, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from .index import Index, Intervals
+
+Format = Literal["bed", "gtf", "gff3"]
+
+COLUMNS = {
+    "bed": ["contig", "start", "end", "name", "score", "strand"],
+    "gtf": ["contig", "source", "feature", "start", "end", "score", "strand", "frame", "attributes"],
+    "gff3": ["contig", "source", "feature", "start", "end", "score", "strand", "frame", "attributes"],
+}
+# Attribute values in the last GTF & GFF3 column
+ATTRIBUTE = {
+    "gtf": r'(?:^|;)\s*{key} "([^"]*)"',
+    "gff3": r'(?:^|;){key}=([^;]*)',
+}
+CHUNKSIZE = 1_000_000
+# Comment & header lines, see _headers
+HEADER = re.compile(rb'\n(?:#|track|browser)')
+BLOCKSIZE = 16 * 1024 * 1024
+
+
+def detect(path: Path) -> Format:
+    suffixes = [x.lower() for x in path.suffixes if x.lower() != ".gz"]
+    match suffixes[-1] if suffixes else None:
+        case ".bed" | ".narrowpeak" | ".broadpeak":
+            return "bed"
+        case ".gtf":
+            return "gtf"
+        case ".gff" | ".gff3":
+            return "gff3"
+        case _:
+            raise ValueError(f"Can't infer annotation format from the file name: {path}")
+
+
+def _ncolumns(path: Path) -> int:
+    # Number of columns in the first data line
+    opener = gzip.open if path.suffix.lower() == ".gz" else open
+    with opener(path, 'rt') as stream:
+        for line in stream:
+            if line.strip() and not line.startswith(("#", "track", "browser")):
+                return len(line.rstrip("\n").split("\t"))
+    return 0
+
+
+def _headers(path: Path) -> list[int]:
+    # Line numbers of comments & headers (#, track & browser lines). They are allowed anywhere in the file, while
+    # '#' inside a line (e.g. in a name or an attribute) is data. Lines are split across blocks only at newlines.
+    opener = gzip.open if path.suffix.lower() == ".gz" else open
+    headers, line, tail = [], 0, b""
+    with opener(path, 'rb') as stream:
+        while block := stream.read(BLOCKSIZE):
+            block = tail + block
+            cut = block.rfind(b"\n") + 1
+            # Blocks start at a line start: a leading newline lets headers be found by their preceding newline
+            block, tail = b"\n" + block[:cut], block[cut:]
+            pos, before = 0, 0
+            for match in HEADER.finditer(block):
+                before += block.count(b"\n", pos, match.start())
+                pos = match.start()
+                headers.append(line + before)
+            line += block.count(b"\n") - 1
+    if HEADER.match(b"\n" + tail):
+        headers.append(line)
+    return headers
+
+
+@dataclass(frozen=True, slots=True)
+class Chunk:
+    # Coordinates are 0-based half-open
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+    # Categorical codes & their categories
+    contig: npt.NDArray[np.int32]
+    contigs: list[str]
+    strand: npt.NDArray[np.int32]
+    strands: list[str]
+    annotation: npt.NDArray[np.int32]
+    annotations: list[Any]
+
+    def __len__(self) -> int:
+        return self.starts.size
+
+
+def _categorical(values) -> tuple[npt.NDArray[np.int32], list[Any]]:
+    # Missing values (e.g. absent attributes) are mapped to None
+    values = values.astype("category").cat
+    categories, codes = values.categories.tolist(), values.codes.to_numpy()
+    if np.any(codes < 0):
+        codes = np.where(codes < 0, len(categories), codes)
+        categories.append(None)
+    return codes.astype(np.int32), categories
+
+
+def chunks(path: Path, annotation: str = "name", fmt: Optional[Format] = None,
+           chunksize: int = CHUNKSIZE) -> Iterator[Chunk]:
+    """
+    Parse the file in chunks of `chunksize` records. `annotation` is a column name (see COLUMNS) or, for GTF & GFF3,
+    an attribute key (e.g. gene_id or Name). Records without a strand column get ".".
+    """
+    import pandas as pd
+
+    fmt = fmt if fmt is not None else detect(path)
+    ncolumns = _ncolumns(path)
+    if ncolumns == 0:
+        return
+    names = COLUMNS[fmt][:ncolumns] if fmt == "bed" else COLUMNS[fmt]
+    # Extra BED columns (e.g. narrowPeak) are ignored
+    names += [f"extra{ind}" for ind in range(ncolumns - len(names))]
+    assert ncolumns >= 3 and len(names) == ncolumns, \
+        f"Unexpected number of columns ({ncolumns}) in {path}"
+
+    attribute, column = None, None
+    if annotation in names:
+        column = annotation
+    elif fmt == "bed":
+        # Missing optional columns are treated as missing annotations
+        assert annotation in COLUMNS["bed"], f"Unknown BED column: {annotation}"
+    else:
+        attribute = re.compile(ATTRIBUTE[fmt].format(key=re.escape(annotation)))
+        column = "attributes"
+
+    usecols = list(dict.fromkeys(["contig", "start", "end"] + [x for x in ("strand", column) if x in names]))
+    dtype = {x: str if x == "attributes" else "category" for x in usecols}
+    dtype.update(start=np.int64, end=np.int64)
+    reader = pd.read_csv(
+        path, sep="\t", header=None, names=names, usecols=usecols, dtype=dtype, na_filter=False,
+        skiprows=_headers(path), chunksize=chunksize, compression="infer"
+    )
+    for df in reader:
+        starts, ends = df["start"].to_numpy(), df["end"].to_numpy()
+        if fmt != "bed":
+            # GTF & GFF3 are 1-based & end-inclusive
+            starts = starts - 1
+
+        contig, contigs = _categorical(df["contig"])
+        if "strand" in df:
+            strand, strands = _categorical(df["strand"])
+        else:
+            strand, strands = np.zeros(len(df), dtype=np.int32), ["."]
+        if column is None:
+            anno, annotations = np.zeros(len(df), dtype=np.int32), [None]
+        elif attribute is None:
+            anno, annotations = _categorical(df[column])
+        else:
+            anno, annotations = _categorical(df[column].str.extract(attribute, expand=False))
+        yield Chunk(starts, ends, contig, [str(x) for x in contigs], strand, [str(x) for x in strands], anno,
+                    annotations)
+
+
+def load(path: Path, annotation: str = "name", fmt: Optional[Format] = None, chunksize: int = CHUNKSIZE) -> Index:
+    """
+    Build an Index from a BED, GTF or GFF3 file, see `chunks` for details.
+    """
+    codes: dict[Any, int] = {}
+    grouped: dict[tuple[str, str], tuple[list, list, list]] = {}
+    for chunk in chunks(path, annotation, fmt, chunksize):
+        # Chunk categories => global annotation codes
+        remap = np.asarray([codes.setdefault(x, len(codes)) for x in chunk.annotations], dtype=np.int32)
+        anno = remap[chunk.annotation]
+
+        # Group records by (contig, strand)
+        nstrands = len(chunk.strands)
+        key = chunk.contig.astype(np.int64) * nstrands + chunk.strand
+        order = np.argsort(key, kind='stable')
+        bounds = np.flatnonzero(np.diff(key[order], prepend=-1, append=-1))
+        for st, en in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            ind = order[st: en]
+            contig, strand = divmod(int(key[ind[0]]), nstrands)
+            group = grouped.setdefault((chunk.contigs[contig], chunk.strands[strand]), ([], [], []))
+            group[0].append(chunk.starts[ind])
+            group[1].append(chunk.ends[ind])
+            group[2].append(anno[ind])
+
+    intervals = {
+        key: Intervals.build(np.concatenate(starts), np.concatenate(ends), np.concatenate(anno))
+        for key, (starts, ends, anno) in grouped.items()
+    }
+    return Index(intervals, list(codes))
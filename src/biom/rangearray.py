@@ -0,0 +1,156 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from .range import Range
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class RangeArray:
+    """
+    Columnar collection of half-open ranges [starts[i], ends[i]). Element-wise operations (shift, lengths, overlap,
+    contains) keep the order of ranges; set operations (union, intersect, subtract, merge_within, complement) treat
+    ranges as sets of positions and return sorted, disjoint & non-adjacent ranges.
+
+    Unlike Range, len() is the number of ranges, see `lengths` for their sizes.
+    """
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+
+    def __post_init__(self):
+        assert self.starts.shape == self.ends.shape and self.starts.ndim == 1
+
+    @staticmethod
+    def build(starts: npt.ArrayLike, ends: npt.ArrayLike) -> 'RangeArray':
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        assert np.all(ends >= starts)
+        return RangeArray(starts, ends)
+
+    @staticmethod
+    def empty() -> 'RangeArray':
+        return RangeArray(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    @staticmethod
+    def from_ranges(ranges: Iterable[Range]) -> 'RangeArray':
+        ranges = list(ranges)
+        starts = np.fromiter((x.start for x in ranges), dtype=np.int64, count=len(ranges))
+        ends = np.fromiter((x.end for x in ranges), dtype=np.int64, count=len(ranges))
+        return RangeArray.build(starts, ends)
+
+    def __len__(self) -> int:
+        return self.starts.size
+
+    def __iter__(self) -> Iterator[Range]:
+        return (Range(s, e) for s, e in zip(self.starts.tolist(), self.ends.tolist()))
+
+    def __getitem__(self, item) -> Union[Range, 'RangeArray']:
+        if isinstance(item, (int, np.integer)):
+            return Range(int(self.starts[item]), int(self.ends[item]))
+        return RangeArray(self.starts[item], self.ends[item])
+
+    def __eq__(self, other):
+        return isinstance(other, RangeArray) and np.array_equal(self.starts, other.starts) and \
+            np.array_equal(self.ends, other.ends)
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return self.shift(other)
+
+    def __sub__(self, other):
+        return self.shift(-np.asarray(other, dtype=np.int64))
+
+    def __repr__(self) -> str:
+        return f"RangeArray({list(zip(self.starts.tolist(), self.ends.tolist()))})"
+
+    def shift(self, offset: npt.ArrayLike) -> 'RangeArray':
+        # A single offset or one per range
+        offset = np.asarray(offset, dtype=np.int64)
+        return RangeArray(self.starts + offset, self.ends + offset)
+
+    def lengths(self) -> npt.NDArray[np.int64]:
+        return self.ends - self.starts
+
+    def overlap(self, other: Union[Range, 'RangeArray']) -> npt.NDArray[np.int64]:
+        """
+        Element-wise overlap with a Range or an equally sized RangeArray, 0 where ranges don't overlap.
+        """
+        starts, ends = _columns(other)
+        return np.maximum(np.minimum(self.ends, ends) - np.maximum(self.starts, starts), 0)
+
+    def contains(self, other: Union[Range, 'RangeArray']) -> npt.NDArray[np.bool_]:
+        """
+        Element-wise Range.contains with a Range or an equally sized RangeArray.
+        """
+        starts, ends = _columns(other)
+        return (self.starts <= starts) & (starts < ends) & (ends <= self.ends)
+
+    def merge_within(self, gap: int = 0) -> 'RangeArray':
+        """
+        Sorted union of ranges, where ranges separated by at most `gap` bp are merged. Empty ranges are dropped.
+        """
+        assert gap >= 0
+        nonempty = self.ends > self.starts
+        starts, ends = self.starts[nonempty], self.ends[nonempty]
+        if starts.size == 0:
+            return RangeArray.empty()
+
+        order = np.argsort(starts, kind='stable')
+        starts, ends = starts[order], np.maximum.accumulate(ends[order])
+        # A new group starts where the range doesn't reach any of the previous ones
+        first = np.ones(starts.size, dtype=bool)
+        first[1:] = starts[1:] > ends[:-1] + gap
+        last = np.append(first[1:], True)
+        return RangeArray(starts[first], ends[last])
+
+    def union(self, other: 'RangeArray') -> 'RangeArray':
+        return RangeArray(
+            np.concatenate([self.starts, other.starts]), np.concatenate([self.ends, other.ends])
+        ).merge_within(0)
+
+    def intersect(self, other: 'RangeArray') -> 'RangeArray':
+        return _combine(self, other, np.logical_and)
+
+    def subtract(self, other: 'RangeArray') -> 'RangeArray':
+        return _combine(self, other, lambda x, y: x & ~y)
+
+    def complement(self, contiglen: int) -> 'RangeArray':
+        """
+        Gaps between ranges within [0, contiglen).
+        """
+        merged = self.merge_within(0)
+        starts = np.clip(np.concatenate([[0], merged.ends]), 0, contiglen)
+        ends = np.clip(np.concatenate([merged.starts, [contiglen]]), 0, contiglen)
+        nonempty = ends > starts
+        return RangeArray(starts[nonempty], ends[nonempty])
+
+
+def _columns(other: Union[Range, RangeArray]) -> tuple[Union[int, npt.NDArray[np.int64]], ...]:
+    match other:
+        case Range():
+            return other.start, other.end
+        case RangeArray():
+            return other.starts, other.ends
+        case _:
+            raise TypeError()
+
+
+def _combine(left: RangeArray, right: RangeArray, op) -> RangeArray:
+    # Boolean operation over elementary segments between boundaries of both sets
+    left, right = left.merge_within(0), right.merge_within(0)
+    bounds = np.unique(np.concatenate([left.starts, left.ends, right.starts, right.ends]))
+    if bounds.size < 2:
+        return RangeArray.empty()
+    segstarts, segends = bounds[:-1], bounds[1:]
+
+    keep = op(_covered(left, segstarts), _covered(right, segstarts))
+    return RangeArray(segstarts[keep], segends[keep]).merge_within(0)
+
+
+def _covered(ranges: RangeArray, positions: npt.NDArray[np.int64]) -> npt.NDArray[np.bool_]:
+    # Whether positions are covered by sorted disjoint ranges
+    ind = np.searchsorted(ranges.starts, positions, side='right') - 1
+    return (ind >= 0) & (ranges.ends[np.maximum(ind, 0)] > positions) if ranges.starts.size else \
+        np.zeros(positions.size, dtype=bool)
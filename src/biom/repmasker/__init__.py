@@ -1,6 +1,24 @@
 from pathlib import Path
 
-from .repmasker import RepmaskerClassification
+from .._lazy import attach
 
-GRCh38 = RepmaskerClassification(Path(__file__).parent.joinpath("GRCh38.tsv.gz"))
-GRCm39 = RepmaskerClassification(Path(__file__).parent.joinpath("GRCm39.tsv.gz"))
+_ASSEMBLIES = {
+    "GRCh38": Path(__file__).parent.joinpath("GRCh38.tsv.gz"),
+    "GRCm39": Path(__file__).parent.joinpath("GRCm39.tsv.gz"),
+}
+
+_getattr, __dir__, __all__ = attach(
+    __name__, submodules=["repmasker"], attributes={"Categories": ".repmasker", "RepmaskerClassification": ".repmasker"}
+)
+__all__ = sorted(__all__ + list(_ASSEMBLIES))
+
+
+def __getattr__(name: str):
+    # Bundled classifications are created on first access and parsed (or loaded from the cache) on first use
+    if name not in _ASSEMBLIES:
+        return _getattr(name)
+    from .repmasker import RepmaskerClassification
+
+    classification = RepmaskerClassification(_ASSEMBLIES[name])
+    globals()[name] = classification
+    return classification
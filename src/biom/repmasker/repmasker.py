@@ -1,30 +1,145 @@
 import gzip
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
-from typing import Optional, Set, Tuple
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from biom.paths import CACHE
+
+# Bump to invalidate existing caches when the layout changes
+CACHE_SCHEMA = 1
+
+
+@dataclass(frozen=True)
+class Categories:
+    # Sorted repeat names, i-th name is classified as (families[family[i]], classes[cls[i]])
+    names: npt.NDArray[np.str_]
+    family: npt.NDArray[np.int32]
+    cls: npt.NDArray[np.int32]
+    families: npt.NDArray[np.str_]
+    classes: npt.NDArray[np.str_]
+
+
+def _parse(path: Path) -> Dict[str, Tuple[str, str, str]]:
+    mapping = {}
+    with gzip.open(path, 'rt') as stream:
+        for line in stream:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            name, cls, family = line.split()
+            assert name not in mapping, name
+            mapping[name] = (name, family, cls)
+    return mapping
+
+
+def _categorize(mapping: Dict[str, Tuple[str, str, str]]) -> Categories:
+    names = np.asarray(sorted(mapping), dtype=np.str_)
+    families, family = np.unique([mapping[x][1] for x in names.tolist()], return_inverse=True)
+    classes, cls = np.unique([mapping[x][2] for x in names.tolist()], return_inverse=True)
+    return Categories(names, family.astype(np.int32), cls.astype(np.int32), families, classes)
 
 
 class RepmaskerClassification:
-    def __init__(self, path: Path):
+    """
+    RepeatMasker classification (name -> family & class) loaded on first use.
+
+    The parsed classification is pickled under `cache` (biom.paths.CACHE by default) and reused by later
+    processes until the source file changes.
+    """
+
+    def __init__(self, path: Path, cache: Optional[Path] = None):
         self.path = path
-        self._mapping = {}
+        self._cache = CACHE / "repmasker" if cache is None else cache
 
-        with gzip.open(path, 'rt') as stream:
-            for line in stream:
-                line = line.strip()
-                if len(line) == 0:
-                    continue
-                name, cls, family = line.split()
-                assert name not in self._mapping, name
-                self._mapping[name] = (name, family, cls)
+    def _cachefile(self) -> Path:
+        stat = self.path.stat()
+        return self._cache / f"{self.path.name}.{stat.st_size}-{stat.st_mtime_ns}.v{CACHE_SCHEMA}.pkl"
+
+    @cached_property
+    def _loaded(self) -> Tuple[Dict[str, Tuple[str, str, str]], Categories]:
+        cachefile = self._cachefile()
+        if cachefile.exists():
+            try:
+                with open(cachefile, 'rb') as stream:
+                    return pickle.load(stream)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+
+        mapping = _parse(self.path)
+        loaded = (mapping, _categorize(mapping))
+        # The cache is optional, e.g. home folder might be read-only
+        try:
+            cachefile.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=cachefile.parent, delete=False) as stream:
+                pickle.dump(loaded, stream, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(stream.name, cachefile)
+        except OSError:
+            pass
+        return loaded
+
+    @property
+    def categories(self) -> Categories:
+        return self._loaded[1]
 
     def classify(self, repname: str) -> Optional[Tuple[str, str, str]]:
-        return self._mapping.get(repname, None)
+        return self._loaded[0].get(repname, None)
+
+    @cached_property
+    def _codes(self) -> Dict[str, int]:
+        return {name: code for code, name in enumerate(self.categories.names.tolist())}
+
+    def encode(self, repnames: Iterable[str]) -> npt.NDArray[np.int32]:
+        """
+        Codes of repeat names in `categories.names` (-1 for unknown repeats).
+        Categorical inputs (e.g. pandas.Categorical) are encoded via their categories only.
+        """
+        if hasattr(repnames, "categories") and hasattr(repnames, "codes"):
+            # Missing values (code -1) pick the appended -1, the lookup itself is empty if all values are missing
+            lookup = np.append(self.encode(repnames.categories), np.int32(-1))
+            return lookup[np.asarray(repnames.codes)].astype(np.int32)
+
+        if isinstance(repnames, np.ndarray):
+            # Python strings are much faster to hash than numpy scalars
+            repnames = repnames.tolist()
+        codes = self._codes
+        return np.fromiter((codes.get(x, -1) for x in repnames), dtype=np.int32)
+
+    def classify_many(self, repnames: Iterable[str]) \
+            -> Tuple[npt.NDArray[np.int32], npt.NDArray[np.int32], npt.NDArray[np.int32]]:
+        """
+        Vectorized classification: returns codes of names, families and classes in the `categories` arrays.
+        Unknown repeats are encoded as -1.
+        """
+        cats = self.categories
+        names = self.encode(repnames)
+        family = np.where(names >= 0, cats.family[names], -1).astype(np.int32)
+        cls = np.where(names >= 0, cats.cls[names], -1).astype(np.int32)
+        return names, family, cls
+
+    @cached_property
+    def _names(self) -> FrozenSet[str]:
+        return frozenset(x[0] for x in self._loaded[0].values())
+
+    @cached_property
+    def _families(self) -> FrozenSet[str]:
+        return frozenset(x[1] for x in self._loaded[0].values())
+
+    @cached_property
+    def _classes(self) -> FrozenSet[str]:
+        return frozenset(x[2] for x in self._loaded[0].values())
 
-    def names(self) -> Set[str]:
-        return set(x[0] for x in self._mapping.values())
+    def names(self) -> FrozenSet[str]:
+        return self._names
 
-    def families(self) -> Set[str]:
-        return set(x[1] for x in self._mapping.values())
+    def families(self) -> FrozenSet[str]:
+        return self._families
 
-    def classes(self) -> Set[str]:
-        return set(x[2] for x in self._mapping.values())
+    def classes(self) -> FrozenSet[str]:
+        return self._classes
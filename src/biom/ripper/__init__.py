@@ -1,2 +1,8 @@
-from .core.config import PeakCallingConfig
-from .run import run
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["core"],
+    attributes={
+        "batch": ".batch", "fromtracks": ".run", "PeakCallingConfig": ".core.config", "run": ".run"
+    }
+)
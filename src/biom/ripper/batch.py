@@ -0,0 +1,90 @@
+import copy
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .core import pipeline
+from .core.config import PeakCallingConfig
+from .core.pipeline import postprocess
+from .core.profile import Profiler
+from .core.scheduler import Scheduler, parallel
+from .core.store import TrackStore
+from .core.utils import Stranded
+from .run import process, report
+
+CONTROL = pipeline.pipeline.CONTROL
+
+
+def _control_key(config: PeakCallingConfig) -> Tuple:
+    # Everything that affects raw control pileups
+    contigs = tuple(sorted(pipeline.pipeline.contigs(config)))
+    params = config.process
+    return (
+        tuple(sorted(x.as_posix() for x in config.control)),
+        tuple((contig, tuple(params.extsize[contig])) for contig in contigs),
+        params.stranding, params.inflags, params.exflags, params.minmapq, params.packing,
+        config.regions.as_posix() if config.regions is not None else None, config.padding
+    )
+
+
+def _share(results: List[postprocess.Result], store: TrackStore, prefix: str) -> List[postprocess.Result]:
+    # Dump pileups on disk and replace them with memory-mapped copies
+    shared = []
+    for r in results:
+        pileups = {}
+        for strand, p in ("+", r.pileup.fwd), ("-", r.pileup.rev):
+            key = f"{prefix}/{r.contig}/{strand}"
+            store.save(key, p)
+            pileups[strand] = store.load(key, p.id)
+        shared.append(postprocess.Result(
+            contig=r.contig, contiglen=r.contiglen, pileup=Stranded(fwd=pileups["+"], rev=pileups["-"]), tags=r.tags
+        ))
+    return shared
+
+
+def batch(configs: List[PeakCallingConfig]):
+    """
+    Call peaks for many treatment sets that share control libraries.
+
+    Control pileups are computed once per unique combination of control files, extension sizes and read filters
+    and postprocessed once per unique genome size & control scaling. Postprocessed controls are stored as
+    memory-mapped arrays and reused (without copying) by all samples and workers.
+    Processing parameters (threads, backend, memory budget) and profiling options are taken from the first config.
+    Streaming (config.process.streaming) is not supported.
+    """
+    assert configs, "Nothing to process"
+    # Shared controls are kept in memory-mapped stores, while streaming runs spill & reload every contig
+    assert not any(x.process.streaming for x in configs), \
+        "Streaming is not supported by batch runs, use ripper.run for each config instead"
+    params = configs[0].process
+    profiler = Profiler(configs[0].saveto.title) if configs[0].saveto.profile is not None else None
+
+    groups: Dict[Tuple, List[PeakCallingConfig]] = {}
+    for config in configs:
+        groups.setdefault(_control_key(config), []).append(config)
+    logging.info(f"{len(configs)} treatment sets share {len(groups)} unique control pileups")
+
+    with parallel(params) as workers, Scheduler(workers, params, profiler) as pool, \
+            tempfile.TemporaryDirectory(prefix="ripper-batch-") as tmpdir:
+        store = TrackStore(Path(tmpdir))
+        try:
+            for groupind, (key, group) in enumerate(groups.items()):
+                # Windows depend on the target regions and contigs, which are a part of the control key
+                windows = pipeline.regions.windows(group[0])
+                raw = pipeline.pipeline.pileups(group[0], pool, windows, (CONTROL,))
+
+                # Postprocessing depends on the effective genome size and control scaling only
+                controls: Dict[Tuple, List[postprocess.Result]] = {}
+                for config in group:
+                    ppkey = (config.geffsize, config.process.scaling.control)
+                    if ppkey not in controls:
+                        # Postprocessing might modify pileups inplace (e.g. with a threading backend)
+                        normalized = pipeline.pipeline.normalize(config, pool, windows, copy.deepcopy(raw))
+                        controls[ppkey] = _share(normalized, store, f"{groupind}/{len(controls)}")
+
+                    pileups = pipeline.run(config, pool, windows, controls=controls[ppkey])
+                    process(config, pool, windows, pileups)
+                del raw, controls
+        finally:
+            report(configs[0], pool)
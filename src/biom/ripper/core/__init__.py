@@ -1 +1,6 @@
-from . import fragments, functors, io, pileup, pipeline, scaling
+from ..._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(__name__, submodules=[
+    "bins", "chunks", "config", "fragments", "functors", "io", "kernels", "pileup", "pipeline", "profile", "scaling",
+    "scheduler", "store", "utils"
+])
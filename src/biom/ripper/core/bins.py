@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import numpy.typing as npt
+from joblib import Parallel, delayed
+from pysam import AlignmentFile
+
+from . import fragments
+
+
+@dataclass(frozen=True)
+class Bins:
+    # Number of fragments in each bin (rows) for each library (columns)
+    matrix: npt.NDArray[np.int64]
+    # Library labels, one per column
+    labels: npt.NDArray[np.str_]
+    # Genomic position of each bin
+    contig: npt.NDArray[np.str_]
+    start: npt.NDArray[np.int64]
+    binsize: int
+
+    def save(self, saveto: Path):
+        # The same layout as expected by scaling.median_of_ratios
+        np.savez_compressed(
+            saveto, matrix=self.matrix, labels=self.labels, contig=self.contig, start=self.start,
+            binsize=np.int64(self.binsize)
+        )
+
+
+@dataclass(frozen=True)
+class Workload:
+    bamfile: Path
+    contig: str
+    contiglen: int
+    binsize: int
+
+    stranding: str
+    inflags: int
+    exflags: int
+    minmapq: int
+
+
+def _count(w: Workload) -> npt.NDArray[np.int64]:
+    nbins = (w.contiglen + w.binsize - 1) // w.binsize
+    with AlignmentFile(w.bamfile, 'rb') as bam:
+        if w.contig not in bam.references:
+            return np.zeros(nbins, dtype=np.int64)
+
+    blocks, _ = fragments.loadfrom(
+        [w.bamfile], fragments.strdeductors.get(w.stranding), w.contig, w.inflags, w.exflags, w.minmapq
+    )
+
+    counts = np.zeros(nbins, dtype=np.int64)
+    for b in blocks.fwd + blocks.rev:
+        # Each fragment is assigned to the bin containing its center. Blocks are ordered by start, the fragment
+        # end is the largest block end rather than the end of the last block.
+        start = b.start[b.records[:-1]]
+        end = np.maximum.reduceat(b.end, b.records[:-1]) if b.records.size > 1 else start
+        centers = (start.astype(np.int64) + end) // 2
+        counts += np.bincount(centers // w.binsize, minlength=nbins)[:nbins]
+    return counts
+
+
+def count(bamfiles: List[Path], binsize: int, stranding: str, inflags: int, exflags: int, minmapq: int,
+          labels: Optional[List[str]] = None, contigs: Optional[List[str]] = None, threads: int = 1,
+          backend: str = "loky") -> Bins:
+    """
+    Count paired-end fragments in fixed-size genomic bins for each BAM file.
+    Each fragment is counted once (regardless of the strand) in the bin containing its center.
+    """
+    assert bamfiles and binsize > 0
+    labels = labels if labels is not None else [x.name for x in bamfiles]
+    assert len(labels) == len(bamfiles) and len(set(labels)) == len(labels), "Labels must be unique"
+
+    # Contig lengths must be consistent across BAM files
+    contiglens = {}
+    for file in bamfiles:
+        with AlignmentFile(file, 'rb') as bam:
+            for contig, length in zip(bam.references, bam.lengths):
+                assert contiglens.setdefault(contig, length) == length, \
+                    f"Contradictory contig length for '{contig}': {contiglens[contig]} vs {length}"
+    contigs = sorted(contiglens if contigs is None else contigs)
+
+    workloads = [
+        Workload(file, contig, contiglens[contig], binsize, stranding, inflags, exflags, minmapq)
+        for file in bamfiles for contig in contigs
+    ]
+    counts = Parallel(n_jobs=threads, backend=backend)(delayed(_count)(w) for w in workloads)
+
+    columns = []
+    for ind in range(len(bamfiles)):
+        columns.append(np.concatenate(counts[ind * len(contigs): (ind + 1) * len(contigs)]))
+    matrix = np.stack(columns, axis=1)
+
+    nbins = [(contiglens[x] + binsize - 1) // binsize for x in contigs]
+    return Bins(
+        matrix=matrix,
+        labels=np.asarray(labels, dtype=np.str_),
+        contig=np.repeat(np.asarray(contigs, dtype=np.str_), nbins),
+        start=np.concatenate([np.arange(n, dtype=np.int64) * binsize for n in nbins]),
+        binsize=binsize
+    )
@@ -0,0 +1,197 @@
+"""
+Intra-contig parallelism for interval kernels.
+
+The genomic coordinate space of a contig is split at breakpoints of a reference track (so that no artificial
+breakpoints are introduced), each track is sliced with np.searchsorted and chunks are processed by nogil kernels
+in a thread pool. Results are concatenated back, optionally merging equal values across chunk boundaries.
+"""
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+T = TypeVar('T')
+R = TypeVar('R')
+W = TypeVar('W')
+
+# Tracks with fewer intervals per chunk are not worth splitting
+MIN_INTERVALS = 1 << 16
+
+_THREADS: ContextVar[int] = ContextVar("chunks", default=1)
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_THREADS = 0
+_LOCK = threading.Lock()
+
+
+@contextmanager
+def parallel(threads: int):
+    """
+    Allow kernels called within the context (in the current thread) to process chunks in `threads` threads.
+    """
+    token = _THREADS.set(max(1, threads))
+    try:
+        yield
+    finally:
+        _THREADS.reset(token)
+
+
+def scoped(fn: Callable[[W], R], threads: int, workload: W) -> R:
+    # Picklable wrapper to enable chunking inside joblib workers
+    with parallel(threads):
+        return fn(workload)
+
+
+def _executor(threads: int) -> ThreadPoolExecutor:
+    # The pool only grows: a larger one replaces it, while already submitted chunks finish in the old one.
+    # Must be called under _LOCK.
+    global _EXECUTOR, _EXECUTOR_THREADS
+    if _EXECUTOR is None or _EXECUTOR_THREADS < threads:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ripper-chunks")
+        _EXECUTOR_THREADS = threads
+    return _EXECUTOR
+
+
+def map(fn: Callable[[T], R], items: Sequence[T]) -> List[R]:
+    if len(items) <= 1 or _THREADS.get() <= 1:
+        return [fn(x) for x in items]
+    # Submit under the lock, so that the pool can't be shut down by a concurrent resize in between
+    with _LOCK:
+        executor = _executor(_THREADS.get())
+        futures = [executor.submit(fn, x) for x in items]
+    return [x.result() for x in futures]
+
+
+def positions(reference: npt.NDArray[np.int32]) -> npt.NDArray[np.int32]:
+    """
+    Split positions (inner chunk boundaries) chosen among the reference track breakpoints.
+    """
+    nchunks = min(_THREADS.get(), reference.size // MIN_INTERVALS)
+    if nchunks <= 1:
+        return np.empty(0, dtype=np.int32)
+    # Balance chunks by the number of intervals, the last end is the end of the contig
+    return reference[(np.arange(1, nchunks) * reference.size) // nchunks - 1]
+
+
+def slices(ends: npt.NDArray[np.int32], positions: npt.NDArray[np.int32]) -> List[slice]:
+    """
+    Intervals of the track overlapping each chunk, the k-th chunk covers positions (p[k - 1], p[k]].
+    """
+    starts = np.searchsorted(ends, positions, side='right')
+    stops = np.searchsorted(ends, positions, side='left') + 1
+    starts, stops = np.concatenate([[0], starts]), np.concatenate([stops, [ends.size]])
+    return [slice(start, stop) for start, stop in zip(starts.tolist(), stops.tolist())]
+
+
+def clip(ends: npt.NDArray[np.int32], chunk: slice, end: np.int32) -> npt.NDArray[np.int32]:
+    # The last interval overlapping the chunk is clipped to the chunk end
+    ends = ends[chunk].copy()
+    ends[-1] = end
+    return ends
+
+
+@dataclass(frozen=True)
+class Pair:
+    # Chunk [start, end) of two tracks (e.g. control & treatment), ends are clipped to the chunk end
+    start: np.int32
+    end: np.int32
+    cntends: npt.NDArray[np.int32]
+    cntvalues: npt.NDArray[np.float32]
+    trtends: npt.NDArray[np.int32]
+    trtvalues: npt.NDArray[np.float32]
+
+
+def pairs(cntends: npt.NDArray[np.int32], cntvalues: npt.NDArray[np.float32],
+          trtends: npt.NDArray[np.int32], trtvalues: npt.NDArray[np.float32]) -> List[Pair]:
+    assert cntends[-1] == trtends[-1]
+    splits = positions(cntends if cntends.size >= trtends.size else trtends)
+    if splits.size == 0:
+        return [Pair(np.int32(0), cntends[-1], cntends, cntvalues, trtends, trtvalues)]
+
+    bounds = np.concatenate([[0], splits, [cntends[-1]]]).astype(np.int32)
+    result = []
+    for ind, (cnt, trt) in enumerate(zip(slices(cntends, splits), slices(trtends, splits))):
+        start, end = bounds[ind], bounds[ind + 1]
+        result.append(Pair(
+            start, end, clip(cntends, cnt, end), cntvalues[cnt], clip(trtends, trt, end), trtvalues[trt]
+        ))
+    return result
+
+
+def concatenate(bounds: List[npt.NDArray[np.int32]], values: List[npt.NDArray[T]]) \
+        -> Tuple[npt.NDArray[np.int32], npt.NDArray[T]]:
+    """
+    Join per-chunk tracks, where i-th interval = [bounds[i], bounds[i + 1]).
+    """
+    if len(bounds) == 1:
+        return bounds[0], values[0]
+    return np.concatenate([bounds[0]] + [x[1:] for x in bounds[1:]]), np.concatenate(values)
+
+
+def join(ends: List[npt.NDArray[np.int32]], values: List[npt.NDArray[T]]) \
+        -> Tuple[npt.NDArray[np.int32], npt.NDArray[T]]:
+    """
+    Join per-chunk pileups (interval ends & values), merging equal values across chunk boundaries.
+    """
+    if len(ends) == 1:
+        return ends[0], values[0]
+    seams = np.cumsum([x.size for x in ends[:-1]]) - 1
+    ends, values = np.concatenate(ends), np.concatenate(values)
+    seams = seams[values[seams] == values[seams + 1]]
+    return np.delete(ends, seams), np.delete(values, seams)
+
+
+class ChunksUnitTests(unittest.TestCase):
+    def _track(self, rng: np.random.Generator, contiglen: int, size: int):
+        ends = np.unique(rng.integers(1, contiglen, size=size)).astype(np.int32)
+        ends = np.append(ends, np.int32(contiglen))
+        values = rng.choice(np.asarray([0.5, 1, 2, 7], dtype=np.float32), size=ends.size)
+        return ends, values
+
+    def test_equivalence(self):
+        global MIN_INTERVALS
+        from .functors import foldenrichment, pvalues
+        from .pileup import Pileup, merge
+        from .pipeline import pipeline
+
+        rng = np.random.default_rng(7)
+        default, MIN_INTERVALS = MIN_INTERVALS, 16
+        try:
+            for _ in range(20):
+                contiglen = int(rng.integers(100, 5_000))
+                tracks = [self._track(rng, contiglen, int(rng.integers(1, 500))) for _ in range(3)]
+                pileups = [Pileup("1", *x) for x in tracks]
+                workload = pipeline.Results("1", np.int32(contiglen), "+", pileups[0], pileups[1])
+
+                expected = (foldenrichment.calculate(workload).track, pvalues.calculate(workload),
+                            merge.by_max([Pileup("1", *x) for x in tracks], np.float32(0.5)))
+                with parallel(4):
+                    self.assertGreater(len(positions(max((x[0] for x in tracks), key=len))), 0)
+                    chunked = (foldenrichment.calculate(workload).track, pvalues.calculate(workload),
+                               merge.by_max([Pileup("1", *x) for x in tracks], np.float32(0.5)))
+
+                for e, c in (expected[0], chunked[0]), (expected[1][0].track, chunked[1][0].track):
+                    self.assertTrue(np.array_equal(e.bounds, c.bounds) and np.array_equal(e.values, c.values))
+                self.assertEqual(expected[1][1], chunked[1][1])
+                self.assertTrue(np.array_equal(expected[2].interend, chunked[2].interend))
+                self.assertTrue(np.array_equal(expected[2].values, chunked[2].values))
+        finally:
+            MIN_INTERVALS = default
+
+    def test_executor_resize(self):
+        with parallel(2):
+            self.assertEqual(map(lambda x: x + 1, [1, 2, 3]), [2, 3, 4])
+        with _LOCK:
+            small = _executor(2)
+        with parallel(_EXECUTOR_THREADS + 1):
+            self.assertEqual(map(lambda x: x + 1, [1, 2, 3]), [2, 3, 4])
+        # The replaced pool is shut down instead of leaking its threads
+        self.assertIsNot(small, _EXECUTOR)
+        self.assertRaises(RuntimeError, small.submit, abs, 1)
@@ -21,6 +21,8 @@ class PeakCallingConfig:
         pvtrack: Optional[Path]
         pvpeaks: Optional[Path]
         fdrpeaks: Optional[Path]
+        # Opt-in per-stage profiling report (<title>.profile.json & <title>.profile.txt)
+        profile: Optional[Path] = None
 
     @dataclass(frozen=True)
     class ProcessingParams:
@@ -32,11 +34,24 @@ class PeakCallingConfig:
         extsize: Dict[str, List[int]]
         # Number of reads to parallelize the pileup computation
         threads: int
+        # Joblib backend or "auto": BAM decoding in worker processes, numeric stages in a thread pool
         backend: str
         # Bam flags
         inflags: int
         exflags: int
         minmapq: int
+        # Upper bound (in bytes) on the summed estimated memory footprint of concurrently running tasks.
+        # None = no limit, i.e. up to `threads` tasks are running at any time.
+        memory_budget: Optional[int] = None
+        # Two-phase streaming run: pileups & tracks are spilled to disk (spillto or a temporary folder) and the
+        # parent process holds at most one contig at a time
+        streaming: bool = False
+        spillto: Optional[Path] = None
+        # Split large contigs into up to `chunks` chunks processed by parallel threads within each task
+        chunks: int = 1
+        # Contigs shorter than `packing` bases are concatenated and processed as a single contig by each stage
+        # (see pipeline.packing). None = each contig is processed separately.
+        packing: Optional[int] = None
 
     @dataclass()
     class PeakCallingParams:
@@ -61,6 +76,10 @@ class PeakCallingConfig:
     process: ProcessingParams
     callp: PeakCallingParams
     saveto: Saveto
+    # Target regions (BED): only windows around them (padded by `padding` bases) are processed,
+    # see pipeline.regions
+    regions: Optional[Path] = None
+    padding: int = 1000
 
     def __post_init__(self):
         assert all(x.is_file() for x in self.treatment + self.control)
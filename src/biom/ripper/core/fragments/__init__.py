@@ -1,3 +1,6 @@
-from . import strdeductors
-from .seqblocks import AlignedBlocks, loadfrom
-from .BAMPEReader import BAMPEReader
+from ...._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["seqblocks", "strdeductors"],
+    attributes={"AlignedBlocks": ".seqblocks", "loadfrom": ".seqblocks", "BAMPEReader": ".BAMPEReader"}
+)
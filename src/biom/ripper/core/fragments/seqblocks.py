@@ -64,6 +64,22 @@ class AlignedBlocks:
     def fragments(self):
         return self.records.size
 
+    def clip(self, start: int, end: int) -> Optional['AlignedBlocks']:
+        """
+        Blocks clipped to the [start, end) window, in window coordinates. Fragments outside the window are dropped.
+        """
+        readind = np.repeat(np.arange(self.records.size - 1), np.diff(self.records))
+        blstart = np.clip(self.start - start, 0, end - start).astype(np.int32)
+        blend = np.clip(self.end - start, 0, end - start).astype(np.int32)
+        keep = blend > blstart
+        if not keep.any():
+            return None
+
+        counts = np.bincount(readind[keep], minlength=self.records.size - 1)
+        records = np.zeros(np.count_nonzero(counts) + 1, dtype=np.int32)
+        np.cumsum(counts[counts > 0], out=records[1:])
+        return AlignedBlocks(self.trstrand, blstart[keep], blend[keep], records)
+
 
 @dataclass()
 class AlignedBlocksBuilder:
@@ -148,8 +164,11 @@ def _oncontig(
 
 def loadfrom(
         files: List[Path], strdeductor: StrandDeductor, contig: str, inflags: int,
-        exflags: int, minmapq: int
+        exflags: int, minmapq: int, start: Optional[int] = None, end: Optional[int] = None
 ) -> Tuple[Stranded[List[AlignedBlocks]], int]:
+    """
+    Aligned blocks of fragments on the contig (or overlapping the [start, end) window) & the contig length.
+    """
     assert files
 
     forward, reverse = [], []
@@ -159,7 +178,7 @@ def loadfrom(
 
         if contig not in reader.sf.references:
             continue
-        reader.fetch(contig)
+        reader.fetch(contig, start, end)
 
         fwdblocks, revblocks = _oncontig(reader, strdeductor)
         if fwdblocks:
@@ -1,2 +1,6 @@
-from . import callpeaks, foldenrichment, pvalues, qvalues, result
-from .result import Result, Track
+from ...._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["callpeaks", "foldenrichment", "pvalues", "qvalues", "result"],
+    attributes={"Result": ".result", "Track": ".result"}
+)
@@ -5,6 +5,7 @@ from typing import List, Optional
 import numpy as np
 
 from .result import Peak, Result, Track
+from .. import scheduler
 from ..config import PeakCallingConfig
 
 PeakCallingParams = PeakCallingConfig.PeakCallingParams
@@ -29,6 +30,8 @@ class PeakCalingWorkload:
 
     params: PeakCallingParams
     ctx: Context
+    # Peaks never cross these positions (boundaries of packed contigs, see pipeline.packing)
+    stops: Optional[np.ndarray] = None
 
     @staticmethod
     def build(pv: List[Result],
@@ -56,39 +59,17 @@ class PeakCalingWorkload:
         return workloads
 
 
-@dataclass(frozen=True)
-class PeakPiece:
-    start: int
-    end: int
-    pvalue: float
-    qvalue: float
-    fe: float
-
-
-def _stitch(
-        pieces: List[PeakPiece], contig: str, strand: str, params: PeakCallingParams, ctx: Context
-) -> Optional[Peak]:
-    if not pieces:
-        return None
-
-    # Pieces must be ordered
-    assert all(x.end <= y.start for x, y in zip(pieces[:-1], pieces[1:]))
-
-    # Skip small peaks
-    if pieces[-1].end - pieces[0].start < params.minsize:
-        return None
+def _first(mask: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    # Index of the first True element within each group (each group must have at least one)
+    ind = np.flatnonzero(mask)
+    first = np.ones(ind.size, dtype=bool)
+    first[1:] = groups[ind[1:]] != groups[ind[:-1]]
+    return ind[first]
 
-    # Summit = position with a max fold enrichment
-    maxfe = max(pieces, key=lambda x: x.fe).fe
-    summits = [(x.start + x.end) // 2 for x in pieces if x.fe == maxfe]
 
-    # Get the piece with min p/q-value (=max log10 p/q-value)
-    x = max(pieces, key=lambda x: x.qvalue)
-    minqv, minpv = x.qvalue, x.pvalue
-    return Peak(
-        contig, pieces[0].start, pieces[-1].end, strand,
-        minpv, minqv, maxfe, summits
-    )
+def footprint(w: PeakCalingWorkload) -> int:
+    # Boolean masks + a copy of each track for the selected intervals
+    return w.ctx.pvalues.values.size * scheduler.BYTES_PER_INTERVAL
 
 
 def calculate(w: PeakCalingWorkload) -> List[Peak]:
@@ -109,21 +90,32 @@ def calculate(w: PeakCalingWorkload) -> List[Peak]:
     qv, pv, fe = w.ctx.qvalues.values[peakind], w.ctx.pvalues.values[peakind], w.ctx.foldenrichment.values[peakind]
     starts, ends = w.ctx.qvalues.bounds[peakind], w.ctx.qvalues.bounds[peakind + 1]
 
+    # Stitch pieces separated by at most maxgap bases into peaks
+    assert np.all(starts[1:] >= ends[:-1])
+    breaks = starts[1:] - ends[:-1] > w.params.maxgap
+    if w.stops is not None:
+        contig = np.searchsorted(w.stops, starts, side='right')
+        breaks |= contig[1:] != contig[:-1]
+    breaks = np.flatnonzero(breaks) + 1
+    first = np.concatenate([[0], breaks])
+    last = np.concatenate([breaks, [peakind.size]]) - 1
+    groups = np.repeat(np.arange(first.size), last - first + 1)
+
+    # Summit = position with a max fold enrichment
+    maxfe = np.maximum.reduceat(fe, first)
+    summits = np.flatnonzero(fe == maxfe[groups])
+    summits = np.split((starts[summits] + ends[summits]) // 2, np.searchsorted(summits, first[1:]))
+
+    # The piece with min p/q-value (=max log10 p/q-value)
+    maxqv = _first(qv == np.maximum.reduceat(qv, first)[groups], groups)
+
     result = []
-    buffer = [PeakPiece(starts[0], ends[0], pv[0], qv[0], fe[0])]
-    for ind in range(1, peakind.size):
-        piece = PeakPiece(starts[ind], ends[ind], pv[ind], qv[ind], fe[ind])
-        assert piece.start - buffer[-1].end >= 0
-
-        if piece.start - buffer[-1].end <= w.params.maxgap:
-            buffer.append(piece)
-        else:
-            peak = _stitch(buffer, w.contig, w.trstrand, w.params, w.ctx)
-            result.append(peak)
-            # Reset buffer
-            buffer = [piece]
-
-    if buffer:
-        result.append(_stitch(buffer, w.contig, w.trstrand, w.params, w.ctx))
-    result = [x for x in result if x is not None]
+    for ind in range(first.size):
+        start, end = starts[first[ind]], ends[last[ind]]
+        # Skip small peaks
+        if end - start < w.params.minsize:
+            continue
+        result.append(Peak(
+            w.contig, start, end, w.trstrand, pv[maxqv[ind]], qv[maxqv[ind]], maxfe[ind], list(summits[ind])
+        ))
     return result
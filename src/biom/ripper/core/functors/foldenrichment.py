@@ -1,12 +1,16 @@
-import numba
 import numpy as np
 import numpy.typing as npt
 
 from .result import Result, Track
+from .. import chunks
+from ..kernels import float32array, float32rarray, int32array, int32rarray, kernel, types
 from ..pipeline import pipeline
 
 
-@numba.jit(cache=True, nopython=True, nogil=True)
+@kernel(
+    "foldenrichment_job",
+    types.Tuple((int32array, float32array))(int32rarray, float32rarray, int32rarray, float32rarray)
+)
 def _job(cntends: npt.NDArray[np.int32], cntvalues: npt.NDArray[np.float32],
          trtends: npt.NDArray[np.int32], trtvalues: npt.NDArray[np.float32]):
     # Chromosome must be identical
@@ -46,9 +50,15 @@ def _job(cntends: npt.NDArray[np.int32], cntvalues: npt.NDArray[np.float32],
     return bounds, values
 
 
+def _chunk(c: chunks.Pair):
+    return _job(c.cntends, c.cntvalues, c.trtends, c.trtvalues)
+
+
 def calculate(workload: pipeline.Results) -> Result:
-    bounds, values = _job(workload.cntpileup.interend, workload.cntpileup.values,
-                          workload.trtpileup.interend, workload.trtpileup.values)
+    # Large contigs are split into chunks processed in parallel (see chunks.parallel)
+    parts = chunks.pairs(workload.cntpileup.interend, workload.cntpileup.values,
+                         workload.trtpileup.interend, workload.trtpileup.values)
+    bounds, values = chunks.concatenate(*zip(*chunks.map(_chunk, parts)))
     return Result(
         workload.contig, workload.contiglen, workload.trstrand, Track(bounds, values)
     )
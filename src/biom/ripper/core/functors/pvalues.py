@@ -2,17 +2,19 @@ from typing import Dict, Tuple
 
 import numpy as np
 import numpy.typing as npt
-from MACS3.Signal.Prob import poisson_cdf
 
 from .result import Result, Track
+from .. import chunks
 from ..pipeline import pipeline
 
 FILTERED_PQVALUE = np.float32(-1)
 
 
-# @numba.jit(cache=True, nopython=True, nogil=True)
 def _job(cntends: npt.NDArray[np.int32], cntvalues: npt.NDArray[np.float32],
-         trtends: npt.NDArray[np.int32], trtvalues: npt.NDArray[np.float32]):
+         trtends: npt.NDArray[np.int32], trtvalues: npt.NDArray[np.float32], start: np.int32 = 0):
+    # MACS3 pulls in scipy, import it only when needed
+    from MACS3.Signal.Prob import poisson_cdf
+
     # Chromosome must be identical
     chromsize = cntends[-1]
     assert chromsize == trtends[-1]
@@ -20,62 +22,55 @@ def _job(cntends: npt.NDArray[np.int32], cntvalues: npt.NDArray[np.float32],
     assert cntends.size == cntvalues.size
     assert trtends.size == trtvalues.size
 
-    # Cast all treatment pileups to int
-    trtvalues = trtvalues.astype(np.int32)
-
-    # P-values lookup table
-    ptables = {}
-    # Stat for q-values calculation
-    pvalue_counts = {}
-
-    allocate = cntends.size + trtends.size + 2
-    bounds = np.empty(allocate, dtype=np.int32)
-    # Start at 0
-    bounds[0] = 0
-    values = np.empty(allocate, dtype=np.float32)
-
-    i, trtind, cntind = 0, 0, 0
-    while True:
-        trtend, cntend = trtends[trtind], cntends[cntind]
-        trtval, cntval = trtvalues[trtind], cntvalues[cntind]
-        if trtend == cntend:
-            bounds[i + 1] = trtend
-            trtind += 1
-            cntind += 1
-        elif trtend < cntend:
-            bounds[i + 1] = trtend
-            trtind += 1
-        else:
-            bounds[i + 1] = cntend
-            cntind += 1
-
-        if trtval == 0:
-            # Ignore low covered regions
-            values[i] = FILTERED_PQVALUE
-        else:
-            # Calculate p-values only for well-covered regions
-            assert cntval >= 0
-            key = (trtval, cntval)
-            if key not in ptables:
-                ptables[key] = np.float32(-1 * poisson_cdf(trtval - 1, cntval, False, True))
-
-            pv = ptables[key]
-            values[i] = pv
-            pvalue_counts[pv] = pvalue_counts.get(pv, 0) + (bounds[i + 1] - bounds[i])
-
-        i += 1
-        if bounds[i] == chromsize:
-            break
-    bounds, values = bounds[: i + 1], values[: i]
+    # Merged intervals: i-th interval is [bounds[i], bounds[i + 1])
+    ends = np.union1d(trtends, cntends).astype(np.int32)
+    bounds = np.empty(ends.size + 1, dtype=np.int32)
+    bounds[0] = start
+    bounds[1:] = ends
+
+    # Treatment & control values for each merged interval, treatment pileups are cast to int
+    trtvalues = trtvalues.astype(np.int32)[np.searchsorted(trtends, ends)]
+    cntvalues = cntvalues[np.searchsorted(cntends, ends)]
+
+    # Ignore low covered regions
+    values = np.full(ends.size, FILTERED_PQVALUE, dtype=np.float32)
+    covered = np.nonzero(trtvalues != 0)[0]
+    trtvalues, cntvalues = trtvalues[covered], cntvalues[covered]
+    assert np.all(cntvalues >= 0)
+
+    # Calculate p-values only once for each unique (treatment, control) pair.
+    # Note: +0 turns -0.0 into 0.0, which are equal but have different binary representations
+    keys = (trtvalues.astype(np.int64) << 32) | (cntvalues + np.float32(0)).view(np.uint32)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    pairs = zip((keys >> 32).astype(np.int32).tolist(), (keys & 0xFFFFFFFF).astype(np.uint32).view(np.float32))
+    ptable = np.asarray([-1 * poisson_cdf(trt - 1, cnt, False, True) for trt, cnt in pairs], dtype=np.float32)
+    values[covered] = ptable[inverse]
+
+    # Stat for q-values calculation: the number of base pairs for each p-value
+    pvalues, pvinverse = np.unique(ptable, return_inverse=True)
+    lengths = (bounds[covered + 1] - bounds[covered]).astype(np.int64)
+    counts = np.bincount(pvinverse[inverse], weights=lengths, minlength=pvalues.size).astype(np.int64)
+    pvalue_counts = dict(zip(pvalues, counts.tolist()))
     return bounds, values, pvalue_counts
 
 
+def _chunk(c: chunks.Pair):
+    return _job(c.cntends, c.cntvalues, c.trtends, c.trtvalues, c.start)
+
+
 def calculate(workload: pipeline.Results) -> Tuple[Result, Dict[float, int]]:
-    bounds, values, pvcounts = \
-        _job(workload.cntpileup.interend, workload.cntpileup.values,
-             workload.trtpileup.interend, workload.trtpileup.values)
+    # Large contigs are split into chunks processed in parallel (see chunks.parallel)
+    parts = chunks.pairs(workload.cntpileup.interend, workload.cntpileup.values,
+                         workload.trtpileup.interend, workload.trtpileup.values)
+    bounds, values, pvcounts = zip(*chunks.map(_chunk, parts))
+    bounds, values = chunks.concatenate(bounds, values)
+
+    merged = pvcounts[0]
+    for x in pvcounts[1:]:
+        for k, v in x.items():
+            merged[k] = merged.get(k, 0) + v
 
     track = Result(
         workload.contig, workload.contiglen, workload.trstrand, Track(bounds, values)
     )
-    return track, pvcounts
+    return track, merged
@@ -1,57 +1,62 @@
 from typing import Dict, List
 
-import numba
 import numpy as np
+import numpy.typing as npt
 
 from .pvalues import FILTERED_PQVALUE
 from .result import Result, Track
 
 
-@numba.jit(cache=True, nopython=True, nogil=True)
-def _make_pqtable(pvalues: Dict[float, int]) -> Dict[float, float]:
-    N = 0
-    for x in pvalues.values():
-        N += x
+def _make_pqtable(pvalues: npt.NDArray[np.float32], counts: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    assert pvalues.size > 0, "Empty pvalues dictionary!"
+    assert pvalues.size == counts.size
+    N = counts.sum()
     f = -np.log10(N)
-    rank = 1
-
-    pv2qv = numba.typed.Dict()
-    # Order pvalues, from 1 to 0
-    pvalues = sorted(pvalues.items(), key=lambda x: x[0], reverse=True)
-    assert pvalues, "Empty pvalues dictionary!"
-    for i in range(len(pvalues)):
-        pv, count = pvalues[i]
-        q = pv + (np.log10(rank) + f)
-        if q <= 0:
-            break
-        pv2qv[pv] = q
-        rank += count
+
+    # Order pvalues, from 1 to 0 (-log10 p-values are stored => descending order)
+    order = np.argsort(pvalues, kind='stable')[::-1]
+    pvalues, counts = pvalues[order].astype(np.float64), counts[order]
+
+    # Rank of each p-value = 1 + number of base pairs with a better p-value
+    rank = np.empty_like(counts)
+    rank[0] = 1
+    np.cumsum(counts[:-1], out=rank[1:])
+    rank[1:] += 1
+
+    qvalues = pvalues + (np.log10(rank) + f)
     # bottom rank pscores all have qscores 0
-    for j in range(i, len(pvalues)):
-        pv, _ = pvalues[j]
-        pv2qv[pv] = 0
-    return pv2qv
+    bottom = np.nonzero(qvalues <= 0)[0]
+    # Note: the last p-value always gets a zero q-value (kept for compatibility with the original loop)
+    qvalues[bottom[0] if bottom.size > 0 else -1:] = 0
+
+    result = np.empty_like(qvalues)
+    result[order] = qvalues
+    return result
 
 
 def make_pqtable(counts: List[Dict[float, int]]) -> Dict[float, float]:
-    merged = numba.typed.Dict()
+    merged = {}
     for item in counts:
         for k, v in item.items():
-            if k not in merged:
-                merged[k] = 0
-            merged[k] += v
-    result = _make_pqtable(merged)
-    return {k: v for k, v in result.items()}  # turn into a usual dict
+            merged[k] = merged.get(k, 0) + v
+
+    pvalues = np.fromiter(merged.keys(), dtype=np.float32, count=len(merged))
+    counts = np.fromiter(merged.values(), dtype=np.int64, count=len(merged))
+    qvalues = _make_pqtable(pvalues, counts)
+    return dict(zip(pvalues.tolist(), qvalues.tolist()))
 
 
 def apply_pqtable(pvalues: Result, table: Dict[float, float]) -> Result:
+    keys = np.fromiter(table.keys(), dtype=np.float64, count=len(table))
+    order = np.argsort(keys)
+    keys, values = keys[order], np.fromiter(table.values(), dtype=np.float64, count=len(table))[order]
+
     pv = pvalues.track.values
-    qv = np.empty_like(pv)
-    for i in range(pv.size):
-        if pv[i] == FILTERED_PQVALUE:
-            qv[i] = FILTERED_PQVALUE
-        else:
-            qv[i] = table[pv[i]]
+    qv = np.full_like(pv, FILTERED_PQVALUE)
+    tocalc = np.nonzero(pv != FILTERED_PQVALUE)[0]
+    ind = np.searchsorted(keys, pv[tocalc]).clip(max=max(keys.size - 1, 0))
+    assert np.all(keys[ind] == pv[tocalc]), "Unknown p-values in the pq-table"
+    qv[tocalc] = values[ind]
     return Result(
         pvalues.contig, pvalues.contiglen, pvalues.trstrand,
         Track(pvalues.track.bounds, qv)
@@ -1,9 +1,10 @@
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List
 
-import pyBigWig
+import numpy as np
 
-from .functors import Result, callpeaks
+from .functors import Result, Track, callpeaks
+from .pileup import Pileup
 from .utils import Stranded
 
 
@@ -16,6 +17,8 @@ def _tobigwig(tracks: List[Result], bw: Path):
     # At most one record per contig
     assert len(set(x.contig for x in tracks)) == len(tracks)
 
+    import pyBigWig
+
     bw: pyBigWig.pyBigWig = pyBigWig.open(bw.as_posix(), 'w')
 
     # Sort by contig name
@@ -25,15 +28,19 @@ def _tobigwig(tracks: List[Result], bw: Path):
     bw.addHeader(header)
     # Add entries
     for tr in tracks:
-        contigs = [tr.contig] * tr.track.values.size
-        starts = tr.track.bounds[:-1]
-        ends = tr.track.bounds[1:]
-        values = tr.track.values
-        assert values.size == starts.size == ends.size
-        bw.addEntries(contigs, starts, ends=ends, values=values)
+        _addentries(bw, tr.contig, tr.track)
     bw.close()
 
 
+def _addentries(bw, contig: str, track: Track):
+    contigs = [contig] * track.values.size
+    starts = track.bounds[:-1]
+    ends = track.bounds[1:]
+    values = track.values
+    assert values.size == starts.size == ends.size
+    bw.addEntries(contigs, starts, ends=ends, values=values)
+
+
 def tobigwig(tracks: List[Result], folder: Path, title: str) -> Stranded[Path]:
     saveto = Stranded(
         fwd=folder.joinpath(f"{title}.fwd.bigWig"),
@@ -51,6 +58,69 @@ def tobigwig(tracks: List[Result], folder: Path, title: str) -> Stranded[Path]:
     return saveto
 
 
+def streambigwig(contigs: Dict[str, int], load: Callable[[str, str], Track], folder: Path, title: str) \
+        -> Stranded[Path]:
+    """
+    Same as tobigwig, but tracks are loaded one at a time: load(contig, strand) is called for each contig
+    (sorted by name) right before its entries are written.
+    """
+    import pyBigWig
+
+    assert contigs
+    saveto = Stranded(
+        fwd=folder.joinpath(f"{title}.fwd.bigWig"),
+        rev=folder.joinpath(f"{title}.rev.bigWig")
+    )
+    header = sorted(contigs.items())
+    for strand, path in ("+", saveto.fwd), ("-", saveto.rev):
+        bw: pyBigWig.pyBigWig = pyBigWig.open(path.as_posix(), 'w')
+        bw.addHeader(header)
+        for contig, _ in header:
+            _addentries(bw, contig, load(contig, strand))
+        bw.close()
+    return saveto
+
+
+def bigwigcontigs(path: Path) -> Dict[str, int]:
+    import pyBigWig
+
+    bw = pyBigWig.open(path.as_posix())
+    try:
+        return dict(bw.chroms())
+    finally:
+        bw.close()
+
+
+def frombigwig(path: Path, contig: str) -> Pileup:
+    """
+    Load the contig track from the BigWig file as a pileup. Intervals are read in bulk, gaps are filled with zeros.
+    """
+    import pyBigWig
+
+    bw = pyBigWig.open(path.as_posix())
+    try:
+        contiglen = bw.chroms(contig)
+        assert contiglen is not None, f"Contig {contig} is missing in {path}"
+        intervals = bw.intervals(contig)
+    finally:
+        bw.close()
+
+    if not intervals:
+        return Pileup.constant(contig, np.int32(contiglen), np.float32(0))
+
+    intervals = np.asarray(intervals, dtype=np.float64)
+    starts, ends = intervals[:, 0].astype(np.int32), intervals[:, 1].astype(np.int32)
+    values = intervals[:, 2].astype(np.float32)
+
+    # Zero-filled intervals for gaps (including the head & the tail of the contig)
+    prevends = np.concatenate([[0], ends[:-1]])
+    gaps = np.flatnonzero(starts > prevends)
+    ends, values = np.insert(ends, gaps, starts[gaps]), np.insert(values, gaps, np.float32(0))
+    if ends[-1] < contiglen:
+        ends, values = np.append(ends, np.int32(contiglen)), np.append(values, np.float32(0))
+    return Pileup(contig, ends.astype(np.int32), values.astype(np.float32))
+
+
 def tobed(peaks: List[callpeaks.Peak], saveto: Path):
     # https://genome.ucsc.edu/FAQ/FAQformat.html#format12
     # chrom - Name of the chromosome (or contig, scaffold, etc.).
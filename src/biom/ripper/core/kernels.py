@@ -0,0 +1,164 @@
+"""
+Numba kernels with explicit signatures.
+
+Each kernel is compiled exactly once for its declared signature and cached on disk. Optionally, kernels can be
+compiled ahead of time into an extension module, which is then loaded instead of the JIT-compiled versions:
+
+    python -m biom.ripper.core.kernels warmup   # compile & cache all kernels (e.g. once per node)
+    python -m biom.ripper.core.kernels build    # AOT-compile kernels into biom/ripper/core/_aotkernels*.so
+    python -m biom.ripper.core.kernels status   # report which kernels are AOT-compiled
+
+Stale AOT kernels (compiled from a different source code) are ignored. Set BIOM_DISABLE_AOT=1 to ignore AOT
+kernels altogether.
+"""
+import argparse
+import hashlib
+import importlib
+import inspect
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numba
+from numba import types
+from numba.core.typing.templates import Signature
+
+AOT_MODULE = "_aotkernels"
+# Modules that declare kernels, must be imported to populate the registry
+MODULES = (
+    "biom.ripper.core.pileup.pileup",
+    "biom.ripper.core.pileup.merge",
+    "biom.ripper.core.pileup.algebra",
+    "biom.ripper.core.functors.foldenrichment",
+)
+
+# Common types
+int32 = types.int32
+float32 = types.float32
+int32array = types.Array(int32, 1, 'C')
+float32array = types.Array(float32, 1, 'C')
+int32rarray = types.Array(int32, 1, 'A', readonly=True)
+float32rarray = types.Array(float32, 1, 'A', readonly=True)
+
+try:
+    if os.environ.get("BIOM_DISABLE_AOT", "0") == "1":
+        raise ImportError()
+    from . import _aotkernels as _aot
+except ImportError:
+    _aot = None
+
+# name -> (python function, signature, AOT-compatible)
+_REGISTRY: Dict[str, Tuple[Callable, Signature, bool]] = {}
+# name -> whether AOT-compiled kernel is used
+_LOADED: Dict[str, bool] = {}
+
+
+def _checksum(fn: Callable, signature: Signature) -> int:
+    digest = hashlib.sha256(f"{inspect.getsource(fn)}\n{signature}".encode()).digest()
+    return int.from_bytes(digest[:7], "little")
+
+
+def kernel(name: str, signature: Signature, aot: bool = True):
+    """
+    Compile the decorated function for the given signature (nopython, nogil, cached).
+    If a matching ahead-of-time compiled kernel is available, it is used instead.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        _REGISTRY[name] = (fn, signature, aot)
+        if aot and _aot is not None and hasattr(_aot, name):
+            if getattr(_aot, f"{name}_checksum")() == _checksum(fn, signature):
+                _LOADED[name] = True
+                return getattr(_aot, name)
+            logging.warning(f"AOT kernel {name} is stale and will be ignored, please rebuild AOT kernels")
+
+        _LOADED[name] = False
+        return numba.jit([signature], cache=True, nopython=True, nogil=True)(fn)
+
+    return decorator
+
+
+def _populate():
+    for module in MODULES:
+        importlib.import_module(module)
+
+
+def warmup() -> Dict[str, float]:
+    """
+    Import all modules with kernels, i.e. compile or load them from the cache. Returns import time per module.
+    """
+    timings = {}
+    for module in MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = time.perf_counter() - start
+    return timings
+
+
+def build(output: Path = Path(__file__).parent) -> Path:
+    """
+    Ahead-of-time compile all AOT-compatible kernels into an extension module.
+    """
+    from numba.pycc import CC, compiler
+
+    _populate()
+
+    # AOT kernels must release the GIL just like their JIT counterparts (nogil=True)
+    class Flags(compiler.Flags):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.release_gil = True
+
+    cc = CC(AOT_MODULE)
+    cc.output_dir = output.as_posix()
+    cc.verbose = False
+    for name, (fn, signature, aot) in _REGISTRY.items():
+        if not aot:
+            continue
+        cc.export(name, signature)(fn)
+        # Source checksum to detect stale kernels
+        checksum = _checksum(fn, signature)
+        namespace = {}
+        exec(f"def checksum():\n    return {checksum}\n", namespace)
+        cc.export(f"{name}_checksum", types.int64())(namespace["checksum"])
+
+    default, compiler.Flags = compiler.Flags, Flags
+    try:
+        cc.compile()
+    finally:
+        compiler.Flags = default
+    return output
+
+
+def status() -> Dict[str, bool]:
+    _populate()
+    return dict(_LOADED)
+
+
+def main():
+    # Executed as __main__ => use the registry of the imported module
+    module = importlib.import_module("biom.ripper.core.kernels")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["warmup", "build", "status"])
+    parser.add_argument("--output", type=Path, default=Path(__file__).parent, help="Output folder for AOT module")
+    args = parser.parse_args()
+
+    match args.command:
+        case "warmup":
+            for name, elapsed in module.warmup().items():
+                print(f"{name}: {elapsed:.2f}s")
+        case "build":
+            start = time.perf_counter()
+            module.build(args.output)
+            print(f"AOT kernels are compiled in {time.perf_counter() - start:.2f}s: {args.output}")
+        case "status":
+            for name, isaot in module.status().items():
+                print(f"{name}: {'AOT' if isaot else 'JIT'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
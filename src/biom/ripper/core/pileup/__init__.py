@@ -1,2 +1,5 @@
-from . import io, merge
-from .pileup import Pileup, calculate
+from ...._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["algebra", "io", "merge", "pileup"], attributes={"Pileup": ".pileup", "calculate": ".pileup"}
+)
@@ -0,0 +1,206 @@
+"""
+Run-length encoded track algebra: n-ary operations on pileups (Pileup) and tracks (functors.Track).
+
+Operands are aligned on the union of their breakpoints in a single merge sweep (numba kernel), operations are
+applied to the aligned values and equal neighbouring intervals are merged back. Dense per-base arrays are never
+materialized, the cost is linear in the total number of intervals.
+"""
+import unittest
+from typing import Callable, Sequence, Tuple, TypeVar, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from .pileup import Pileup
+from ..kernels import float32rarray, int32array, int32rarray, kernel, types
+
+int64rarray = types.Array(types.int64, 1, 'A', readonly=True)
+float32matrix = types.Array(types.float32, 2, 'C')
+
+# Both pileups and tracks are supported, results have the type of the first operand
+T = TypeVar('T')
+Operand = Union[Pileup, "Track"]
+
+
+@kernel("algebra_align", types.Tuple((int32array, float32matrix))(int32rarray, float32rarray, int64rarray))
+def _align(ends, values, offsets):
+    # Concatenated tracks: i-th track = ends[offsets[i]: offsets[i + 1]], all tracks must end at the same position
+    ntracks = offsets.size - 1
+    cursor = offsets[:-1].copy()
+
+    resends = np.empty(ends.size, dtype=np.int32)
+    resvalues = np.empty((ends.size, ntracks), dtype=np.float32)
+    length = 0
+    while cursor[0] < offsets[1]:
+        curend = ends[cursor[0]]
+        for track in range(1, ntracks):
+            curend = min(curend, ends[cursor[track]])
+
+        resends[length] = curend
+        for track in range(ntracks):
+            resvalues[length, track] = values[cursor[track]]
+            if ends[cursor[track]] == curend:
+                cursor[track] += 1
+        length += 1
+    return resends[:length], resvalues[:length]
+
+
+def _decompose(x: Operand) -> Tuple[np.int32, npt.NDArray[np.int32], npt.NDArray[np.float32]]:
+    # (start, interval ends, values)
+    if isinstance(x, Pileup):
+        return np.int32(0), x.interend, x.values
+    return x.bounds[0], x.bounds[1:], x.values
+
+
+def _compose(template: T, start: np.int32, ends: npt.NDArray[np.int32], values: npt.NDArray[np.float32]) -> T:
+    # Merge equal neighbouring intervals
+    keep = np.append(values[1:] != values[:-1], True)
+    ends, values = ends[keep], values[keep].astype(np.float32)
+    if isinstance(template, Pileup):
+        return Pileup(template.id, ends, values)
+    return type(template)(np.insert(ends, 0, start), values)
+
+
+def align(operands: Sequence[Operand]) -> Tuple[np.int32, npt.NDArray[np.int32], npt.NDArray[np.float32]]:
+    """
+    Align operands on the union of their breakpoints: returns (start, ends, values), values[i] are values of the
+    i-th operand for each merged interval.
+    """
+    assert len(operands) > 0
+    decomposed = [_decompose(x) for x in operands]
+    start, end = decomposed[0][0], decomposed[0][1][-1]
+    assert all(x[0] == start and x[1][-1] == end for x in decomposed), "Operands must span the same interval"
+
+    ends = np.concatenate([x[1] for x in decomposed])
+    values = np.concatenate([x[2] for x in decomposed]).astype(np.float32, copy=False)
+    offsets = np.zeros(len(decomposed) + 1, dtype=np.int64)
+    np.cumsum([x[1].size for x in decomposed], out=offsets[1:])
+
+    ends, values = _align(ends, values, offsets)
+    return start, ends, values.T
+
+
+def apply(fn: Callable[[npt.NDArray[np.float32]], npt.NDArray[np.float32]], operands: Sequence[T]) -> T:
+    """
+    Apply fn to aligned values (n operands x m merged intervals) and return the resulting track of m values.
+    """
+    start, ends, values = align(operands)
+    return _compose(operands[0], start, ends, fn(values))
+
+
+def add(operands: Sequence[T]) -> T:
+    return apply(lambda x: x.sum(axis=0, dtype=np.float32), operands)
+
+
+def mean(operands: Sequence[T]) -> T:
+    return apply(lambda x: x.mean(axis=0, dtype=np.float32), operands)
+
+
+def maximum(operands: Sequence[T]) -> T:
+    return apply(lambda x: x.max(axis=0), operands)
+
+
+def minimum(operands: Sequence[T]) -> T:
+    return apply(lambda x: x.min(axis=0), operands)
+
+
+def subtract(minuend: T, subtrahend: Operand, floor: float = 0) -> T:
+    """
+    Difference of tracks clipped from below by `floor` (e.g. input subtraction).
+    """
+    return apply(lambda x: np.maximum(x[0] - x[1], np.float32(floor)), [minuend, subtrahend])
+
+
+def ratio(numerator: T, denominator: Operand, pseudocount: float = 0) -> T:
+    pseudocount = np.float32(pseudocount)
+    return apply(lambda x: (x[0] + pseudocount) / (x[1] + pseudocount), [numerator, denominator])
+
+
+def clip(operand: T, lower: float = None, upper: float = None) -> T:
+    start, ends, values = _decompose(operand)
+    return _compose(operand, start, ends.copy(), np.clip(values, lower, upper))
+
+
+def threshold(operand: T, cutoff: float) -> T:
+    """
+    Indicator track: 1 where values >= cutoff, 0 otherwise.
+    """
+    start, ends, values = _decompose(operand)
+    return _compose(operand, start, ends.copy(), (values >= cutoff).astype(np.float32))
+
+
+def integral(operand: Operand, starts: npt.ArrayLike, ends: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    Integral of the track over each query window [starts[i], ends[i]) using prefix sums over intervals.
+    Windows are clipped to the track span.
+    """
+    start, trackends, values = _decompose(operand)
+    bounds = np.insert(trackends, 0, start).astype(np.int64)
+    prefix = np.zeros(bounds.size, dtype=np.float64)
+    np.cumsum(np.diff(bounds) * values.astype(np.float64), out=prefix[1:])
+
+    def cumulative(positions: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+        # Integral over [start, position)
+        positions = np.clip(positions, bounds[0], bounds[-1])
+        ind = np.clip(np.searchsorted(bounds, positions, side='right') - 1, 0, values.size - 1)
+        return prefix[ind] + (positions - bounds[ind]) * values[ind].astype(np.float64)
+
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    assert starts.shape == ends.shape and np.all(starts <= ends)
+    return cumulative(ends) - cumulative(starts)
+
+
+def windowmean(operand: Operand, starts: npt.ArrayLike, ends: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    Mean value of the track in each query window (e.g. local lambda), empty windows get zeros.
+    """
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    start, trackends, _ = _decompose(operand)
+    lengths = np.clip(ends, start, trackends[-1]) - np.clip(starts, start, trackends[-1])
+    total = integral(operand, starts, ends)
+    return np.divide(total, lengths, out=np.zeros_like(total), where=lengths > 0)
+
+
+class AlgebraUnitTests(unittest.TestCase):
+    @staticmethod
+    def _dense(p: Pileup) -> np.ndarray:
+        return np.repeat(p.values, np.diff(p.interend, prepend=0))
+
+    def _random(self, rng: np.random.Generator, length: int) -> Pileup:
+        ends = np.unique(rng.integers(1, length, size=rng.integers(0, 30)))
+        ends = np.append(ends, length).astype(np.int32)
+        return Pileup("1", ends, rng.choice(np.asarray([0, 1, 2.5, 4], dtype=np.float32), size=ends.size))
+
+    def test_nary(self):
+        rng = np.random.default_rng(13)
+        for _ in range(50):
+            length = int(rng.integers(1, 200))
+            operands = [self._random(rng, length) for _ in range(rng.integers(1, 5))]
+            dense = np.stack([self._dense(x) for x in operands])
+            for fn, expected in (add, dense.sum(axis=0)), (mean, dense.mean(axis=0)), \
+                                (maximum, dense.max(axis=0)), (minimum, dense.min(axis=0)):
+                result = fn(operands)
+                np.testing.assert_allclose(self._dense(result), expected, rtol=1e-6)
+                self.assertTrue(np.all(result.values[1:] != result.values[:-1]))
+
+            num, den = operands[0], operands[-1]
+            np.testing.assert_allclose(self._dense(ratio(num, den, 1)), (dense[0] + 1) / (dense[-1] + 1), rtol=1e-6)
+            np.testing.assert_array_equal(self._dense(subtract(num, den)), np.maximum(dense[0] - dense[-1], 0))
+            np.testing.assert_array_equal(self._dense(clip(num, 1, 3)), np.clip(dense[0], 1, 3))
+
+            starts = rng.integers(-5, length + 5, size=20)
+            ends = starts + rng.integers(0, 50, size=20)
+            cumsum = np.concatenate([[0], np.cumsum(dense[0])])
+            expected = cumsum[np.clip(ends, 0, length)] - cumsum[np.clip(starts, 0, length)]
+            np.testing.assert_allclose(integral(num, starts, ends), expected)
+
+    def test_tracks(self):
+        from ..functors.result import Track
+
+        a = Track(np.asarray([10, 12, 20], dtype=np.int32), np.asarray([1, 2], dtype=np.float32))
+        b = Track(np.asarray([10, 15, 20], dtype=np.int32), np.asarray([2, 1], dtype=np.float32))
+        result = add([a, b])
+        self.assertIsInstance(result, Track)
+        np.testing.assert_array_equal(result.bounds, [10, 12, 15, 20])
+        np.testing.assert_array_equal(result.values, [3, 4, 3])
+        np.testing.assert_allclose(windowmean(a, [10, 11, 30], [12, 13, 40]), [1, 1.5, 0])
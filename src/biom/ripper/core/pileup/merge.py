@@ -1,23 +1,29 @@
 import unittest
 from typing import List, Optional
 
-import numba
 import numpy as np
 import numpy.typing as npt
 from numba import float32, int32
 
 from .pileup import Pileup
+from .. import chunks
+from ..kernels import float32array, float32rarray, int32array, int32rarray, kernel, types
+
+int64rarray = types.Array(types.int64, 1, 'A', readonly=True)
 
 SENSITIVITY = float32(1e-5)
 
 
-@numba.jit(cache=True, nopython=True, nogil=True)
-def _simplify(interend, values, sensitivity: float32 = SENSITIVITY):
+@kernel("merge_simplify", types.Tuple((int32[:], float32[:]))(int32[:], float32[:], float32, int32rarray))
+def _simplify(interend, values, sensitivity, stops):
     assert interend.size == values.size and interend.size > 0
-    curval, curend, writepos = values[0], interend[0], 0
+    curval, curend, writepos, stop = values[0], interend[0], 0, 0
     for ind in range(1, interend.size):
+        # Intervals are never merged across stops (e.g. boundaries of packed contigs)
+        while stop < stops.size and stops[stop] < curend:
+            stop += 1
         # Skip elements if diff is small
-        if abs(values[ind] - curval) < sensitivity:
+        if abs(values[ind] - curval) < sensitivity and (stop == stops.size or stops[stop] != curend):
             curend = interend[ind]
             continue
         interend[writepos] = curend
@@ -34,41 +40,43 @@ def _simplify(interend, values, sensitivity: float32 = SENSITIVITY):
     return interend[:finallen], values[:finallen]
 
 
-@numba.jit(cache=True, nopython=True, nogil=True)
-def _by_max(ends_of_intervals: List[npt.NDArray[np.int32]], values: List[npt.NDArray[np.float32]], baseline: float32):
-    for p, v in zip(ends_of_intervals, values):
-        assert p.size == v.size
+@kernel(
+    "merge_by_max",
+    types.Tuple((int32array, float32array))(int32rarray, float32rarray, int64rarray, float32)
+)
+def _by_max(ends_of_intervals, values, offsets, baseline):
+    # Intervals of all tracks are concatenated, i-th track = [offsets[i], offsets[i + 1])
+    tracks = offsets.size - 1
+    for track in range(tracks):
+        assert offsets[track + 1] > offsets[track]
+    assert ends_of_intervals.size == values.size == offsets[-1]
 
     # 1. Make buffers for current intervals and results
-    tracks = len(ends_of_intervals)
-    track_nextind = np.zeros(tracks, dtype=np.int32)
+    track_nextind = offsets[:-1].copy()
+    track_lastind = offsets[1:].copy()
     track_curent = np.empty(tracks, dtype=np.int32)
     track_curval = np.empty(tracks, dtype=np.float32)
 
     for track in range(tracks):
-        track_curent[track] = ends_of_intervals[track][0]
-        track_curval[track] = values[track][0]
+        track_curent[track] = ends_of_intervals[track_nextind[track]]
+        track_curval[track] = values[track_nextind[track]]
 
-    maxlength = int32(0)
-    for p in ends_of_intervals:
-        maxlength += p.size
+    maxlength = ends_of_intervals.size
     res_ends = np.empty(maxlength, dtype=np.int32)
     res_values = np.empty(maxlength, dtype=np.float32)
 
     curval = max(baseline, np.max(track_curval))
     nextval = curval
 
-    curend = min(track_curent)
+    curend = np.min(track_curent)
     real_length = 0
 
-    # ahead declaration of buffer to avoid memory allocation on each iteration
-    to_drop = np.empty(tracks, dtype=np.int32)
     while tracks > 0:
         # 1. Next value is a max among present intervals and baseline value
-        nextval = max(baseline, np.max(track_curval))
+        nextval = max(baseline, np.max(track_curval[:tracks]))
 
         # 2. End of the interval is a min among active intervals ends
-        nextend = min(track_curent)
+        nextend = np.min(track_curent[:tracks])
 
         # 3. Save interval if new value is encountered
         if nextval != curval:
@@ -79,38 +87,22 @@ def _by_max(ends_of_intervals: List[npt.NDArray[np.int32]], values: List[npt.NDA
         curend = nextend
 
         # 4. Push intervals if needed and drop finished intervals
-        to_drop_total = 0
-        for track in range(tracks):
+        track = 0
+        while track < tracks:
             if track_curent[track] == nextend:
                 nextind = track_nextind[track] + 1
-                # finished interval
-                if nextind == ends_of_intervals[track].size:
-                    to_drop[to_drop_total] = track
-                    to_drop_total += 1
+                # finished interval => replace it with the last active track and check it again
+                if nextind == track_lastind[track]:
+                    tracks -= 1
+                    track_curent[track] = track_curent[tracks]
+                    track_curval[track] = track_curval[tracks]
+                    track_nextind[track] = track_nextind[tracks]
+                    track_lastind[track] = track_lastind[tracks]
                     continue
-                track_curent[track] = ends_of_intervals[track][nextind]
-                track_curval[track] = values[track][nextind]
+                track_curent[track] = ends_of_intervals[nextind]
+                track_curval[track] = values[nextind]
                 track_nextind[track] = nextind
-
-                # update max value for the current interval
-                # if values[track][nextind - 1] == nextval:
-                #     nextval = max(baseline, np.max(track_curval))
-                # else:
-                #     nextval = max(nextval, track_curval[track])
-
-        if to_drop_total != 0:
-            tracks -= to_drop_total
-            indices = to_drop[:to_drop_total]
-            track_curent = np.delete(track_curent, indices)
-            track_curval = np.delete(track_curval, indices)
-            track_nextind = np.delete(track_nextind, indices)
-
-            for track in to_drop[:to_drop_total][::-1]:
-                assert track < len(ends_of_intervals) and \
-                       len(ends_of_intervals) == len(values) and \
-                       len(ends_of_intervals) > 0
-                ends_of_intervals.pop(track)
-                values.pop(track)
+            track += 1
 
     res_values[real_length] = curval
     res_ends[real_length] = curend
@@ -120,7 +112,12 @@ def _by_max(ends_of_intervals: List[npt.NDArray[np.int32]], values: List[npt.NDA
     return res_ends[:real_length], res_values[:real_length]
 
 
-def by_max(pileups: List[Pileup], baseline: Optional[float32] = None) -> Pileup:
+def by_max(pileups: List[Pileup], baseline: Optional[float32] = None,
+           stops: Optional[npt.NDArray[np.int32]] = None) -> Pileup:
+    """
+    Element-wise maximum of pileups (and the baseline).
+    Single pileups are simplified after applying the baseline, but intervals are never merged across `stops`.
+    """
     assert len(pileups) > 0 and \
            all(x.id == pileups[0].id and x.interend[-1] == pileups[0].interend[-1] for x in pileups)
 
@@ -129,22 +126,34 @@ def by_max(pileups: List[Pileup], baseline: Optional[float32] = None) -> Pileup:
         if baseline:
             pileup.owned()
             np.maximum(pileup.values, baseline, out=pileup.values)
-            pileup.interend, pileup.values = _simplify(pileup.interend, pileup.values)
+            stops = stops if stops is not None else np.empty(0, dtype=np.int32)
+            pileup.interend, pileup.values = _simplify(pileup.interend, pileup.values, SENSITIVITY, stops)
         return pileup.owned()
 
-    # All arrays must be typed and have the same "constness"
-    interends, values = numba.typed.List(), numba.typed.List()
-    for x in pileups:
-        x.interend.setflags(write=False)
-        interends.append(x.interend)
-        x.values.setflags(write=False)
-        values.append(x.values)
-
     baseline = baseline if baseline else np.float32(0)
-    ends, values = _by_max(interends, values, baseline)
+
+    # Large contigs are split into chunks processed in parallel (see chunks.parallel)
+    splits = chunks.positions(max((x.interend for x in pileups), key=len))
+    ends = np.concatenate([splits, pileups[0].interend[-1:]])
+    parts = [[] for _ in range(ends.size)]
+    for p in pileups:
+        for ind, chunk in enumerate(chunks.slices(p.interend, splits)):
+            parts[ind].append((chunks.clip(p.interend, chunk, ends[ind]), p.values[chunk]))
+
+    ends, values = zip(*chunks.map(lambda x: _by_max_chunk(x, baseline), parts))
+    ends, values = chunks.join(list(ends), list(values))
     return Pileup(pileups[0].id, ends, values).owned()
 
 
+def _by_max_chunk(tracks, baseline: float32):
+    # Concatenate all tracks to pass them to the kernel at once
+    interends = np.concatenate([x[0] for x in tracks])
+    values = np.concatenate([x[1] for x in tracks])
+    offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+    np.cumsum([x[0].size for x in tracks], out=offsets[1:])
+    return _by_max(interends, values, offsets, baseline)
+
+
 class MergeByMaxUnitTests(unittest.TestCase):
     def _test(self, pileups, baseline, expected):
         workload = [Pileup.from_tuples("", p) for p in pileups]
@@ -3,12 +3,12 @@ from copy import deepcopy
 from dataclasses import dataclass
 from typing import List, Tuple
 
-import numba
 import numpy as np
 import numpy.typing as npt
 from numba import float32, int32
 
 from ..fragments.seqblocks import AlignedBlocks
+from ..kernels import float32array, int32array, int32rarray, kernel, types
 
 
 @dataclass
@@ -50,8 +50,7 @@ class Pileup:
         return Pileup(contig, np.asarray([contiglen], dtype=np.int32), np.asarray([value], dtype=np.float32))
 
 
-# Tuple((int32[:], float32[:]))(float32[:], float32, int32)
-@numba.jit(cache=True, nopython=True, nogil=True)
+@kernel("pileup_simplify", types.Tuple((int32array, float32array))(float32array, float32, types.int64))
 def _simplify(dense_pileup, tolerance, maxbreakpoints):
     pos = 0
     interend = np.empty(2 * maxbreakpoints + 1, dtype=np.int32)
@@ -78,8 +77,7 @@ def _simplify(dense_pileup, tolerance, maxbreakpoints):
     return interend, values
 
 
-# void(int32[:], int32[:], int32[:], int32, int32, float32[:])
-@numba.jit(cache=True, nopython=True, nogil=True)
+@kernel("pileup_pileup", float32array(int32rarray, int32rarray, int32rarray, int32, float32array))
 def _pileup(blstart, blend, index, extension, saveto):
     contiglen = saveto.size
 
@@ -135,7 +133,7 @@ def calculate(contig: str, contiglen: np.int32,
         _pileup(b.start, b.end, b.records, extension, saveto)
 
     maxbreaks = sum(x.start.size for x in blocks)
-    interend, values = _simplify(saveto, sensitivity, maxbreakpoints=maxbreaks)
+    interend, values = _simplify(saveto, sensitivity, maxbreaks)
 
     # Remove directly to free memory asap
     del saveto
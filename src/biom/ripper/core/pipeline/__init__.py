@@ -1 +1,6 @@
-from .pipeline import run
\ No newline at end of file
+from ...._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__, submodules=["packing", "pileup", "pipeline", "postprocess", "regions", "tracks"],
+    attributes={"run": ".pipeline"}
+)
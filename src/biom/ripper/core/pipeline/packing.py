@@ -0,0 +1,221 @@
+"""
+Batched processing of small contigs.
+
+Small contigs are concatenated into packs: pseudo-contigs with a shared (offset) coordinate space that are
+processed by each stage as a single task and a single kernel call. Contig ends are breakpoints of all packed
+pileups, so per-contig results are recovered exactly by cutting packed tracks at contig offsets, which is done
+only when results are written.
+"""
+import dataclasses
+import unittest
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from . import pileup
+from .regions import Window
+from .. import scheduler
+from ..config import PeakCallingConfig
+from ..functors import callpeaks
+from ..functors.result import Peak, Result, Track
+from ..pileup import Pileup
+from ..utils import Stranded
+
+# Packed coordinates must fit into int32
+MAX_PACK_LENGTH = 1 << 28
+PREFIX = "packed:"
+
+
+@dataclass(frozen=True)
+class Pack:
+    id: str
+    contigs: Tuple[str, ...]
+    # i-th contig occupies [offsets[i], offsets[i + 1]) in the packed coordinate space
+    offsets: npt.NDArray[np.int64]
+
+    @property
+    def length(self) -> np.int32:
+        return np.int32(self.offsets[-1])
+
+    @property
+    def stops(self) -> npt.NDArray[np.int32]:
+        # Contig boundaries inside the pack
+        return self.offsets[1:-1].astype(np.int32)
+
+
+@dataclass(frozen=True)
+class Workload:
+    # Pileup workloads for each contig in the pack (in the same order)
+    pack: Pack
+    workloads: List[pileup.Workload]
+
+
+def plan(config: PeakCallingConfig, windows: Dict[str, Window]) -> Dict[str, Pack]:
+    """
+    Packs of contigs shorter than config.process.packing bases, each pack is at most MAX_PACK_LENGTH long.
+    Packs are deterministic for the given config and BAM files.
+    """
+    if not config.process.packing:
+        return {}
+
+    from .pipeline import targets
+    contiglens = targets(config, windows)
+    small = sorted(x for x, length in contiglens.items() if length < config.process.packing)
+
+    groups, length = [[]], 0
+    for contig in small:
+        if length + contiglens[contig] > MAX_PACK_LENGTH:
+            groups.append([])
+            length = 0
+        groups[-1].append(contig)
+        length += contiglens[contig]
+
+    packs = {}
+    for group in groups:
+        # Packing a single contig is pointless
+        if len(group) < 2:
+            continue
+        offsets = np.zeros(len(group) + 1, dtype=np.int64)
+        np.cumsum([contiglens[x] for x in group], out=offsets[1:])
+        pack = Pack(f"{PREFIX}{len(packs)}", tuple(group), offsets)
+        packs[pack.id] = pack
+    return packs
+
+
+def workloads(packs: Dict[str, Pack], workloads: List[pileup.Workload]) \
+        -> List[Union[pileup.Workload, Workload]]:
+    packed = {contig: pack for pack in packs.values() for contig in pack.contigs}
+    grouped: Dict[Tuple[str, str], List[pileup.Workload]] = {}
+    result = []
+    for w in workloads:
+        if w.target not in packed:
+            result.append(w)
+        else:
+            grouped.setdefault((packed[w.target].id, w.tags), []).append(w)
+    for (packid, _), group in grouped.items():
+        pack = packs[packid]
+        order = {contig: ind for ind, contig in enumerate(pack.contigs)}
+        assert len(group) == len(pack.contigs)
+        result.append(Workload(pack, sorted(group, key=lambda x: order[x.target])))
+    return result
+
+
+def concatenate(pack: Pack, pileups: List[Pileup]) -> Pileup:
+    assert len(pileups) == len(pack.contigs)
+    for p, start, end in zip(pileups, pack.offsets[:-1], pack.offsets[1:]):
+        assert p.interend[-1] == end - start
+    interend = np.concatenate([p.interend + np.int32(offset) for p, offset in zip(pileups, pack.offsets[:-1])])
+    return Pileup(pack.id, interend.astype(np.int32), np.concatenate([p.values for p in pileups]))
+
+
+def run(workload: Union[pileup.Workload, Workload]) -> pileup.Results:
+    if isinstance(workload, pileup.Workload):
+        return pileup.run(workload)
+
+    results = [pileup.run(w) for w in workload.workloads]
+    genomic = Stranded(
+        fwd=concatenate(workload.pack, [x.genomic.fwd for x in results]),
+        rev=concatenate(workload.pack, [x.genomic.rev for x in results])
+    )
+    return pileup.Results(
+        contig=workload.pack.id, contiglen=workload.pack.length, fragments=sum(x.fragments for x in results),
+        genomic=genomic, tags=results[0].tags
+    )
+
+
+def footprint(workload: Union[pileup.Workload, Workload]) -> int:
+    if isinstance(workload, pileup.Workload):
+        return pileup.footprint(workload)
+    # Dense buffers are allocated for one contig at a time, packed pileups are kept until the end
+    largest = max(pileup.footprint(w) for w in workload.workloads)
+    return largest + int(workload.pack.length) // 8 * scheduler.BYTES_PER_INTERVAL
+
+
+def cut(track: Track, positions: npt.NDArray[np.int32]) -> Track:
+    """
+    Insert breakpoints at the given positions, values of split intervals are duplicated.
+    """
+    missing = np.setdiff1d(positions, track.bounds)
+    if missing.size == 0:
+        return track
+    ind = np.searchsorted(track.bounds, missing)
+    return Track(np.insert(track.bounds, ind, missing), np.insert(track.values, ind, track.values[ind - 1]))
+
+
+def unpack(results: List[Result], packs: Dict[str, Pack]) -> List[Result]:
+    """
+    Split packed results into per-contig results, other results are returned as is.
+    """
+    unpacked = []
+    for r in results:
+        pack = packs.get(r.contig)
+        if pack is None:
+            unpacked.append(r)
+            continue
+
+        track = cut(r.track, pack.stops)
+        splits = np.searchsorted(track.bounds, pack.offsets)
+        for ind, contig in enumerate(pack.contigs):
+            start, end, offset = splits[ind], splits[ind + 1], pack.offsets[ind]
+            bounds = (track.bounds[start: end + 1] - offset).astype(np.int32)
+            unpacked.append(Result(
+                contig, np.int32(pack.offsets[ind + 1] - offset), r.trstrand, Track(bounds, track.values[start: end])
+            ))
+    return unpacked
+
+
+def calculate(w: callpeaks.PeakCalingWorkload, packs: Dict[str, Pack]) -> List[Peak]:
+    """
+    Call peaks for packed contigs, peaks never cross contig boundaries.
+    """
+    pack = packs.get(w.contig)
+    if pack is None:
+        return callpeaks.calculate(w)
+
+    ctx = callpeaks.Context(*(cut(x, pack.stops) for x in (w.ctx.qvalues, w.ctx.pvalues, w.ctx.foldenrichment)))
+    peaks = callpeaks.calculate(dataclasses.replace(w, ctx=ctx, stops=pack.stops))
+
+    result = []
+    for p in peaks:
+        ind = np.searchsorted(pack.offsets, p.start, side='right') - 1
+        offset = np.int32(pack.offsets[ind])
+        result.append(dataclasses.replace(
+            p, contig=pack.contigs[ind], start=p.start - offset, end=p.end - offset,
+            summit=[x - offset for x in p.summit]
+        ))
+    return result
+
+
+class PackingUnitTests(unittest.TestCase):
+    def test_unpack(self):
+        pack = Pack("packed:0", ("a", "b", "c"), np.asarray([0, 5, 8, 20], dtype=np.int64))
+        pileups = [
+            Pileup.from_tuples("a", [(2, 1), (5, 2)]),
+            Pileup.from_tuples("b", [(3, 2)]),
+            Pileup.from_tuples("c", [(10, 0), (12, 3)]),
+        ]
+        packed = concatenate(pack, pileups)
+        np.testing.assert_array_equal(packed.interend, [2, 5, 8, 18, 20])
+
+        # Simplification merges equal values across boundaries, unpacking must restore them
+        merged = Result("packed:0", pack.length, "+", Track(np.asarray([0, 2, 8, 18, 20], dtype=np.int32),
+                                                            np.asarray([1, 2, 0, 3], dtype=np.float32)))
+        unpacked = unpack([merged], {pack.id: pack})
+        self.assertEqual([x.contig for x in unpacked], ["a", "b", "c"])
+        for r, p in zip(unpacked, pileups):
+            self.assertEqual(r.contiglen, p.interend[-1])
+            np.testing.assert_array_equal(r.track.bounds[1:], p.interend)
+            np.testing.assert_array_equal(r.track.values, p.values)
+
+    def test_peaks(self):
+        pack = Pack("packed:0", ("a", "b"), np.asarray([0, 10, 20], dtype=np.int64))
+        bounds = np.asarray([0, 6, 14, 20], dtype=np.int32)
+        track = Track(bounds, np.asarray([0, 5, 0], dtype=np.float32))
+        ctx = callpeaks.Context(track, track, track)
+        params = PeakCallingConfig.PeakCallingParams(qvcutoff=None, pvcutoff=None, fecutoff=1, minsize=1, maxgap=0)
+        w = callpeaks.PeakCalingWorkload("packed:0", pack.length, "+", params, ctx)
+
+        peaks = calculate(w, {pack.id: pack})
+        self.assertEqual([(x.contig, x.start, x.end, x.summit) for x in peaks], [("a", 6, 10, [8]), ("b", 0, 4, [2])])
@@ -1,10 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 
 import numpy as np
+from pysam import AlignmentFile
 
-from .. import fragments, pileup
+from .regions import Window
+from .. import fragments, pileup, scheduler
 from ..config import PeakCallingConfig
 from ..utils import Stranded
 
@@ -17,6 +19,13 @@ class Workload:
     params: PeakCallingConfig.ProcessingParams
     # Additional tags to identify this job later (I don't trust joblib order guarantee)
     tags: Any
+    # Process only the given window of the contig (see regions)
+    window: Optional[Window] = None
+
+    @property
+    def target(self) -> str:
+        # Id of the processed (pseudo-)contig
+        return self.window.id if self.window is not None else self.contig
 
 
 @dataclass(frozen=True)
@@ -37,24 +46,65 @@ def _genome(contig: str, contiglen: np.int32,
     return pileup.merge.by_max(pileups)
 
 
+def footprint(workload: Workload) -> int:
+    contiglen, reads = 0, 0
+    for file in workload.bamfiles:
+        with AlignmentFile(file, 'rb') as bam:
+            if workload.contig not in bam.references:
+                continue
+            contiglen = max(contiglen, bam.get_reference_length(workload.contig))
+            try:
+                reads += sum(x.mapped for x in bam.get_index_statistics() if x.contig == workload.contig)
+            except ValueError:
+                # No index statistics => can't estimate the number of fragments
+                continue
+    if workload.window is not None:
+        # Only the window is loaded, assume a uniform coverage of the contig
+        reads = reads * workload.window.length // max(contiglen, 1)
+        contiglen = workload.window.length
+    # Dense buffer exists only for one strand/extension at a time
+    return contiglen * scheduler.BYTES_PER_BASE + reads // 2 * scheduler.BYTES_PER_FRAGMENT
+
+
+def _window(workload: Workload, blocks: Stranded[List[fragments.AlignedBlocks]]) \
+        -> Tuple[np.int32, int, Stranded[List[fragments.AlignedBlocks]]]:
+    # Move blocks to window coordinates and count fragments that are not counted by the previous window
+    w = workload.window
+    total, clipped = 0, Stranded(fwd=[], rev=[])
+    for source, saveto in (blocks.fwd, clipped.fwd), (blocks.rev, clipped.rev):
+        for b in source:
+            total += int(np.count_nonzero(b.start[b.records[:-1]] >= w.after))
+            b = b.clip(w.start, w.end)
+            if b is not None:
+                saveto.append(b)
+    return np.int32(w.length), total, clipped
+
+
 def run(workload: Workload) -> Results:
     extsize = workload.params.extsize[workload.contig]
     assert extsize and all(x >= 0 for x in extsize), f"Invalid extsize({extsize}) for contig {workload.contig}"
 
     # Load fragments
+    window = workload.window
     blocks, contiglen = fragments.loadfrom(
         workload.bamfiles, fragments.strdeductors.get(workload.params.stranding), workload.contig,
-        workload.params.inflags, workload.params.exflags, workload.params.minmapq
+        workload.params.inflags, workload.params.exflags, workload.params.minmapq,
+        *((window.start, window.end) if window is not None else ())
     )
-    contiglen = np.int32(contiglen)
-    total_fragments = sum(x.fragments() for x in blocks.fwd) + sum(x.fragments() for x in blocks.rev)
+    if window is None:
+        contig, contiglen = workload.contig, np.int32(contiglen)
+        total_fragments = sum(x.fragments() for x in blocks.fwd) + sum(x.fragments() for x in blocks.rev)
+    else:
+        assert contiglen == window.contiglen
+        contig = window.id
+        contiglen, total_fragments, blocks = _window(workload, blocks)
 
     genomic = Stranded(
-        fwd=_genome(workload.contig, contiglen, blocks.fwd, extsize),
-        rev=_genome(workload.contig, contiglen, blocks.rev, extsize)
+        fwd=_genome(contig, contiglen, blocks.fwd, extsize),
+        rev=_genome(contig, contiglen, blocks.rev, extsize)
     )
     return Results(
-        contig=workload.contig,
+        contig=contig,
         contiglen=contiglen,
         fragments=total_fragments,
         genomic=genomic,
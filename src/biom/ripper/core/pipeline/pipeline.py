@@ -1,15 +1,16 @@
+import dataclasses
 import logging
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
-from joblib import Parallel, delayed
 
-from . import pileup, postprocess
+from . import packing, pileup, postprocess, regions
+from .. import scheduler
 from ..config import PeakCallingConfig
 from ..pileup import Pileup
-from ..utils import fetch_contigs
+from ..utils import fetch_contiglens, fetch_contigs
 
 TREATMENT = "treatment"
 CONTROL = "control"
@@ -28,61 +29,101 @@ class Results:
         assert self.trtpileup.id == self.cntpileup.id == self.contig
 
 
-def run(config: PeakCallingConfig, pool: Parallel) -> List[Results]:
-    # Parse BAM contigs
-    contigs = config.contigs if config.contigs else fetch_contigs(config.treatment + config.control)
+def footprint(workload: Results) -> int:
+    # Buffers for the merged treatment/control intervals (see functors.foldenrichment & functors.pvalues)
+    allocate = workload.cntpileup.values.size + workload.trtpileup.values.size + 2
+    return allocate * scheduler.BYTES_PER_INTERVAL
 
-    # Build & run pileup workloads
-    workloads = []
-    prconfigs = {
+
+def contigs(config: PeakCallingConfig) -> Tuple[str]:
+    return config.contigs if config.contigs else fetch_contigs(config.treatment + config.control)
+
+
+def targets(config: PeakCallingConfig, windows: Dict[str, regions.Window]) -> Dict[str, int]:
+    """
+    Processed (pseudo-)contigs and their lengths: target contigs or windows around target regions
+    (see regions.windows).
+    """
+    if windows:
+        return {w.id: w.length for w in windows.values()}
+    contiglens = fetch_contiglens(config.treatment + config.control)
+    return {contig: contiglens[contig] for contig in contigs(config)}
+
+
+def processing(config: PeakCallingConfig) -> Dict[str, PeakCallingConfig.ProcessingParams]:
+    return {
         CONTROL: config.process,
         # Disable extension for treatment
-        TREATMENT: PeakCallingConfig.ProcessingParams(
-            config.process.stranding, config.process.scaling,
-            defaultdict(lambda *args: [0]), config.process.threads, config.process.backend,
-            config.process.inflags, config.process.exflags, config.process.minmapq
-        )
+        TREATMENT: dataclasses.replace(config.process, extsize=defaultdict(lambda *args: [0]))
     }
-    for contig in contigs:
-        for tag, files in {TREATMENT: config.treatment, CONTROL: config.control}.items():
-            workloads.append(pileup.Workload(
-                contig=contig, bamfiles=files, params=prconfigs[tag], tags=tag
-            ))
-    results: List[pileup.Results] = pool(
-        delayed(pileup.run)(w) for w in workloads
-    )
 
-    # Calculate baseline values
-    trtfragments = sum(x.fragments for x in results if x.tags == TREATMENT)
-    cntfragments = sum(x.fragments for x in results if x.tags == CONTROL)
 
-    gmbaseline = cntfragments / config.geffsize
+def pileups(config: PeakCallingConfig, pool: scheduler.Scheduler, windows: Dict[str, regions.Window],
+            tags: Tuple[str, ...] = (TREATMENT, CONTROL)) -> List[pileup.Results]:
+    # Build & run pileup workloads
+    workloads = []
+    prconfigs = processing(config)
+    files = {TREATMENT: config.treatment, CONTROL: config.control}
+    if windows:
+        for window in windows.values():
+            for tag in tags:
+                workloads.append(pileup.Workload(
+                    contig=window.contig, bamfiles=files[tag], params=prconfigs[tag], tags=tag, window=window
+                ))
+    else:
+        for contig in contigs(config):
+            for tag in tags:
+                workloads.append(pileup.Workload(
+                    contig=contig, bamfiles=files[tag], params=prconfigs[tag], tags=tag
+                ))
+    # Small contigs are processed in packs
+    workloads = packing.workloads(packing.plan(config, windows), workloads)
+    return pool.map("pileup", packing.run, workloads, packing.footprint)
+
+
+def baselines(config: PeakCallingConfig, windows: Dict[str, regions.Window], trtfragments: int,
+              cntfragments: int) -> Dict[str, Tuple[float, float, np.float32]]:
+    """
+    Genome baseline, min number of fragments and the scaling coefficient for treatment & control pileups.
+    """
+    geffsize = config.geffsize
+    if config.regions is not None:
+        # Only fragments within target windows are counted
+        geffsize = sum(targets(config, windows).values())
+        logging.info(f"Targeted mode, effective size is limited to {geffsize} bp covered by windows")
+    gmbaseline = cntfragments / geffsize
     print(f"Treatment fragments: {trtfragments}, Control fragments: {cntfragments}")
     print(f"Treatment scaling: {config.process.scaling.treatment}, "
           f"Control scaling: {config.process.scaling.control}")
     logging.info(f"Genome baseline: {gmbaseline}")
+    return {
+        TREATMENT: (0., config.callp.mintrtfrag, config.process.scaling.treatment),
+        CONTROL: (gmbaseline, 0., config.process.scaling.control),
+    }
+
+
+def normalize(config: PeakCallingConfig, pool: scheduler.Scheduler, windows: Dict[str, regions.Window],
+              results: List[pileup.Results]) -> List[postprocess.Result]:
+    # Calculate baseline values
+    trtfragments = sum(x.fragments for x in results if x.tags == TREATMENT)
+    cntfragments = sum(x.fragments for x in results if x.tags == CONTROL)
+    params = baselines(config, windows, trtfragments, cntfragments)
 
     # Build & run postprocess workloads
+    packs = packing.plan(config, windows)
     workloads = []
-    baselines = {TREATMENT: (0., config.callp.mintrtfrag), CONTROL: (gmbaseline, 0.)}
     for r in results:
-        gmbaseline, minfragments = baselines[r.tags]
-
-        if r.tags == TREATMENT:
-            scale = config.process.scaling.treatment
-        else:
-            assert r.tags == CONTROL
-            scale = config.process.scaling.control
-
+        assert r.tags in (TREATMENT, CONTROL)
+        gmbaseline, minfragments, scale = params[r.tags]
         workloads.append(postprocess.Workload(
-            pileup=r, gmbaseline=gmbaseline, scale=scale, minfragments=np.float32(minfragments)
+            pileup=r, gmbaseline=gmbaseline, scale=scale, minfragments=np.float32(minfragments),
+            stops=packs[r.contig].stops if r.contig in packs else None
         ))
-    results: List[postprocess.Result] = pool(
-        delayed(postprocess.run)(w) for w in workloads
-    )
-    # results: List[postprocess.Result] = [postprocess.run(w) for w in workloads]
+    return pool.map("postprocess", postprocess.run, workloads, postprocess.footprint)
+    # return [postprocess.run(w) for w in workloads]
+
 
-    # Regroup results
+def regroup(results: List[postprocess.Result]) -> List[Results]:
     regrouped = defaultdict(dict)
     for r in results:
         # Forward
@@ -106,3 +147,18 @@ def run(config: PeakCallingConfig, pool: Parallel) -> List[Results]:
             trtpileup=pileups[TREATMENT], cntpileup=pileups[CONTROL]
         ))
     return results
+
+
+def run(config: PeakCallingConfig, pool: scheduler.Scheduler, windows: Dict[str, regions.Window],
+        controls: Optional[List[postprocess.Result]] = None) -> List[Results]:
+    """
+    Compute normalized treatment and control pileups for each contig & strand within target windows
+    (regions.windows, empty if all contigs are processed as a whole).
+    Precomputed (postprocessed) control pileups can be passed to skip control processing altogether.
+    """
+    if controls is None:
+        results = normalize(config, pool, windows, pileups(config, pool, windows))
+    else:
+        assert all(x.tags == CONTROL for x in controls)
+        results = normalize(config, pool, windows, pileups(config, pool, windows, (TREATMENT,))) + controls
+    return regroup(results)
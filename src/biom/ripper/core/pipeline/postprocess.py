@@ -1,10 +1,11 @@
 import logging
 import numpy as np
+import numpy.typing as npt
 from dataclasses import dataclass
 from typing import Any, Optional, Tuple
 
 from .pileup import Results
-from .. import pileup
+from .. import pileup, scheduler
 from ..utils import Stranded
 
 
@@ -17,6 +18,8 @@ class Workload:
     minfragments: np.float32
     # Scaling coefficient
     scale: Optional[np.float32]
+    # Boundaries of packed contigs (see packing)
+    stops: Optional[npt.NDArray[np.int32]] = None
 
 
 @dataclass(frozen=True)
@@ -49,12 +52,17 @@ def _normalize(p: Stranded[pileup.Pileup], scale: Optional[np.float32]) -> Stran
     return p
 
 
+def footprint(workload: Workload) -> int:
+    genomic = workload.pileup.genomic
+    return (genomic.fwd.values.size + genomic.rev.values.size) * scheduler.BYTES_PER_INTERVAL
+
+
 def run(workload: Workload) -> Result:
     # Apply baseline value
     result = workload.pileup.genomic
     result: Stranded[pileup.Pileup] = Stranded(
-        fwd=pileup.merge.by_max([result.fwd], baseline=workload.gmbaseline),
-        rev=pileup.merge.by_max([result.rev], baseline=workload.gmbaseline),
+        fwd=pileup.merge.by_max([result.fwd], baseline=workload.gmbaseline, stops=workload.stops),
+        rev=pileup.merge.by_max([result.rev], baseline=workload.gmbaseline, stops=workload.stops),
     )
 
     # Discard low-covered regions
@@ -0,0 +1,172 @@
+"""
+Targeted mode: only padded windows around regions of interest are processed.
+
+Each window is processed as a separate (pseudo-)contig named `contig:start-end`, i.e. pileups, fold enrichment,
+p-values and peaks are computed only inside windows, and q-values are normalized over the covered bp.
+Overlapping padded regions are merged into a single window, hence each read is loaded at most once per window.
+Fragments crossing several windows are counted only once (in the first window they overlap).
+"""
+import dataclasses
+import gzip
+import tempfile
+import unittest
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from ..config import PeakCallingConfig
+from ..functors.result import Peak, Result, Track
+from ..utils import fetch_contiglens
+
+
+@dataclass(frozen=True)
+class Window:
+    contig: str
+    contiglen: int
+    start: int
+    end: int
+    # Fragments starting before this position are counted by the previous window on the contig
+    after: int
+
+    @property
+    def id(self) -> str:
+        return f"{self.contig}:{self.start}-{self.end}"
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+
+def merge(regions: Dict[str, List[List[int]]], contiglens: Dict[str, int], padding: int) -> Dict[str, Window]:
+    windows = {}
+    for contig, intervals in sorted(regions.items()):
+        contiglen = contiglens[contig]
+        intervals = sorted((max(0, start - padding), min(contiglen, end + padding)) for start, end in intervals)
+
+        merged = [list(intervals[0])]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        after = 0
+        for start, end in merged:
+            window = Window(contig, contiglen, start, end, after)
+            windows[window.id] = window
+            after = end
+    return windows
+
+
+def read(path: Path) -> Dict[str, List[List[int]]]:
+    """
+    Regions from a BED file (plain or gzipped), only the first 3 columns are used.
+    """
+    opener = gzip.open if path.suffix.lower() == ".gz" else open
+    regions = defaultdict(list)
+    with opener(path, 'rt') as stream:
+        for line in stream:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            contig, start, end = line.rstrip("\n").split("\t", 3)[:3]
+            regions[contig].append([int(start), int(end)])
+    return regions
+
+
+def windows(config: PeakCallingConfig) -> Dict[str, Window]:
+    """
+    Padded & merged windows around target regions (config.regions) on the target contigs (if any).
+    BAM headers are read on each call: compute windows once per run and pass them along.
+    """
+    if config.regions is None:
+        return {}
+
+    contiglens = fetch_contiglens(config.treatment + config.control)
+    contigs = set(config.contigs) if config.contigs else set(contiglens)
+
+    regions = {
+        contig: intervals for contig, intervals in read(Path(config.regions)).items()
+        if contig in contigs and contig in contiglens
+    }
+    return merge(regions, contiglens, config.padding)
+
+
+def unpack(results: List[Result], windows: Dict[str, Window]) -> List[Result]:
+    """
+    Assemble per-window results into per-contig results, values outside windows are zeros.
+    """
+    if not windows:
+        return results
+
+    grouped = defaultdict(list)
+    unpacked = []
+    for r in results:
+        if r.contig in windows:
+            grouped[(windows[r.contig].contig, r.trstrand)].append(r)
+        else:
+            unpacked.append(r)
+
+    for (contig, trstrand), group in grouped.items():
+        group = sorted(group, key=lambda x: windows[x.contig].start)
+        contiglen = windows[group[0].contig].contiglen
+
+        bounds, values, end = [np.zeros(1, dtype=np.int32)], [], 0
+        for r in group:
+            w = windows[r.contig]
+            if w.start > end:
+                bounds.append(np.asarray([w.start], dtype=np.int32))
+                values.append(np.zeros(1, dtype=r.track.values.dtype))
+            bounds.append((r.track.bounds[1:] + w.start).astype(np.int32))
+            values.append(r.track.values)
+            end = w.end
+        if end < contiglen:
+            bounds.append(np.asarray([contiglen], dtype=np.int32))
+            values.append(np.zeros(1, dtype=values[-1].dtype))
+        unpacked.append(Result(contig, contiglen, trstrand, Track(np.concatenate(bounds), np.concatenate(values))))
+    return unpacked
+
+
+def peaks(peaks: List[Peak], windows: Dict[str, Window]) -> List[Peak]:
+    """
+    Convert peaks from window to contig coordinates.
+    """
+    result = []
+    for p in peaks:
+        w = windows.get(p.contig)
+        if w is None:
+            result.append(p)
+            continue
+        offset = np.int32(w.start)
+        result.append(dataclasses.replace(
+            p, contig=w.contig, start=p.start + offset, end=p.end + offset, summit=[x + offset for x in p.summit]
+        ))
+    return result
+
+
+class RegionsUnitTests(unittest.TestCase):
+    def test_read(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".bed") as bed:
+            bed.write("track name=x\n# comment\n1\t10\t20\tname\t0\t+\n\n2\t5\t8\n1\t30\t40\n")
+            bed.flush()
+            self.assertEqual(read(Path(bed.name)), {"1": [[10, 20], [30, 40]], "2": [[5, 8]]})
+
+    def test_merge(self):
+        windows = merge({"1": [[100, 200], [250, 300], [900, 1000]], "2": [[5, 10]]}, {"1": 1050, "2": 50}, 50)
+        self.assertEqual(
+            [(x.id, x.after) for x in windows.values()], [("1:50-350", 0), ("1:850-1050", 350), ("2:0-50", 0)]
+        )
+
+    def test_unpack(self):
+        windows = merge({"1": [[100, 200], [400, 500]]}, {"1": 600}, 0)
+        results = [
+            Result(w, windows[w].length, "+", Track(np.asarray([0, 50, 100], dtype=np.int32),
+                                                     np.asarray([1, 2], dtype=np.float32)))
+            for w in reversed(windows)
+        ]
+        unpacked = unpack(results, windows)
+        self.assertEqual(len(unpacked), 1)
+        np.testing.assert_array_equal(unpacked[0].track.bounds, [0, 100, 150, 200, 400, 450, 500, 600])
+        np.testing.assert_array_equal(unpacked[0].track.values, [0, 1, 2, 0, 1, 2, 0])
@@ -0,0 +1,85 @@
+"""
+Normalized treatment & control pileups loaded from tracks saved by a previous run instead of BAM files.
+
+Supported sources are the saveto.pileup folder (`<title>.trt.{fwd,rev}.bigWig` & `<title>.cnt.{fwd,rev}.bigWig`)
+or a TrackStore with normalized pileups saved under `key(tag, contig, strand)`, i.e. kept by a streaming run
+(see stream.run).
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import pipeline
+from .. import io, scheduler
+from ..pileup import Pileup
+from ..store import TrackStore
+
+TREATMENT, CONTROL = pipeline.TREATMENT, pipeline.CONTROL
+SUFFIXES = {TREATMENT: "trt", CONTROL: "cnt"}
+STRANDS = {"+": "fwd", "-": "rev"}
+# Same layout as normalized pileups spilled by streaming runs
+SECTION = "normalized"
+
+Source = Union[Path, TrackStore]
+
+
+def key(tag: str, contig: str, strand: str) -> str:
+    return f"{SECTION}/{tag}/{contig}/{strand}"
+
+
+def bigwig(folder: Path, title: str, tag: str, strand: str) -> Path:
+    return folder.joinpath(f"{title}.{SUFFIXES[tag]}.{STRANDS[strand]}.bigWig")
+
+
+@dataclass(frozen=True)
+class Workload:
+    contig: str
+    source: Source
+    title: Optional[str]
+
+
+def _load(w: Workload, tag: str, strand: str) -> Pileup:
+    if isinstance(w.source, TrackStore):
+        # Loaded pileups are never modified => no need to copy memory-mapped arrays
+        return w.source.load(key(tag, w.contig, strand), w.contig)
+    return io.frombigwig(bigwig(w.source, w.title, tag, strand), w.contig)
+
+
+def run(w: Workload) -> List[pipeline.Results]:
+    results = []
+    for strand in STRANDS:
+        trt, cnt = _load(w, TREATMENT, strand), _load(w, CONTROL, strand)
+        assert trt.interend[-1] == cnt.interend[-1], f"Treatment & control lengths differ for {w.contig}"
+        results.append(pipeline.Results(w.contig, trt.interend[-1], strand, trt, cnt))
+    return results
+
+
+def footprint(w: Workload) -> int:
+    if isinstance(w.source, TrackStore):
+        intervals = sum(w.source.intervals(key(tag, w.contig, strand)) for tag in SUFFIXES for strand in STRANDS)
+        return intervals * scheduler.BYTES_PER_INTERVAL
+    # Unknown without reading the file, use the file size as a proxy (~10 bytes per compressed interval)
+    return sum(bigwig(w.source, w.title, tag, "+").stat().st_size for tag in SUFFIXES) * 2
+
+
+def available(source: Source, title: Optional[str] = None) -> Tuple[str, ...]:
+    if isinstance(source, TrackStore):
+        prefix = f"{SECTION}/{TREATMENT}/"
+        contigs = set(x[len(prefix):].rsplit("/", 1)[0] for x in source.keys() if x.startswith(prefix))
+    else:
+        lengths: Dict[str, int] = io.bigwigcontigs(bigwig(source, title, TREATMENT, "+"))
+        contigs = set(lengths)
+    return tuple(sorted(contigs))
+
+
+def load(pool: scheduler.Scheduler, source: Source, title: Optional[str] = None,
+         contigs: Optional[Tuple[str, ...]] = None) -> List[pipeline.Results]:
+    """
+    Load normalized pileups for target contigs (all contigs by default) from the source.
+    `title` is required for BigWig folders and ignored for TrackStores.
+    """
+    assert isinstance(source, TrackStore) or title is not None, "Title is required to load BigWig tracks"
+    contigs = contigs if contigs else available(source, title)
+    workloads = [Workload(contig, source, title) for contig in contigs]
+    results = pool.map("load", run, workloads, footprint)
+    return [x for contig in results for x in contig]
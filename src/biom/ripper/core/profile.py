@@ -0,0 +1,172 @@
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, TypeVar
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .scheduler import PeakRSS
+
+W = TypeVar('W')
+R = TypeVar('R')
+
+
+@dataclass(frozen=True)
+class TaskProfile:
+    # Wall & CPU time in seconds
+    wall: float
+    cpu: float
+    # Number of processed fragments (pileup stage only) and produced intervals/peaks
+    fragments: int
+    intervals: int
+    # Array payload of the workload & result, i.e. an estimate of data moved through joblib (0 for threads)
+    sent: int
+    received: int
+    # Peak resident set size of the worker during the task
+    peakrss: int
+    # The task ran in a thread of the main process, i.e. its CPU time is already in the stage CPU time
+    shared: bool = False
+
+
+@dataclass()
+class StageProfile:
+    name: str
+    wall: float = 0
+    cpu: float = 0
+    tasks: List[TaskProfile] = field(default_factory=list)
+
+    def summarize(self) -> Dict[str, Any]:
+        fragments = sum(x.fragments for x in self.tasks)
+        workers_time = sum(x.wall for x in self.tasks)
+        return {
+            "name": self.name,
+            "wall": self.wall,
+            # CPU time of the main process (all its threads) and of tasks that ran in worker processes
+            "cpu": self.cpu + sum(x.cpu for x in self.tasks if not x.shared),
+            "ntasks": len(self.tasks),
+            "fragments": fragments,
+            "fragments_per_sec": fragments / workers_time if workers_time > 0 else 0,
+            "intervals": sum(x.intervals for x in self.tasks),
+            "sent": sum(x.sent for x in self.tasks),
+            "received": sum(x.received for x in self.tasks),
+            "peakrss": max((x.peakrss for x in self.tasks), default=0),
+            "tasks": [asdict(x) for x in self.tasks],
+        }
+
+
+def _intervals(obj: Any) -> int:
+    # Lazy import to avoid circular dependencies (scheduler -> profile -> functors -> pipeline -> scheduler)
+    from .pileup import Pileup
+    from .functors.result import Peak, Track
+
+    match obj:
+        case Pileup() | Track():
+            return obj.values.size
+        case Peak():
+            return 1
+        case list() | tuple():
+            return sum(_intervals(x) for x in obj)
+        case _ if hasattr(obj, "__dataclass_fields__"):
+            return sum(_intervals(getattr(obj, x)) for x in obj.__dataclass_fields__)
+        case _:
+            return 0
+
+
+def _nbytes(obj: Any) -> int:
+    # Numpy arrays dominate pickled workloads & results. Summing their sizes avoids serializing every task twice
+    # (once more on top of joblib) and keeps the serialized copies out of the observed memory footprint.
+    match obj:
+        case np.ndarray():
+            return obj.nbytes
+        case list() | tuple():
+            return sum(_nbytes(x) for x in obj)
+        case dict():
+            return sum(_nbytes(x) for x in obj.values())
+        case _ if hasattr(obj, "__dataclass_fields__"):
+            return sum(_nbytes(getattr(obj, x)) for x in obj.__dataclass_fields__)
+        case _:
+            return 0
+
+
+def measured(fn: Callable[[W], R], workload: W, shared: bool = False) -> Tuple[R, TaskProfile, 'PeakRSS']:
+    """
+    Run & profile the task, the returned PeakRSS covers the task itself only.
+    """
+    # Lazy import: the scheduler imports this module
+    from .scheduler import PeakRSS
+
+    with PeakRSS() as rss:
+        wall, cpu = time.perf_counter(), time.thread_time()
+        result = fn(workload)
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+
+    sent, received = (0, 0) if shared else (_nbytes(workload), _nbytes(result))
+    fragments = getattr(result, "fragments", 0)
+    fragments = fragments if isinstance(fragments, (int, np.integer)) else 0
+    profile = TaskProfile(wall, cpu, int(fragments), _intervals(result), sent, received, rss.peak, shared)
+    return result, profile, rss
+
+
+def profiled(fn: Callable[[W], R], workload: W, shared: bool = False) -> Tuple[R, TaskProfile]:
+    """
+    Run the task and measure it. Shared tasks (executed in threads) don't move any data.
+    """
+    result, profile, _ = measured(fn, workload, shared)
+    return result, profile
+
+
+class Profiler:
+    """
+    Collects per-stage and per-task timings, throughput and memory usage for a single ripper run.
+    """
+
+    def __init__(self, title: str):
+        self.title = title
+        self.started = time.time()
+        self.stages: Dict[str, StageProfile] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        profile = self.stages.setdefault(name, StageProfile(name))
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield profile
+        finally:
+            profile.wall += time.perf_counter() - wall
+            profile.cpu += time.process_time() - cpu
+
+    def record(self, stage: str, task: TaskProfile):
+        self.stages.setdefault(stage, StageProfile(stage)).tasks.append(task)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "started": self.started,
+            "wall": time.time() - self.started,
+            "stages": [x.summarize() for x in self.stages.values()],
+        }
+
+    def summary(self) -> str:
+        report = self.report()
+        lines = [
+            f"Run '{self.title}': {report['wall']:.1f}s",
+            f"{'stage':<20}{'wall,s':>9}{'cpu,s':>9}{'tasks':>7}{'frag/s':>11}{'intervals':>12}"
+            f"{'sent,MB':>9}{'recv,MB':>9}{'peak RSS,MB':>13}"
+        ]
+        for s in report["stages"]:
+            lines.append(
+                f"{s['name']:<20}{s['wall']:>9.2f}{s['cpu']:>9.2f}{s['ntasks']:>7}{s['fragments_per_sec']:>11.0f}"
+                f"{s['intervals']:>12}{s['sent'] / 2 ** 20:>9.1f}{s['received'] / 2 ** 20:>9.1f}"
+                f"{s['peakrss'] / 2 ** 20:>13.1f}"
+            )
+        return "\n".join(lines)
+
+    def save(self, folder: Path):
+        folder.mkdir(parents=True, exist_ok=True)
+        with open(folder.joinpath(f"{self.title}.profile.json"), 'w') as stream:
+            json.dump(self.report(), stream, indent=2)
+        with open(folder.joinpath(f"{self.title}.profile.txt"), 'w') as stream:
+            stream.write(self.summary() + "\n")
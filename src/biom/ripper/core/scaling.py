@@ -1,24 +1,55 @@
+import unittest
 from pathlib import Path
 from typing import List
 
 import numpy as np
-import pandas as pd
-from scipy import stats
+import numpy.typing as npt
 
 from .config import Scaling
 
 
+def size_factors(matrix: npt.NDArray) -> npt.NDArray[np.float64]:
+    """
+    DESeq-like size factors for each column (library) of the count matrix (bins x libraries).
+    Only bins covered in all libraries are used.
+    """
+    matrix = matrix[(matrix > 0).all(axis=1)]
+    assert matrix.size > 0, "There are no bins covered in all libraries"
+
+    logs = np.log(matrix, dtype=np.float64)
+    # Ratio to the geometric mean of each bin
+    ratios = np.exp(logs - logs.mean(axis=1, keepdims=True))
+    return np.median(ratios, axis=0)
+
+
 def median_of_ratios(bins: Path, treatment: List[str], control: List[str]) -> Scaling:
     bins = np.load(bins.as_posix())
-    df = pd.DataFrame(data=bins['matrix'], columns=bins['labels'])
-    df['treatment'] = df[treatment].sum(axis=1)
-    df['control'] = df[control].sum(axis=1)
-    df = df[['treatment', 'control']]
-
-    df = df[(df > 0).all(axis=1)].copy()
+    labels = {x: ind for ind, x in enumerate(bins['labels'])}
+    matrix = bins['matrix']
 
-    df['GeometricMean'] = df.apply(stats.gmean, axis=1)
+    pooled = np.stack([
+        matrix[:, [labels[x] for x in treatment]].sum(axis=1),
+        matrix[:, [labels[x] for x in control]].sum(axis=1)
+    ], axis=1)
 
-    trtscale = (df['treatment'] / df['GeometricMean']).median()
-    cntscale = (df['control'] / df['GeometricMean']).median()
+    trtscale, cntscale = size_factors(pooled)
     return Scaling(np.float32(1 / trtscale), np.float32(1 / cntscale))
+
+
+class SizeFactorsUnitTests(unittest.TestCase):
+    def test_size_factors(self):
+        matrix = np.asarray([
+            [10, 20, 40],
+            [0, 5, 5],
+            [3, 3, 3],
+            [8, 2, 1],
+            [4, 16, 64],
+        ])
+        # Reference: median of ratios to the per-bin geometric mean, zero bins are ignored
+        covered = matrix[(matrix > 0).all(axis=1)].astype(np.float64)
+        gmean = np.prod(covered, axis=1) ** (1 / covered.shape[1])
+        expected = [np.median(covered[:, ind] / gmean) for ind in range(covered.shape[1])]
+        np.testing.assert_allclose(size_factors(matrix), expected)
+
+    def test_size_factors_uncovered(self):
+        self.assertRaises(AssertionError, size_factors, np.asarray([[0, 1], [1, 0]]))
@@ -0,0 +1,332 @@
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import unittest
+from contextlib import nullcontext
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+from joblib import Parallel, delayed
+from joblib.externals.loky import get_reusable_executor
+
+from . import chunks
+from .config import PeakCallingConfig
+from .profile import Profiler, TaskProfile, measured, profiled
+
+W = TypeVar('W')
+R = TypeVar('R')
+
+# Rough memory model used to estimate the peak footprint of each task (in bytes).
+# Use Scheduler.calibration() on a real run to adjust these coefficients.
+# Dense float32 pileup buffer allocated for each contig
+BYTES_PER_BASE = 4
+# Python lists in AlignedBlocksBuilder + numpy blocks + pysam mates waiting for a pair
+BYTES_PER_FRAGMENT = 320
+# int32 end + float32 value, counted several times for intermediate copies
+BYTES_PER_INTERVAL = 24
+
+# How often the worker samples its resident set size
+RSS_SAMPLING_INTERVAL = 0.005
+
+# Hybrid backend: stages decoding BAM files (Python & pysam code holding the GIL) run in worker processes,
+# while numeric stages (nogil kernels & vectorized numpy) run in a thread pool on shared in-memory arrays.
+AUTO = "auto"
+PROCESS_STAGES = frozenset({"pileup"})
+PROCESS_BACKEND = "loky"
+
+
+def parallel(params: PeakCallingConfig.ProcessingParams) -> Parallel:
+    """
+    Joblib pool for the given processing params (the process pool of the hybrid backend).
+    """
+    backend = PROCESS_BACKEND if params.backend == AUTO else params.backend
+    return Parallel(n_jobs=params.threads, backend=backend)
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as stream:
+            return int(stream.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: fallback to the peak RSS of the process
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class PeakRSS:
+    """
+    Track the peak resident set size of the current process while the context is active.
+    Sampling is done in a background thread, which works fine because all heavy kernels release the GIL.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.before = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+    def __enter__(self) -> 'PeakRSS':
+        self.before = self.peak = _rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+    @property
+    def increment(self) -> int:
+        return max(0, self.peak - self.before)
+
+
+@dataclass(frozen=True)
+class TaskRecord:
+    stage: str
+    # Estimated and observed (peak RSS increment) memory footprint in bytes
+    estimate: int
+    observed: int
+    # Resident set size of the worker before the task started
+    baseline: int
+    # The task shared its process with concurrent tasks (thread pool), i.e. the observed footprint is inflated by
+    # them. Such records are excluded from the calibration.
+    shared: bool = False
+
+
+def _measured(fn: Callable[[W], R], workload: W) -> Tuple[R, int, int, Optional[TaskProfile]]:
+    with PeakRSS() as rss:
+        result = fn(workload)
+    return result, rss.before, rss.increment, None
+
+
+def _measured_profiled(fn: Callable[[W], R], workload: W, shared: bool = False) \
+        -> Tuple[R, int, int, Optional[TaskProfile]]:
+    # Only the task itself is measured, not the profiling bookkeeping around it
+    result, profile, rss = measured(fn, workload, shared)
+    return result, rss.before, rss.increment, profile
+
+
+class Scheduler:
+    """
+    Dispatch stage workloads to the worker pool.
+
+    Without a memory budget, this is a thin wrapper around the joblib pool. Otherwise, workloads are admitted
+    one by one, largest first, while the sum of estimated footprints of the in-flight tasks fits the budget.
+    A task that doesn't fit the budget on its own is admitted only when nothing else is running.
+
+    If a profiler is attached, each stage & task is instrumented and recorded in the profiler.
+
+    With the "auto" backend, BAM decoding stages (PROCESS_STAGES) are dispatched to the joblib process pool and
+    all other stages run in a shared thread pool, i.e. without pickling workloads and results.
+    """
+
+    def __init__(self, pool: Parallel, params: PeakCallingConfig.ProcessingParams,
+                 profiler: Optional[Profiler] = None):
+        self.pool = pool
+        self.threads = params.threads
+        self.backend = params.backend
+        self.budget = params.memory_budget
+        self.chunks = params.chunks
+        self.profiler = profiler
+        self.records: List[TaskRecord] = []
+        self._threadpool: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> 'Scheduler':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._threadpool is not None:
+            self._threadpool.shutdown(wait=True)
+            self._threadpool = None
+
+    def stagebackend(self, stage: str) -> str:
+        if self.backend != AUTO:
+            return self.backend
+        return PROCESS_BACKEND if stage in PROCESS_STAGES else "threading"
+
+    def _shared(self, stage: str) -> bool:
+        # Workloads & results are shared with the workers instead of being pickled
+        return self.stagebackend(stage) == "threading"
+
+    def _threads(self) -> ThreadPoolExecutor:
+        if self._threadpool is None:
+            self._threadpool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="ripper")
+        return self._threadpool
+
+    def stage(self, name: str):
+        """
+        Profile a stage executed in the main process (e.g. IO).
+        """
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
+    def _executor(self, stage: str):
+        if self.stagebackend(stage) == "threading":
+            return self._threads()
+        return get_reusable_executor(max_workers=self.threads)
+
+    def map(self, stage: str, fn: Callable[[W], R], workloads: Sequence[W],
+            estimate: Optional[Callable[[W], int]] = None) -> List[R]:
+        with self.stage(stage):
+            if self.budget is None or estimate is None or len(workloads) == 0:
+                return self._map(stage, fn, workloads)
+            return self._admit(stage, fn, workloads, estimate)
+
+    def _chunked(self, fn: Callable[[W], R]) -> Callable[[W], R]:
+        # Enable intra-contig parallelism in the worker (see chunks.parallel)
+        return partial(chunks.scoped, fn, self.chunks) if self.chunks > 1 else fn
+
+    def _map(self, stage: str, fn: Callable[[W], R], workloads: Sequence[W]) -> List[R]:
+        fn = self._chunked(fn)
+        threaded = self.backend == AUTO and self._shared(stage)
+        if self.profiler is None:
+            if threaded:
+                return list(self._threads().map(fn, workloads))
+            return self.pool(delayed(fn)(w) for w in workloads)
+
+        if threaded:
+            profiles = self._threads().map(partial(profiled, fn, shared=True), workloads)
+        else:
+            profiles = self.pool(delayed(profiled)(fn, w, self._shared(stage)) for w in workloads)
+        results = []
+        for result, profile in profiles:
+            self.profiler.record(stage, profile)
+            results.append(result)
+        return results
+
+    def _admit(self, stage: str, fn: Callable[[W], R], workloads: Sequence[W],
+               estimate: Callable[[W], int]) -> List[R]:
+        fn = self._chunked(fn)
+        measured = _measured if self.profiler is None else partial(_measured_profiled, shared=self._shared(stage))
+
+        estimates = [estimate(w) for w in workloads]
+        pending = sorted(range(len(workloads)), key=lambda ind: estimates[ind], reverse=True)
+        results: List[Any] = [None] * len(workloads)
+
+        executor = self._executor(stage)
+        # PeakRSS measures the whole process: concurrent tasks in a thread pool inflate each other's footprint
+        shared = self._shared(stage) and self.threads > 1
+        inflight: Dict[Future, int] = {}
+        allocated = 0
+        try:
+            while pending or inflight:
+                # Admit as many tasks as the budget and the number of workers allow
+                ind = 0
+                while ind < len(pending) and len(inflight) < self.threads:
+                    taskind = pending[ind]
+                    if allocated + estimates[taskind] <= self.budget or not inflight:
+                        if estimates[taskind] > self.budget:
+                            logging.warning(
+                                f"[{stage}] Estimated task footprint ({estimates[taskind]} bytes) exceeds the "
+                                f"memory budget ({self.budget} bytes), running it alone"
+                            )
+                        pending.pop(ind)
+                        future = executor.submit(measured, fn, workloads[taskind])
+                        inflight[future] = taskind
+                        allocated += estimates[taskind]
+                    else:
+                        ind += 1
+
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    taskind = inflight.pop(future)
+                    allocated -= estimates[taskind]
+
+                    result, baseline, observed, profile = future.result()
+                    results[taskind] = result
+                    self.records.append(TaskRecord(stage, estimates[taskind], observed, baseline, shared))
+                    if profile is not None:
+                        self.profiler.record(stage, profile)
+        finally:
+            # Wait for in-flight tasks if something went wrong, the thread pool itself is reused
+            wait(inflight)
+        return results
+
+    def calibration(self) -> Dict[str, float]:
+        """
+        Median observed / estimated footprint ratio for each stage. Values far from 1 indicate that the
+        memory model coefficients must be adjusted. Tasks that ran concurrently in a shared process are ignored.
+        """
+        ratios = {}
+        for stage in set(x.stage for x in self.records):
+            records = [x for x in self.records if x.stage == stage and x.estimate > 0 and not x.shared]
+            if records:
+                ratios[stage] = float(np.median([x.observed / x.estimate for x in records]))
+        return ratios
+
+
+class SchedulerUnitTests(unittest.TestCase):
+    def test_memory_budget(self):
+        params = PeakCallingConfig.ProcessingParams(
+            "f/s", None, {}, threads=4, backend="threading", inflags=0, exflags=0, minmapq=0, memory_budget=10
+        )
+        scheduler = Scheduler(Parallel(n_jobs=1), params)
+
+        lock, inflight, observed = threading.Lock(), [], []
+
+        def job(size: int) -> int:
+            with lock:
+                inflight.append(size)
+                observed.append(sum(inflight))
+            time.sleep(0.01)
+            with lock:
+                inflight.remove(size)
+            return size * 2
+
+        workloads = [1, 7, 3, 5, 2, 2, 9, 4, 12]
+        results = scheduler.map("test", job, workloads, lambda x: x)
+        self.assertEqual(results, [x * 2 for x in workloads])
+        # Oversized task runs alone, others always fit the budget
+        self.assertTrue(all(x <= 10 or x == 12 for x in observed))
+        self.assertEqual(len(scheduler.records), len(workloads))
+        # Concurrent threads share the process RSS, their observations are not used for calibration
+        self.assertTrue(all(x.shared for x in scheduler.records))
+        self.assertEqual(scheduler.calibration(), {})
+
+        scheduler = Scheduler(Parallel(n_jobs=1), replace(params, threads=1))
+        scheduler.map("test", job, workloads, lambda x: x)
+        self.assertEqual(set(scheduler.calibration()), {"test"})
+
+    def test_auto_backend(self):
+        params = PeakCallingConfig.ProcessingParams(
+            "f/s", None, {}, threads=2, backend=AUTO, inflags=0, exflags=0, minmapq=0
+        )
+        with parallel(params) as workers, Scheduler(workers, params) as scheduler:
+            self.assertEqual(scheduler.stagebackend("pileup"), PROCESS_BACKEND)
+            self.assertEqual(scheduler.stagebackend("pvalues"), "threading")
+
+            # Numeric stages run in threads of the main process on the very same objects
+            array = np.arange(10)
+            results = scheduler.map("pvalues", lambda x: (os.getpid(), x), [array, array])
+            self.assertTrue(all(pid == os.getpid() and x is array for pid, x in results))
+
+    def test_threaded_stage_cpu(self):
+        def job(n: int) -> int:
+            return sum(range(n))
+
+        # Threads of the main process are already in its CPU time, the tasks must not be counted twice
+        for backend, threads in ("threading", 1), ("threading", 2), (AUTO, 2):
+            params = PeakCallingConfig.ProcessingParams(
+                "f/s", None, {}, threads=threads, backend=backend, inflags=0, exflags=0, minmapq=0
+            )
+            profiler = Profiler("test")
+            with parallel(params) as workers, Scheduler(workers, params, profiler) as scheduler:
+                scheduler.map("pvalues", job, [2_000_000] * 4)
+            stage = profiler.report()["stages"][0]
+            self.assertEqual(stage["ntasks"], 4)
+            self.assertTrue(all(x["shared"] for x in stage["tasks"]))
+            self.assertLessEqual(stage["cpu"], stage["wall"] * threads + 0.01)
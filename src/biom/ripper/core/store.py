@@ -0,0 +1,77 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable
+
+import numpy as np
+
+from .pileup import Pileup
+
+
+class TrackStore:
+    """
+    On-disk storage for pileups. Each pileup is saved as a pair of .npy files and can be loaded back as
+    memory-mapped arrays, i.e. pages are shared by all processes that load the same pileup.
+
+    File names are derived from keys, so workers can save pileups concurrently with register=False and
+    the owner of the store registers them in the index afterwards.
+    """
+
+    INDEX = "index.json"
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        index = self.folder.joinpath(self.INDEX)
+        if index.is_file():
+            with open(index) as stream:
+                self._index: Dict[str, str] = json.load(stream)
+        else:
+            self._index = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def keys(self):
+        return self._index.keys()
+
+    def _stem(self, key: str) -> str:
+        # Keys are arbitrary strings (e.g. contig names) => use a safe file name instead
+        return self._index.get(key, hashlib.sha1(key.encode()).hexdigest())
+
+    def _paths(self, key: str):
+        stem = self._stem(key)
+        return self.folder.joinpath(f"{stem}.interend.npy"), self.folder.joinpath(f"{stem}.values.npy")
+
+    def _dump(self):
+        with open(self.folder.joinpath(self.INDEX), 'w') as stream:
+            json.dump(self._index, stream)
+
+    def save(self, key: str, pileup: Pileup, register: bool = True):
+        interend, values = self._paths(key)
+        np.save(interend, pileup.interend)
+        np.save(values, pileup.values)
+        if register:
+            self.register([key])
+
+    def register(self, keys: Iterable[str]):
+        for key in keys:
+            self._index[key] = self._stem(key)
+        self._dump()
+
+    def remove(self, key: str):
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+        if self._index.pop(key, None) is not None:
+            self._dump()
+
+    def intervals(self, key: str) -> int:
+        # Number of intervals without loading the pileup
+        return np.load(self._paths(key)[1], mmap_mode='r').size
+
+    def load(self, key: str, id: str, mmap: bool = True) -> Pileup:
+        # Copy-on-write => pages are shared until someone modifies the pileup
+        mode = 'c' if mmap else None
+        interend, values = self._paths(key)
+        return Pileup(id, np.load(interend, mmap_mode=mode), np.load(values, mmap_mode=mode))
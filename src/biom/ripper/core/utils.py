@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Generic, List, Tuple, TypeVar
+from typing import Dict, Generic, List, Tuple, TypeVar
 
 from pysam import AlignmentFile
 
@@ -19,3 +19,12 @@ def fetch_contigs(inbam: List[Path]) -> Tuple[str]:
         for contig in AlignmentFile(b, 'rb').references:
             contigs.add(contig)
     return tuple(contigs)
+
+
+def fetch_contiglens(inbam: List[Path]) -> Dict[str, int]:
+    contiglens = {}
+    for b in inbam:
+        with AlignmentFile(b, 'rb') as bam:
+            for contig, length in zip(bam.references, bam.lengths):
+                assert contiglens.setdefault(contig, length) == length, f"Inconsistent length of {contig}"
+    return contiglens
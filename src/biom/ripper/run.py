@@ -1,65 +1,126 @@
 import copy
+import dataclasses
+import logging
+from functools import partial
 from itertools import chain
-
-from joblib import Parallel, delayed
+from pathlib import Path
+from typing import Dict, List, Optional, Union
 
 from . import core
 from .core import pipeline
 from .core.config import PeakCallingConfig
+from .core.profile import Profiler
+from .core.scheduler import Scheduler, parallel
+from .core.store import TrackStore
+
+
+def report(config: PeakCallingConfig, pool: Scheduler):
+    if pool.records:
+        logging.info(f"Observed / estimated memory footprint: {pool.calibration()}")
+    if pool.profiler is not None and config.saveto.profile is not None:
+        pool.profiler.save(config.saveto.profile)
+        logging.info(pool.profiler.summary())
 
 
 def run(config: PeakCallingConfig):
-    with Parallel(n_jobs=config.process.threads, backend=config.process.backend) as pool:
-        pileups = pipeline.run(config, pool)
+    if config.process.streaming:
+        # Lazy import: the streaming mode reuses report() from this module
+        from .stream import run as stream
+        return stream(config)
+
+    profiler = Profiler(config.saveto.title) if config.saveto.profile is not None else None
+    with parallel(config.process) as workers, Scheduler(workers, config.process, profiler) as pool:
+        try:
+            windows = pipeline.regions.windows(config)
+            process(config, pool, windows, pipeline.run(config, pool, windows))
+        finally:
+            report(config, pool)
+
+
+def fromtracks(config: PeakCallingConfig, source: Union[Path, TrackStore], title: Optional[str] = None):
+    """
+    Call peaks from normalized pileups saved by a previous run without accessing BAM files: either the
+    saveto.pileup folder with `<title>.trt/.cnt` BigWigs or a TrackStore (see pipeline.tracks).
+    Target contigs (config.contigs) are respected, while packing and target regions are not applicable.
+    """
+    params = dataclasses.replace(config.process, packing=None)
+    config = dataclasses.replace(config, process=params, regions=None)
 
-        # Convert to tracks and save pileups
-        if config.saveto.pileup:
+    profiler = Profiler(config.saveto.title) if config.saveto.profile is not None else None
+    with parallel(config.process) as workers, Scheduler(workers, config.process, profiler) as pool:
+        try:
+            pileups = pipeline.tracks.load(pool, source, title, config.contigs)
+            process(config, pool, {}, pileups)
+        finally:
+            report(config, pool)
+
+
+def process(config: PeakCallingConfig, pool: Scheduler, windows: Dict[str, pipeline.regions.Window],
+            pileups: List[pipeline.pipeline.Results]):
+    # Small contigs (pipeline.packing) and target windows (pipeline.regions) are converted back to contigs
+    # only when saving results
+    packs = pipeline.packing.plan(config, windows)
+
+    def unpack(results: List[core.functors.Result]) -> List[core.functors.Result]:
+        return pipeline.regions.unpack(pipeline.packing.unpack(results, packs), windows)
+
+    # Convert to tracks and save pileups
+    if config.saveto.pileup:
+        with pool.stage("save.pileup"):
             for key, title in (lambda x: x.trtpileup, f"{config.saveto.title}.trt"), \
                               (lambda x: x.cntpileup, f"{config.saveto.title}.cnt"):
                 tracks = [core.functors.Result.from_pileup(key(x), x.contiglen, x.trstrand) for x in pileups]
+                tracks = unpack(tracks)
                 core.io.tobigwig(tracks, config.saveto.pileup, title)
                 del tracks
 
-        # Calculate fold enrichment
-        # fe = [core.functors.foldenrichment.calculate(w) for w in pileups]
-        fe = pool(delayed(core.functors.foldenrichment.calculate)(w) for w in pileups)
-        if config.saveto.enrichment:
-            core.io.tobigwig(fe, config.saveto.enrichment, config.saveto.title)
+    # Calculate fold enrichment
+    # fe = [core.functors.foldenrichment.calculate(w) for w in pileups]
+    fe = pool.map("foldenrichment", core.functors.foldenrichment.calculate, pileups, pipeline.pipeline.footprint)
+    if config.saveto.enrichment:
+        with pool.stage("save.enrichment"):
+            core.io.tobigwig(unpack(fe), config.saveto.enrichment, config.saveto.title)
 
-        if config.saveto.pvpeaks is None and config.saveto.fdrpeaks is None and config.saveto.pvtrack is None:
-            return
+    if config.saveto.pvpeaks is None and config.saveto.fdrpeaks is None and config.saveto.pvtrack is None:
+        return
 
-        # Calculate p-values
-        # pvalues = [core.functors.pvalues.calculate(w) for w in pileups]
-        pvalues = pool(delayed(core.functors.pvalues.calculate)(w) for w in pileups)
-        pvalues, pcounts = zip(*pvalues)
+    # Calculate p-values
+    # pvalues = [core.functors.pvalues.calculate(w) for w in pileups]
+    pvalues = pool.map("pvalues", core.functors.pvalues.calculate, pileups, pipeline.pipeline.footprint)
+    pvalues, pcounts = zip(*pvalues)
 
-        print("PVTRACK", config.saveto.pvtrack)
-        if config.saveto.pvtrack is not None:
-            print("ASDA")
-            core.io.tobigwig(pvalues, config.saveto.pvtrack, config.saveto.title)
+    if config.saveto.pvtrack is not None:
+        with pool.stage("save.pvtrack"):
+            core.io.tobigwig(unpack(pvalues), config.saveto.pvtrack, config.saveto.title)
 
-        # Calculate q-values
+    # Calculate q-values
+    with pool.stage("pqtable"):
         pqtable = core.functors.qvalues.make_pqtable(pcounts)
-        # qvalues = [core.functors.qvalues.apply_pqtable(w, pqtable) for w in pvalues]
-        qvalues = pool(delayed(core.functors.qvalues.apply_pqtable)(w, pqtable) for w in pvalues)
-        # core.io.tobigwig(pvalues, config.saveto.enrichment, f"{config.saveto.title}.qvalue")
-
-        # Call peaks using various cutoffs
-        workload = []
-        if config.saveto.pvpeaks and config.callp.pvcutoff is not None:
-            callp = copy.deepcopy(config.callp)
-            callp.qvcutoff = None
-            workload.append((callp, config.saveto.pvpeaks))
-        if config.saveto.fdrpeaks and config.callp.qvcutoff is not None:
-            callp = copy.deepcopy(config.callp)
-            callp.pvcutoff = None
-            workload.append((callp, config.saveto.fdrpeaks))
-
-        for callp, saveto in workload:
-            workload = core.functors.callpeaks.PeakCalingWorkload.build(pvalues, qvalues, fe, callp)
-            # peaks = [core.functors.callpeaks.calculate(w) for w in workload]
-            peaks = pool(delayed(core.functors.callpeaks.calculate)(w) for w in workload)
-            peaks = list(chain(*peaks))
+    # qvalues = [core.functors.qvalues.apply_pqtable(w, pqtable) for w in pvalues]
+    qvalues = pool.map(
+        "qvalues", partial(core.functors.qvalues.apply_pqtable, table=pqtable), pvalues,
+        lambda x: x.track.values.size * core.scheduler.BYTES_PER_INTERVAL
+    )
+    # core.io.tobigwig(pvalues, config.saveto.enrichment, f"{config.saveto.title}.qvalue")
+
+    # Call peaks using various cutoffs
+    workload = []
+    if config.saveto.pvpeaks and config.callp.pvcutoff is not None:
+        callp = copy.deepcopy(config.callp)
+        callp.qvcutoff = None
+        workload.append((callp, config.saveto.pvpeaks))
+    if config.saveto.fdrpeaks and config.callp.qvcutoff is not None:
+        callp = copy.deepcopy(config.callp)
+        callp.pvcutoff = None
+        workload.append((callp, config.saveto.fdrpeaks))
+
+    for callp, saveto in workload:
+        workload = core.functors.callpeaks.PeakCalingWorkload.build(pvalues, qvalues, fe, callp)
+        # peaks = [core.functors.callpeaks.calculate(w) for w in workload]
+        peaks = pool.map(
+            "callpeaks", partial(pipeline.packing.calculate, packs=packs), workload, core.functors.callpeaks.footprint
+        )
+        peaks = pipeline.regions.peaks(list(chain(*peaks)), windows)
 
+        with pool.stage("save.peaks"):
             core.io.tobed(peaks, saveto.joinpath(f"{config.saveto.title}.narrowPeak"))
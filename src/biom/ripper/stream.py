@@ -0,0 +1,226 @@
+import copy
+import logging
+import tempfile
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import core
+from .core import pipeline
+from .core.config import PeakCallingConfig
+from .core.functors.result import Peak
+from .core.pileup import Pileup
+from .core.pipeline import pileup, postprocess
+from .core.profile import Profiler
+from .core.scheduler import BYTES_PER_INTERVAL, Scheduler, parallel
+from .core.store import TrackStore
+from .core.utils import Stranded
+
+TREATMENT, CONTROL = pipeline.pipeline.TREATMENT, pipeline.pipeline.CONTROL
+# Store sections: raw & normalized pileups, fold enrichment and p-value tracks
+RAW, NORMALIZED, FE, PVALUES = "raw", "normalized", "fe", "pvalues"
+STRANDS = ("+", "-")
+
+
+def _key(section: str, tag: str, contig: str, strand: str) -> str:
+    return f"{section}/{tag}/{contig}/{strand}"
+
+
+@dataclass(frozen=True)
+class Spilled:
+    # Summary of a pileup.Results object spilled to the store
+    contig: str
+    contiglen: np.int32
+    fragments: int
+    tags: Any
+
+
+@dataclass(frozen=True)
+class ContigWorkload:
+    contig: str
+    contiglen: np.int32
+    store: TrackStore
+
+
+@dataclass(frozen=True)
+class HistogramWorkload(ContigWorkload):
+    # (genome baseline, min fragments, scaling) for each tag, see pipeline.baselines
+    baselines: Dict[str, Tuple[float, float, np.float32]]
+
+
+@dataclass(frozen=True)
+class PeaksWorkload(ContigWorkload):
+    pqtable: Dict[float, float]
+    callp: List[PeakCallingConfig.PeakCallingParams]
+    # Spill fold enrichment / p-value tracks to save them later
+    spillfe: bool
+    spillpv: bool
+
+
+def _pileup(workload: pileup.Workload, store: TrackStore) -> Spilled:
+    r = pileup.run(workload)
+    for strand, p in zip(STRANDS, (r.genomic.fwd, r.genomic.rev)):
+        store.save(_key(RAW, r.tags, r.contig, strand), p, register=False)
+    return Spilled(r.contig, r.contiglen, r.fragments, r.tags)
+
+
+def _footprint(w: ContigWorkload, section: str) -> int:
+    intervals = sum(w.store.intervals(_key(section, tag, w.contig, strand)) for tag in (TREATMENT, CONTROL)
+                    for strand in STRANDS)
+    return intervals * BYTES_PER_INTERVAL
+
+
+def _load(w: ContigWorkload, section: str, tag: str) -> Stranded[Pileup]:
+    return Stranded(*(w.store.load(_key(section, tag, w.contig, strand), w.contig) for strand in STRANDS))
+
+
+def _regroup(w: ContigWorkload, strand: str) -> pipeline.pipeline.Results:
+    trt, cnt = (w.store.load(_key(NORMALIZED, tag, w.contig, strand), w.contig) for tag in (TREATMENT, CONTROL))
+    return pipeline.pipeline.Results(w.contig, w.contiglen, strand, trt, cnt)
+
+
+def _histogram(w: HistogramWorkload) -> List[Dict[float, int]]:
+    # Normalize raw pileups and replace them in the store
+    for tag in TREATMENT, CONTROL:
+        gmbaseline, minfragments, scale = w.baselines[tag]
+        raw = pileup.Results(w.contig, w.contiglen, 0, _load(w, RAW, tag), tag)
+        normalized = postprocess.run(postprocess.Workload(
+            pileup=raw, gmbaseline=gmbaseline, scale=scale, minfragments=np.float32(minfragments)
+        ))
+        for strand, p in zip(STRANDS, (normalized.pileup.fwd, normalized.pileup.rev)):
+            w.store.save(_key(NORMALIZED, tag, w.contig, strand), p, register=False)
+            w.store.remove(_key(RAW, tag, w.contig, strand))
+
+    # P-value histograms, the tracks themselves are recomputed in the second phase
+    return [core.functors.pvalues.calculate(_regroup(w, strand))[1] for strand in STRANDS]
+
+
+def _peaks(w: PeaksWorkload) -> List[List[Peak]]:
+    peaks = [[] for _ in w.callp]
+    for strand in STRANDS:
+        workload = _regroup(w, strand)
+        fe = core.functors.foldenrichment.calculate(workload)
+        pv, _ = core.functors.pvalues.calculate(workload)
+        qv = core.functors.qvalues.apply_pqtable(pv, w.pqtable)
+
+        for spill, section, result in (w.spillfe, FE, fe), (w.spillpv, PVALUES, pv):
+            if spill:
+                track = Pileup(w.contig, result.track.bounds[1:], result.track.values)
+                w.store.save(_key(section, "", w.contig, strand), track, register=False)
+
+        for ind, callp in enumerate(w.callp):
+            for x in core.functors.callpeaks.PeakCalingWorkload.build([pv], [qv], [fe], callp):
+                peaks[ind].extend(core.functors.callpeaks.calculate(x))
+    return peaks
+
+
+def _save(contiglens: Dict[str, int], store: TrackStore, section: str, tag: str, folder: Path, title: str):
+    def load(contig: str, strand: str) -> core.functors.Track:
+        track = store.load(_key(section, tag, contig, strand), contig)
+        return core.functors.Track.from_pileup(track.interend, track.values)
+
+    core.io.streambigwig(contiglens, load, folder, title)
+
+
+def process(config: PeakCallingConfig, pool: Scheduler, store: TrackStore):
+    # Phase 1: compute and spill raw pileups, workers return only the number of fragments
+    workloads = []
+    prconfigs = pipeline.pipeline.processing(config)
+    files = {TREATMENT: config.treatment, CONTROL: config.control}
+    for contig in pipeline.pipeline.contigs(config):
+        for tag in TREATMENT, CONTROL:
+            workloads.append(pileup.Workload(contig=contig, bamfiles=files[tag], params=prconfigs[tag], tags=tag))
+    spilled = pool.map("pileup", partial(_pileup, store=store), workloads, pileup.footprint)
+
+    trtfragments = sum(x.fragments for x in spilled if x.tags == TREATMENT)
+    cntfragments = sum(x.fragments for x in spilled if x.tags == CONTROL)
+    # Targeted mode is not supported, i.e. there are no windows
+    baselines = pipeline.pipeline.baselines(config, {}, trtfragments, cntfragments)
+
+    contiglens: Dict[str, np.int32] = {}
+    for x in spilled:
+        assert contiglens.setdefault(x.contig, x.contiglen) == x.contiglen
+    del spilled
+
+    # Phase 1: normalize pileups and collect genome-wide p-value histograms
+    workloads = [HistogramWorkload(contig, contiglen, store, baselines) for contig, contiglen in contiglens.items()]
+    histograms = pool.map("histogram", _histogram, workloads, partial(_footprint, section=RAW))
+    # Workers don't touch the index, normalized pileups are registered here so that kept stores can be reloaded
+    # by ripper.fromtracks (see pipeline.tracks)
+    store.register([
+        _key(NORMALIZED, tag, contig, strand) for contig in contiglens for tag in (TREATMENT, CONTROL)
+        for strand in STRANDS
+    ])
+    with pool.stage("pqtable"):
+        pqtable = core.functors.qvalues.make_pqtable([x for pcounts in histograms for x in pcounts])
+    del histograms
+
+    # Phase 2: recompute tracks for each contig, apply the global pq-table and call peaks
+    callp, saveto = [], []
+    if config.saveto.pvpeaks and config.callp.pvcutoff is not None:
+        callp.append(copy.deepcopy(config.callp))
+        callp[-1].qvcutoff = None
+        saveto.append(config.saveto.pvpeaks)
+    if config.saveto.fdrpeaks and config.callp.qvcutoff is not None:
+        callp.append(copy.deepcopy(config.callp))
+        callp[-1].pvcutoff = None
+        saveto.append(config.saveto.fdrpeaks)
+
+    spillfe, spillpv = config.saveto.enrichment is not None, config.saveto.pvtrack is not None
+    workloads = [
+        PeaksWorkload(contig, contiglen, store, pqtable, callp, spillfe, spillpv)
+        for contig, contiglen in contiglens.items()
+    ]
+    peaks = pool.map("callpeaks", _peaks, workloads, partial(_footprint, section=NORMALIZED))
+
+    # Stream tracks from the store contig by contig
+    title = config.saveto.title
+    if config.saveto.pileup:
+        with pool.stage("save.pileup"):
+            _save(contiglens, store, NORMALIZED, TREATMENT, config.saveto.pileup, f"{title}.trt")
+            _save(contiglens, store, NORMALIZED, CONTROL, config.saveto.pileup, f"{title}.cnt")
+    if spillfe:
+        with pool.stage("save.enrichment"):
+            _save(contiglens, store, FE, "", config.saveto.enrichment, title)
+    if spillpv:
+        with pool.stage("save.pvtrack"):
+            _save(contiglens, store, PVALUES, "", config.saveto.pvtrack, title)
+
+    with pool.stage("save.peaks"):
+        for ind, folder in enumerate(saveto):
+            core.io.tobed([p for contig in peaks for p in contig[ind]], folder.joinpath(f"{title}.narrowPeak"))
+
+
+def run(config: PeakCallingConfig, spillto: Optional[Path] = None, keep: Optional[Path] = None):
+    """
+    Two-phase streaming peak calling with memory bounded by a single contig (per worker).
+
+    Phase 1 computes pileups, spills them to disk and collects genome-wide p-value histograms. Phase 2 reloads
+    normalized pileups for each contig, recomputes fold enrichment & p-values, applies the global pq-table and
+    calls peaks. Output tracks are streamed from disk contig by contig. Target regions and packing of small contigs
+    are not supported.
+
+    Tracks are spilled to a temporary folder (under `spillto` or config.process.spillto) removed after the run.
+    If `keep` is given, they are spilled to this folder instead and kept: normalized pileups can be used later to
+    call peaks with other cutoffs via ripper.fromtracks(config, TrackStore(keep)).
+    """
+    from .run import report
+
+    assert config.regions is None, "Targeted (regions) mode is not supported by streaming runs"
+    assert not config.process.packing, "Packing of small contigs is not supported by streaming runs"
+    spillto = spillto if spillto is not None else config.process.spillto
+    profiler = Profiler(config.saveto.title) if config.saveto.profile is not None else None
+    if keep is not None:
+        folder = nullcontext(keep)
+    else:
+        folder = tempfile.TemporaryDirectory(prefix="ripper-stream-", dir=spillto)
+    with parallel(config.process) as workers, Scheduler(workers, config.process, profiler) as pool, folder as folder:
+        logging.info(f"Streaming run, spilling tracks to {folder}")
+        try:
+            process(config, pool, TrackStore(Path(folder)))
+        finally:
+            report(config, pool)
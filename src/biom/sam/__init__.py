@@ -1 +1,3 @@
-from . import strdeductor
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(__name__, submodules=["strdeductor", "synthetic"])
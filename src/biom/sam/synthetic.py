@@ -0,0 +1,136 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import pysam
+
+
+@dataclass(frozen=True)
+class Design:
+    # Contig name -> length
+    contigs: dict[str, int]
+    # Total number of (primary) fragments, distributed across contigs proportionally to their length
+    fragments: int
+    # Fragment & read length ranges [min, max)
+    fraglen: tuple[int, int] = (150, 400)
+    readlen: int = 50
+    # Fraction of fragments where the left mate is spliced and the intron length range [min, max)
+    spliced: float = 0.0
+    intron: tuple[int, int] = (100, 1000)
+    # Fraction of fragments with an additional secondary (256 flag) alignment elsewhere on the same contig
+    multimappers: float = 0.0
+    # Stranding protocol used to place mates relative to the transcription strand
+    protocol: Literal["f/s", "s/f"] = "f/s"
+    # Fraction of fragments sampled around a given number of enriched sites (ChIP/CLIP-like signal)
+    hotspots: int = 0
+    enrichment: float = 0.0
+    mapq: int = 60
+    seed: int = 0
+
+    def __post_init__(self):
+        assert self.contigs and self.fragments >= 0
+        assert 0 < self.readlen <= self.fraglen[0] < self.fraglen[1]
+        assert 0 <= self.spliced <= 1 and 0 <= self.multimappers <= 1 and 0 <= self.enrichment <= 1
+        assert self.protocol in ("f/s", "s/f")
+        minlen = self.fraglen[1] + self.intron[1]
+        assert all(x > minlen for x in self.contigs.values()), f"All contigs must be longer than {minlen}"
+
+
+@dataclass(frozen=True)
+class Summary:
+    # Number of primary fragments for each contig & transcription strand
+    fragments: dict[tuple[str, str], int] = field(default_factory=dict)
+    # Total number of secondary alignments (pairs)
+    secondary: int = 0
+
+
+def _placements(design: Design, rng: np.random.Generator, contiglen: int, n: int) -> dict[str, np.ndarray]:
+    fraglen = rng.integers(*design.fraglen, size=n)
+    start = rng.integers(0, contiglen - design.fraglen[1] - design.intron[1], size=n)
+    if design.hotspots > 0 and design.enrichment > 0:
+        centers = rng.integers(0, contiglen, size=design.hotspots)
+        enriched = rng.random(n) < design.enrichment
+        start[enriched] = rng.normal(centers[rng.integers(0, design.hotspots, size=enriched.sum())], 100)
+        start = np.clip(start, 0, contiglen - design.fraglen[1] - design.intron[1])
+
+    intron = np.where(rng.random(n) < design.spliced, rng.integers(*design.intron, size=n), 0)
+    return {
+        "start": start,
+        "fraglen": fraglen,
+        # Spliced left mate => shift the right mate downstream
+        "intron": intron,
+        "donor": rng.integers(1, design.readlen, size=n),
+        "forward": rng.random(n) < 0.5,
+    }
+
+
+def _segments(design: Design, contigid: int, name: str, p: dict, ind: int, secondary: bool):
+    start, fraglen, intron = int(p["start"][ind]), int(p["fraglen"][ind]), int(p["intron"][ind])
+    donor, forward = int(p["donor"][ind]), bool(p["forward"][ind])
+    readlen = design.readlen
+
+    lstart, rstart = start, start + fraglen + intron - readlen
+    lcigar = f"{donor}M{intron}N{readlen - donor}M" if intron > 0 else f"{readlen}M"
+    rcigar = f"{readlen}M"
+
+    # f/s: the first mate is reverse-complementary to the transcript
+    read1left = forward != (design.protocol == "f/s")
+
+    segments = []
+    for isleft, refstart, cigar, materefstart in (True, lstart, lcigar, rstart), (False, rstart, rcigar, lstart):
+        isread1 = isleft == read1left
+        segment = pysam.AlignedSegment()
+        segment.query_name = name
+        segment.query_sequence = "A" * readlen
+        segment.query_qualities = pysam.qualitystring_to_array("I" * readlen)
+        segment.reference_id = contigid
+        segment.reference_start = refstart
+        segment.cigarstring = cigar
+        segment.mapping_quality = design.mapq
+        segment.next_reference_id = contigid
+        segment.next_reference_start = materefstart
+        segment.template_length = (fraglen + intron) * (1 if isleft else -1)
+        segment.flag = 0x1 | 0x2 | (0x40 if isread1 else 0x80) | (0x20 if isleft else 0x10) | \
+                       (0x100 if secondary else 0)
+        segments.append(segment)
+    return segments
+
+
+def write(saveto: Path, design: Design) -> Summary:
+    """
+    Write a deterministic, coordinate-sorted and indexed paired-end BAM file.
+    """
+    rng = np.random.default_rng(design.seed)
+    header = {
+        'HD': {'VN': '1.6', 'SO': 'coordinate'},
+        'SQ': [{'SN': contig, 'LN': length} for contig, length in design.contigs.items()]
+    }
+    total = sum(design.contigs.values())
+
+    summary, secondary = {}, 0
+    with pysam.AlignmentFile(saveto.as_posix(), 'wb', header=header) as bam:
+        for contigid, (contig, contiglen) in enumerate(design.contigs.items()):
+            n = design.fragments * contiglen // total
+            primary = _placements(design, rng, contiglen, n)
+
+            multi = np.nonzero(rng.random(n) < design.multimappers)[0]
+            other = _placements(design, rng, contiglen, multi.size)
+
+            # Strand of each fragment
+            fwd = int(primary["forward"].sum())
+            summary[(contig, "+")] = fwd
+            summary[(contig, "-")] = n - fwd
+            secondary += multi.size
+
+            # Collect all segments and write them sorted by the start position
+            segments = []
+            for ind in range(n):
+                segments.extend(_segments(design, contigid, f"{contig}:{ind}", primary, ind, False))
+            for ind, fragment in enumerate(multi):
+                segments.extend(_segments(design, contigid, f"{contig}:{fragment}", other, ind, True))
+            segments.sort(key=lambda x: x.reference_start)
+            for s in segments:
+                bam.write(s)
+    pysam.index(saveto.as_posix())
+    return Summary(summary, secondary)
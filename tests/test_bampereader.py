@@ -1,11 +1,30 @@
-from biom.ripper.core import fragments
+import tempfile
 from pathlib import Path
 
-deductor = fragments.strdeductors.get("f/s")
-folder = Path("/home/alnfedorov/tmp")
-for bam in folder.glob("*.bam"):
-    print(bam)
-    ab = fragments.loadfrom(
-        [bam],
-        deductor, contig='16', inflags=3, exflags=2564, minmapq=1
+from biom.ripper.core import fragments
+from biom.sam import synthetic
+
+folder = Path(tempfile.mkdtemp())
+for protocol in "f/s", "s/f":
+    deductor = fragments.strdeductors.get(protocol)
+    design = synthetic.Design(
+        {"1": 20_000, "16": 10_000}, 2_000, spliced=0.25, multimappers=0.1, protocol=protocol, seed=13
     )
+    bam = folder.joinpath("synthetic.bam")
+    summary = synthetic.write(bam, design)
+
+    for contig in design.contigs:
+        # Secondary alignments are excluded => only primary fragments are loaded
+        ab, contiglen = fragments.loadfrom(
+            [bam],
+            deductor, contig=contig, inflags=3, exflags=2564 | 256, minmapq=1
+        )
+        assert contiglen == design.contigs[contig]
+        for strand, blocks in ("+", ab.fwd), ("-", ab.rev):
+            assert sum(x.records.size - 1 for x in blocks) == summary.fragments[(contig, strand)]
+            assert all(x.trstrand == strand for x in blocks)
+
+        # Secondary alignments are paired as well
+        ab, _ = fragments.loadfrom([bam], deductor, contig=contig, inflags=3, exflags=2564, minmapq=1)
+        loaded = sum(x.records.size - 1 for x in ab.fwd + ab.rev)
+        assert loaded > summary.fragments[(contig, "+")] + summary.fragments[(contig, "-")]
@@ -0,0 +1,73 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pysam
+
+from biom.ripper.core import bins
+from biom.ripper.core.scaling import size_factors
+
+# Hand-made fragments: (left mate start, left mate length, right mate start, right mate length)
+FRAGMENTS = {
+    "1": [
+        # [100, 230), center 165
+        (100, 50, 180, 50),
+        # Right mate is contained in the left one: [1000, 1100), center 1050
+        (1000, 100, 1010, 20),
+        # Overlapping mates: [400, 470), center 435
+        (400, 60, 420, 50),
+    ],
+    "2": [],
+}
+CONTIGS = {"1": 2_000, "2": 500}
+
+
+def write(saveto: Path, fragments: dict[str, list[tuple[int, int, int, int]]]):
+    header = {'HD': {'VN': '1.6', 'SO': 'coordinate'}, 'SQ': [{'SN': c, 'LN': n} for c, n in CONTIGS.items()]}
+    segments = []
+    for contigid, contig in enumerate(CONTIGS):
+        for ind, (lstart, llen, rstart, rlen) in enumerate(fragments.get(contig, [])):
+            tlen = max(lstart + llen, rstart + rlen) - lstart
+            for isleft, start, length, matestart in (True, lstart, llen, rstart), (False, rstart, rlen, lstart):
+                segment = pysam.AlignedSegment()
+                segment.query_name = f"{contig}:{ind}"
+                segment.query_sequence = "A" * length
+                segment.query_qualities = pysam.qualitystring_to_array("I" * length)
+                segment.reference_id = segment.next_reference_id = contigid
+                segment.reference_start, segment.next_reference_start = start, matestart
+                segment.cigarstring = f"{length}M"
+                segment.mapping_quality = 60
+                segment.template_length = tlen if isleft else -tlen
+                # f/s: read2 is the left (forward) mate of forward fragments
+                segment.flag = 0x1 | 0x2 | (0x80 if isleft else 0x40) | (0x20 if isleft else 0x10)
+                segments.append(segment)
+    segments.sort(key=lambda x: (x.reference_id, x.reference_start))
+    with pysam.AlignmentFile(saveto.as_posix(), 'wb', header=header) as bam:
+        for segment in segments:
+            bam.write(segment)
+    pysam.index(saveto.as_posix())
+
+
+folder = Path(tempfile.mkdtemp())
+write(folder / "a.bam", FRAGMENTS)
+write(folder / "b.bam", {"1": FRAGMENTS["1"][:1] * 3, "2": [(10, 50, 300, 50)]})
+
+counted = bins.count([folder / "a.bam", folder / "b.bam"], 40, "f/s", inflags=3, exflags=2820, minmapq=1,
+                     labels=["a", "b"])
+assert counted.labels.tolist() == ["a", "b"] and counted.binsize == 40
+# 50 bins for contig 1 & 13 for contig 2
+assert counted.contig.tolist() == ["1"] * 50 + ["2"] * 13
+assert counted.start.tolist() == list(range(0, 2_000, 40)) + list(range(0, 500, 40))
+expected = np.zeros((63, 2), dtype=np.int64)
+expected[165 // 40, 0] = expected[1050 // 40, 0] = expected[435 // 40, 0] = 1
+expected[165 // 40, 1] = 3
+# Contig 2 fragment [10, 350), center 180
+expected[50 + 180 // 40, 1] = 1
+assert np.array_equal(counted.matrix, expected), np.argwhere(counted.matrix != expected)
+
+# Size factors: bins (4, 2), (1, 4) & (2, 2) have geometric means 2√2, 2, 2, i.e. ratios to them are
+# (√2, 1/√2), (1/2, 2) & (1, 1) and medians are 1 & 1 (the zero bin is ignored)
+factors = size_factors(np.asarray([[4, 2], [1, 4], [0, 7], [2, 2]]))
+assert np.allclose(factors, [1, 1])
+factors = size_factors(np.asarray([[2, 8], [3, 12], [5, 20]]))
+assert np.allclose(factors, [0.5, 2])
@@ -0,0 +1,48 @@
+import dataclasses
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from biom import ripper
+from biom.ripper.core.config import PeakCallingConfig, Scaling
+from biom.sam import synthetic
+
+# Peak calling from saved pileup tracks must reproduce the original run without BAM files
+folder = Path(tempfile.mkdtemp())
+contigs = {"1": 40_000, "2": 20_000}
+synthetic.write(folder / "treatment.bam", synthetic.Design(contigs, 4_000, hotspots=10, enrichment=0.4, seed=3))
+synthetic.write(folder / "control.bam", synthetic.Design(contigs, 4_000, seed=4))
+
+
+def config(saveto: Path, pileup: bool) -> PeakCallingConfig:
+    for x in "pileup", "fe", "pvtrack", "pv", "fdr":
+        saveto.joinpath(x).mkdir(parents=True)
+    return PeakCallingConfig(
+        treatment=[folder / "treatment.bam"], control=[folder / "control.bam"], contigs=None, geffsize=60_000,
+        process=PeakCallingConfig.ProcessingParams(
+            "f/s", Scaling(np.float32(1), np.float32(1)), defaultdict(lambda: [0, 500]), threads=1,
+            backend="threading", inflags=3, exflags=2820, minmapq=1
+        ),
+        callp=PeakCallingConfig.PeakCallingParams(qvcutoff=0.05, pvcutoff=0.01, fecutoff=1.5),
+        saveto=PeakCallingConfig.Saveto(
+            "test", saveto / "pileup" if pileup else None, saveto / "fe", saveto / "pvtrack", saveto / "pv",
+            saveto / "fdr"
+        )
+    )
+
+
+original = config(folder / "original", True)
+ripper.run(original)
+reloaded = config(folder / "reloaded", False)
+ripper.fromtracks(dataclasses.replace(reloaded, treatment=[], control=[]), folder / "original" / "pileup", "test")
+
+files = sorted(x.relative_to(folder / "reloaded") for x in (folder / "reloaded").rglob("*") if x.is_file())
+assert len(files) == 6
+for file in files:
+    original, reloaded = (folder / "original" / file).read_bytes(), (folder / "reloaded" / file).read_bytes()
+    # Peaks are written in the order of contigs, which might differ
+    if file.suffix == ".narrowPeak":
+        original, reloaded = sorted(original.splitlines()), sorted(reloaded.splitlines())
+    assert original == reloaded, file
@@ -1,3 +1,7 @@
+import gzip
+import math
+import pickle
+import sys
 import tempfile
 from pathlib import Path
 
@@ -5,7 +9,7 @@ from biom import gindex
 from biom.gindex import Annotator
 
 
-def make_annotator(disambigfn, annotatefn) -> Annotator:
+def make_annotator(disambigfn, annotatefn, precompute=False) -> Annotator:
     intervals = {
         ('1', '+'): [(1, 3), (5, 8)],
         ('2', '-'): [(0, 2), (3, 6), (9, 10), (5, 10)],
@@ -31,7 +35,7 @@ def make_annotator(disambigfn, annotatefn) -> Annotator:
                 gindex.from_bed(Path(bed.name))
             )
     index = gindex.merge(*trees)
-    return Annotator(index, disambiguation=disambigfn, annotation=annotatefn)
+    return Annotator(index, disambiguation=disambigfn, annotation=annotatefn, precompute=precompute)
 
 
 # Annotation blocks:
@@ -91,3 +95,203 @@ fractional = make_annotator(
 assert fractional.annotatei('2', '-', [(0, 2)]) == {'0': 1.0}
 assert fractional.annotatei('2', '-', [(0, 2), (3, 5)]) == {'0': 0.5, '1': 0.5}
 assert fractional.annotatei('2', '-', [(0, 2), (3, 5), (6, 9)]) == {'0': 2 / 7, '1': 2 / 7, '3': 3 / 7}
+
+# Bulk annotation must agree with record-by-record annotation
+records = {
+    '1': {'+': [[(1, 3)], [(0, 3)], [(1, 4)], [(0, 5)], [(0, 3), (5, 8)]]},
+    '2': {
+        '+': [[(0, 10)], [(1, 5), (5, 10)], [(1, 2), (3, 4), (5, 11)], [(0, 1), (1, 2), (2, 3)], [(10, 50), (55, 100)]],
+        '-': [[(0, 2), (3, 6)], [(0, 6)], [(0, 10)], [(0, 15)], [(0, 2), (3, 5), (6, 9)], [(4, 4), (20, 30)]],
+    },
+}
+for annotator in nms, priority, fractional:
+    for contig, strands in records.items():
+        for strand, blocks in strands.items():
+            offsets = [0]
+            for rec in blocks:
+                offsets.append(offsets[-1] + len(rec))
+            starts = [s for rec in blocks for s, _ in rec]
+            ends = [e for rec in blocks for _, e in rec]
+            result = annotator.annotate_many(contig, strand, starts, ends, offsets)
+
+            for ind, rec in enumerate(blocks):
+                expected = annotator.annotatei(contig, strand, rec)
+                if annotator is fractional:
+                    fraction = slice(result.indptr[ind], result.indptr[ind + 1])
+                    codes, fractions = annotator.decode(result.codes[fraction]), result.fractions[fraction].tolist()
+                    assert dict(zip(codes, fractions)).keys() == expected.keys()
+                    assert all(math.isclose(x, expected[k]) for k, x in zip(codes, fractions))
+                else:
+                    assert annotator.decode([result[ind]]) == [expected]
+
+# Precomputed partition must give the same results as the proportional strategy
+for annotator, strategy in (nms, "nms"), (fractional, "frac-overlap"), \
+        (priority, ("priority", ['1', '3', '5', '7', '0', '2', '4', '6', 'NA'])):
+    precomputed = make_annotator("proportional", strategy, precompute=True)
+    for contig, strands in records.items():
+        for strand, blocks in strands.items():
+            for rec in blocks:
+                expected = annotator.annotatei(contig, strand, rec)
+                if annotator is fractional:
+                    result = precomputed.annotatei(contig, strand, rec)
+                    assert result.keys() == expected.keys()
+                    assert all(math.isclose(x, expected[k]) for k, x in result.items())
+                else:
+                    assert precomputed.annotatei(contig, strand, rec) == expected
+
+            offsets = [0]
+            for rec in blocks:
+                offsets.append(offsets[-1] + len(rec))
+            starts = [s for rec in blocks for s, _ in rec]
+            ends = [e for rec in blocks for _, e in rec]
+            result = annotator.annotate_many(contig, strand, starts, ends, offsets)
+            expected = precomputed.annotate_many(contig, strand, starts, ends, offsets)
+            if annotator is fractional:
+                assert (result.indptr == expected.indptr).all() and (result.codes == expected.codes).all()
+                assert all(math.isclose(x, y) for x, y in zip(result.fractions, expected.fractions))
+            else:
+                assert (result == expected).all()
+
+# Records made only of zero-length blocks are annotated as empty, with or without the partition
+for precompute in False, True:
+    assert make_annotator("proportional", "nms", precompute=precompute).annotatei('2', '+', [(5, 5)]) == 'NA'
+
+# Merging removes duplicates across indices and remaps annotation codes
+other = gindex.Index.build([('2', '+', 1, 2, '0'), ('2', '+', 1, 2, 'new'), ('3', '.', 0, 5, '1')])
+merged = gindex.merge(nms.index, other, nms.index)
+assert merged.categories[:len(nms.index.categories)] == nms.index.categories and merged.categories[-1] == 'new'
+for key, intervals in nms.index.intervals.items():
+    expected = {(s, e, nms.index.categories[c]) for s, e, c in zip(intervals.starts, intervals.ends, intervals.codes)}
+    if key == ('2', '+'):
+        expected.add((1, 2, 'new'))
+    mintervals = merged.intervals[key]
+    assert len(mintervals) == len(expected)
+    assert {(s, e, merged.categories[c]) for s, e, c in zip(mintervals.starts, mintervals.ends, mintervals.codes)} \
+           == expected
+assert merged.overlap('3', '.', 0, 10).annotation == ['1']
+
+# Saved indices are loaded back as memory-mapped arrays and pickled as references to the folder
+folder = Path(tempfile.mkdtemp())
+nms.index.save(folder)
+for mmap in True, False:
+    loaded = gindex.Index.load(folder, mmap=mmap)
+    if mmap:
+        assert len(pickle.dumps(loaded)) < 1024
+        loaded = pickle.loads(pickle.dumps(loaded))
+    assert loaded.categories == nms.index.categories and loaded.intervals.keys() == nms.index.intervals.keys()
+    reloaded = Annotator(loaded)
+    for contig, strands in records.items():
+        for strand, blocks in strands.items():
+            for rec in blocks:
+                assert reloaded.annotatei(contig, strand, rec) == nms.annotatei(contig, strand, rec)
+
+# GTF & GFF3 are loaded with 0-based coordinates, attributes are used as annotations
+folder = Path(tempfile.mkdtemp())
+with gzip.open(folder / "genes.gtf.gz", "wt") as stream:
+    stream.write('#!genome-build test\n')
+    stream.write('1\thavana\tgene\t11\t20\t.\t+\t.\tgene_id "G1"; gene_name "A";\n')
+    stream.write('1\thavana\texon\t11\t15\t.\t+\t.\tgene_id "G1"; transcript_id "T1";\n')
+    stream.write('2\thavana\tgene\t1\t5\t.\t-\t.\tgene_id "G2"; gene_name "B";\n')
+with open(folder / "genes.gff3", "w") as stream:
+    stream.write('##gff-version 3\n')
+    stream.write('1\t.\tgene\t11\t20\t.\t+\t.\tID=g1;Name=A\n')
+    stream.write('1\t.\texon\t11\t15\t.\t+\t.\tParent=g1\n')
+
+index = gindex.load(folder / "genes.gtf.gz", "gene_name")
+assert set(index.overlap('1', '+', 0, 100).annotation) == {'A', None}
+assert index.overlap('1', '+', 0, 10).annotation == [] and index.overlap('2', '-', 4, 5).annotation == ['B']
+index = gindex.load(folder / "genes.gtf.gz", "feature")
+assert [(x.start, x.end) for x in index.overlap('1', '+', 0, 100).intervals] == [(10, 15), (10, 20)]
+index = gindex.load(folder / "genes.gff3", "Name")
+assert set(index.overlap('1', '+', 14, 15).annotation) == {'A', None} and index.intervals.keys() == {('1', '+')}
+
+# '#' starts a comment only at the beginning of a line
+with open(folder / "hashes.bed", "w") as stream:
+    stream.write('track name=test\n2\t5\t8\tg#3\t0\t+\n# comment\n\n2\t10\t12\th#\t0\t-\n')
+with gzip.open(folder / "hashes.gtf.gz", "wt") as stream:
+    stream.write('1\thavana\tgene\t11\t20\t.\t+\t.\tgene_id "G#1"; gene_name "A#1";\n###\n')
+    stream.write('1\thavana\tgene\t21\t30\t.\t+\t.\tgene_id "G2"; gene_name "B";\n#')
+
+index = gindex.from_bed(folder / "hashes.bed")
+assert index.overlap('2', '+', 0, 100).annotation == ['g#3'] and index.overlap('2', '-', 0, 100).annotation == ['h#']
+index = gindex.load(folder / "hashes.gtf.gz", "gene_name")
+assert index.overlap('1', '+', 0, 100).annotation == ['A#1', 'B']
+queries = gindex.join.Queries.from_file(folder / "hashes.bed")
+assert queries.strands.tolist() == ['+', '-'] and queries.starts.tolist() == [5, 10]
+
+# Custom annotations are read with pybedtools (the `bedtools` extra), the default loader doesn't need it
+pybedtools, sys.modules["pybedtools"] = sys.modules.get("pybedtools"), None
+try:
+    assert gindex.from_bed(folder / "hashes.bed").overlap('2', '+', 0, 100).annotation == ['g#3']
+    gindex.from_bed(folder / "hashes.bed", lambda it: it.score)
+except ImportError as e:
+    assert "biom[bedtools]" in str(e)
+else:
+    raise RuntimeError("from_bed with a custom datafn must fail without pybedtools")
+finally:
+    if pybedtools is None:
+        del sys.modules["pybedtools"]
+    else:
+        sys.modules["pybedtools"] = pybedtools
+index = gindex.from_bed(folder / "hashes.bed", lambda it: it.name.upper())
+assert index.overlap('2', '-', 0, 100).annotation == ['H#']
+
+# Bulk join of query intervals with an index
+index = gindex.Index.build([
+    ('1', '+', 10, 20, 'gene'), ('1', '-', 15, 40, 'antisense'), ('1', '+', 30, 31, 'site'), ('2', '.', 0, 100, 'chr2')
+])
+queries = gindex.join.Queries.build(
+    ['1', '1', '2', '3', '1'], ['+', '-', '.', '+', '+'], [0, 12, 50, 0, 18], [15, 30, 50, 10, 35]
+)
+pairs = gindex.join.join(index, queries)
+assert pairs.queries.tolist() == [0, 1, 4, 4] and pairs.overlaps.tolist() == [5, 15, 2, 1]
+assert [index.categories[x] for x in pairs.codes] == ['gene', 'antisense', 'gene', 'site']
+
+pairs = gindex.join.join(index, queries, strandness="opposite", threads=2)
+assert pairs.queries.tolist() == [1, 4] and pairs.starts.tolist() == [10, 15] and pairs.overlaps.tolist() == [8, 17]
+pairs = gindex.join.join(index, queries, strandness="ignore", minfrac=0.5)
+assert pairs.queries.tolist() == [1, 4] and [index.categories[x] for x in pairs.codes] == ['antisense', 'antisense']
+pairs = gindex.join.join(index, queries, strandness="ignore", minfrac=0.65, reciprocal=True)
+assert pairs.queries.tolist() == [4]
+
+# Nearest intervals with signed distances (> 0 downstream on the strand, 0 for overlaps)
+nearest = index.nearest('1', '+', [5, 15, 25, 40], k=2)
+assert nearest.distances.tolist() == [[5, 25], [0, 15], [5, -6], [-10, -21]]
+assert [[index.categories[x] for x in row] for row in nearest.codes] == \
+       [['gene', 'site'], ['gene', 'site'], ['site', 'gene'], ['site', 'gene']]
+nearest = index.nearest('1', '+', [25], k=3, direction="upstream")
+assert nearest.distances.tolist() == [[-6, 0, 0]] and nearest.hits[0, 1:].tolist() == [-1, -1]
+assert index.nearest('1', '-', [50]).distances.tolist() == [[11]]
+assert index.nearest('1', '-', [50], direction="upstream").codes.tolist() == [[-1]]
+assert index.closest('3', '+', [0], [10]).hits.tolist() == [[-1]]
+closest = index.closest('1', '+', [12, 21], [32, 22], k=2)
+assert closest.distances.tolist() == [[0, 0], [-2, 9]]
+
+# Cached annotations: repeated block structures are annotated once
+from biom.gindex.annotate import pure
+
+cached = Annotator(nms.index, annotation="frac-overlap", cache=2)
+records = [[(1, 5), (5, 10)], [(0, 6)], [(1, 5), (5, 10)], [(1, 5), (5, 10)], [(0, 2)], [(0, 6)]]
+expected = [fractional.annotatei('2', '+', rec) for rec in records]
+assert [cached.annotatei('2', '+', rec) for rec in records] == expected
+info = cached.cache_info()
+assert (info.hits, info.misses, info.currsize) == (2, 4, 2)
+cached.annotatei('2', '+', [(0, 2)])[None] = 1
+assert cached.annotatei('2', '+', [(0, 2)]) == expected[4] and cached.cache_info().hits == 4
+cached.cache_clear()
+assert cached.cache_info().currsize == 0 and Annotator(nms.index).cache_info() is None
+
+try:
+    Annotator(nms.index, annotation=lambda _, overlap: len(overlap), cache=16)
+except ValueError:
+    pass
+else:
+    raise RuntimeError("Impure strategies must not be cached")
+counter = Annotator(nms.index, annotation=pure(lambda _, overlap: len(overlap)), cache=16)
+assert counter.annotate_many('2', '+', [1, 5, 1, 5], [5, 10, 5, 10], [0, 2, 4]) == [8, 8]
+assert counter.cache_info().hits == 1
+
+# Cached annotators are picklable, e.g. for process workers
+cached = pickle.loads(pickle.dumps(Annotator(nms.index, cache=16)))
+assert cached.annotatei('2', '+', [(0, 10)]) == cached.annotatei('2', '+', [(0, 10)]) == '7'
+assert cached.cache_info().hits == 1
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+# Importing biom packages must be cheap: heavy dependencies are loaded on first use
+HEAVY = ("numba", "scipy", "pandas", "pyBigWig", "pysam", "joblib", "MACS3", "pybedtools", "intervaltree")
+# Generous budget (seconds) to catch regressions only, see benchmarks/imports.py for precise numbers
+BUDGET = 0.5
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import biom, biom.ripper, biom.gindex, biom.ensembl, biom.repmasker, biom.sam
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": list(sys.modules)}))
+"""
+
+result = json.loads(subprocess.run([sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True).stdout)
+eager = [x for x in HEAVY if x in result["modules"]]
+assert not eager, f"Heavy dependencies are imported eagerly: {eager}"
+assert result["elapsed"] < BUDGET, f"Import is too slow: {result['elapsed']:.3f}s"
+
+# Lazy exports resolve to the same objects as direct imports
+import biom
+from biom.gindex.index import Index
+from biom.ripper.run import run
+
+assert biom.gindex.Index is Index
+assert biom.ripper.run is run
+assert "Range" in dir(biom) and "ripper" in dir(biom)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from biom import Range, RangeArray
+
+
+def positions(ranges: RangeArray) -> set[int]:
+    return {x for rng in ranges for x in range(rng.start, rng.end)}
+
+
+def canonical(ranges: RangeArray) -> bool:
+    # Sorted, disjoint, non-adjacent & non-empty
+    return bool(np.all(ranges.ends > ranges.starts) and np.all(ranges.starts[1:] > ranges.ends[:-1]))
+
+
+ranges = RangeArray.build([0, 10, 5], [5, 20, 5])
+assert len(ranges) == 3 and ranges.lengths().tolist() == [5, 10, 0]
+assert list(ranges) == [Range(0, 5), Range(10, 20), Range(5, 5)] and ranges[1] == Range(10, 20)
+assert RangeArray.from_ranges(ranges) == ranges and ranges[1:] == RangeArray.build([10, 5], [20, 5])
+assert (ranges + 2) == RangeArray.build([2, 12, 7], [7, 22, 7]) and (ranges - [0, 1, 2])[2] == Range(3, 3)
+
+# Element-wise operations follow Range
+other = Range(3, 12)
+assert ranges.overlap(other).tolist() == [ranges[i].overlap(other) or 0 for i in range(3)] == [2, 2, 0]
+assert ranges.contains(Range(11, 12)).tolist() == [False, True, False]
+assert ranges.contains(RangeArray.build([0, 0, 5], [5, 5, 5])).tolist() == [True, False, False]
+
+# Set operations
+assert ranges.merge_within() == RangeArray.build([0, 10], [5, 20])
+assert ranges.merge_within(5) == RangeArray.build([0], [20])
+assert ranges.complement(30) == RangeArray.build([5, 20], [10, 30])
+assert RangeArray.empty().complement(10) == RangeArray.build([0], [10])
+assert ranges.intersect(RangeArray.build([4, 15], [11, 16])) == RangeArray.build([4, 10, 15], [5, 11, 16])
+
+rng = np.random.default_rng(7)
+for _ in range(200):
+    arrays = []
+    for _ in range(2):
+        n = rng.integers(0, 10)
+        starts = rng.integers(0, 100, n)
+        arrays.append(RangeArray.build(starts, starts + rng.integers(0, 20, n)))
+    first, second = arrays
+    a, b = positions(first), positions(second)
+    gap = int(rng.integers(0, 5))
+
+    for result, expected in [
+        (first.union(second), a | b), (first.intersect(second), a & b), (first.subtract(second), a - b),
+        (first.complement(110), set(range(110)) - a), (first.merge_within(0), a)
+    ]:
+        assert canonical(result) and positions(result) == expected
+
+    # Merging within a gap fills exactly the gaps of at most `gap` bp
+    merged, disjoint = first.merge_within(gap), first.merge_within(0)
+    gaps = RangeArray(disjoint.ends[:-1], disjoint.starts[1:])
+    assert canonical(merged) and positions(merged) == a | positions(gaps[gaps.lengths() <= gap])
@@ -0,0 +1,68 @@
+import dataclasses
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pyBigWig
+
+from biom import ripper
+from biom.ripper.core.config import PeakCallingConfig, Scaling
+from biom.sam import synthetic
+
+# Targeted runs process only padded windows around regions, everything outside them is zero
+folder = Path(tempfile.mkdtemp())
+contigs = {"1": 40_000, "2": 20_000, "3": 10_000}
+synthetic.write(folder / "treatment.bam", synthetic.Design(contigs, 4_000, hotspots=10, enrichment=0.4, seed=5))
+synthetic.write(folder / "control.bam", synthetic.Design(contigs, 4_000, seed=6))
+with open(folder / "regions.bed", "w") as stream:
+    stream.write("track name=targets\n1\t5000\t9000\tA\n1\t9500\t12000\tB\n2\t100\t3000\tC\n# other\nX\t0\t10\tD\n")
+# Padded & merged: 1:4000-13000 & 2:0-4000, contig 3 is not covered at all
+windows = {"1": [(4_000, 13_000)], "2": [(0, 4_000)], "3": []}
+
+saveto = folder / "out"
+for x in "pileup", "fe", "pvtrack", "pv", "fdr":
+    saveto.joinpath(x).mkdir(parents=True)
+config = PeakCallingConfig(
+    treatment=[folder / "treatment.bam"], control=[folder / "control.bam"], contigs=None, geffsize=70_000,
+    process=PeakCallingConfig.ProcessingParams(
+        "f/s", Scaling(np.float32(1), np.float32(1)), defaultdict(lambda: [0, 500]), threads=2,
+        backend="threading", inflags=3, exflags=2820, minmapq=1, packing=20_000
+    ),
+    callp=PeakCallingConfig.PeakCallingParams(qvcutoff=0.05, pvcutoff=0.01, fecutoff=1.5),
+    saveto=PeakCallingConfig.Saveto(
+        "test", saveto / "pileup", saveto / "fe", saveto / "pvtrack", saveto / "pv", saveto / "fdr"
+    ),
+    regions=folder / "regions.bed", padding=1_000
+)
+ripper.run(config)
+
+for track in (saveto / "pileup").glob("*.bigWig"):
+    with pyBigWig.open(track.as_posix()) as bw:
+        # Contigs without windows are not processed
+        assert bw.chroms() == {"1": 40_000, "2": 20_000}, track
+        for contig, contiglen in bw.chroms().items():
+            values = np.nan_to_num(np.asarray(bw.values(contig, 0, contiglen)))
+            inside = np.zeros(contiglen, dtype=bool)
+            for start, end in windows[contig]:
+                inside[start: end] = True
+            assert not np.any(values[~inside]), (track, contig)
+            # Control pileups are never empty within windows
+            if "cnt" in track.name and windows[contig]:
+                assert np.all(values[inside] > 0), (track, contig)
+
+peaks = (saveto / "pv" / "test.narrowPeak").read_text().splitlines()
+assert peaks
+for line in peaks:
+    contig, start, end = line.split("\t")[:3]
+    assert any(s <= int(start) < int(end) <= e for s, e in windows[contig]), line
+
+# Windows are computed once for the whole run
+calls = []
+original = ripper.core.pipeline.regions.windows
+ripper.core.pipeline.regions.windows = lambda x: calls.append(x) or original(x)
+try:
+    ripper.run(dataclasses.replace(config, saveto=dataclasses.replace(config.saveto, pileup=None)))
+finally:
+    ripper.core.pipeline.regions.windows = original
+assert len(calls) == 1
@@ -0,0 +1,51 @@
+import gzip
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import biom.repmasker
+from biom.repmasker import RepmaskerClassification
+
+for assembly in "GRCh38", "GRCm39":
+    path = Path(biom.repmasker.__file__).parent.joinpath(f"{assembly}.tsv.gz")
+    with gzip.open(path, 'rt') as stream:
+        expected = {}
+        for line in stream:
+            if line.strip():
+                name, cls, family = line.split()
+                expected[name] = (name, family, cls)
+
+    with tempfile.TemporaryDirectory() as cache:
+        # First instance parses the TSV and fills the cache, the second one loads the cache
+        for _ in range(2):
+            classification = RepmaskerClassification(path, cache=Path(cache))
+            assert all(classification.classify(x) == y for x, y in expected.items())
+            assert classification.classify("unknown-repeat") is None
+        assert len(list(Path(cache).iterdir())) == 1
+
+    assert classification.names() == {x[0] for x in expected.values()}
+    assert classification.families() == {x[1] for x in expected.values()}
+    assert classification.classes() == {x[2] for x in expected.values()}
+    assert classification.families() is classification.families()
+
+    # Array classification through categorical codes
+    repnames = list(expected)[::7] + ["unknown-repeat"]
+    names, families, classes = classification.classify_many(np.asarray(repnames))
+    cats = classification.categories
+    for ind, repname in enumerate(repnames[:-1]):
+        assert (cats.names[names[ind]], cats.families[families[ind]], cats.classes[classes[ind]]) == \
+               expected[repname]
+    assert names[-1] == families[-1] == classes[-1] == -1
+
+    # Categorical inputs, missing values are unknown repeats even if there are no categories at all
+    categorical = pd.Categorical(repnames + [None])
+    assert (classification.encode(categorical) == np.append(names, -1)).all()
+    for categorical in pd.Categorical([None, None]), pd.Categorical([]):
+        names, families, classes = classification.classify_many(categorical)
+        assert names.dtype == np.int32 and (names == -1).all() and (families == -1).all() and (classes == -1).all()
+        assert names.size == len(categorical)
+
+    # Bundled classifications are the same objects on every access
+    assert getattr(biom.repmasker, assembly) is getattr(biom.repmasker, assembly)
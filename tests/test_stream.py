@@ -0,0 +1,60 @@
+import dataclasses
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from biom import ripper
+from biom.ripper import stream
+from biom.ripper.core.config import PeakCallingConfig, Scaling
+from biom.ripper.core.store import TrackStore
+from biom.sam import synthetic
+
+# Streaming and in-memory runs must produce identical outputs
+folder = Path(tempfile.mkdtemp())
+contigs = {"1": 60_000, "2": 30_000, "3": 20_000}
+synthetic.write(folder / "treatment.bam", synthetic.Design(contigs, 6_000, hotspots=20, enrichment=0.4, seed=1))
+synthetic.write(folder / "control.bam", synthetic.Design(contigs, 6_000, seed=2))
+
+
+def config(saveto: Path, streaming: bool) -> PeakCallingConfig:
+    for x in "pileup", "fe", "pvtrack", "pv", "fdr":
+        saveto.joinpath(x).mkdir(parents=True)
+    return PeakCallingConfig(
+        treatment=[folder / "treatment.bam"], control=[folder / "control.bam"], contigs=None, geffsize=110_000,
+        process=PeakCallingConfig.ProcessingParams(
+            "f/s", Scaling(np.float32(1), np.float32(1)), defaultdict(lambda: [0, 500, 2000]), threads=1,
+            backend="threading", inflags=3, exflags=2820, minmapq=1, streaming=streaming
+        ),
+        callp=PeakCallingConfig.PeakCallingParams(qvcutoff=0.05, pvcutoff=0.01, fecutoff=1.5),
+        saveto=PeakCallingConfig.Saveto(
+            "test", saveto / "pileup", saveto / "fe", saveto / "pvtrack", saveto / "pv", saveto / "fdr"
+        )
+    )
+
+
+inmemory, streaming = config(folder / "inmemory", False), config(folder / "streaming", True)
+ripper.run(inmemory)
+ripper.run(dataclasses.replace(streaming, process=dataclasses.replace(streaming.process, spillto=folder)))
+
+files = sorted(x.relative_to(folder / "inmemory") for x in (folder / "inmemory").rglob("*") if x.is_file())
+assert len(files) == 10
+for file in files:
+    assert (folder / "inmemory" / file).read_bytes() == (folder / "streaming" / file).read_bytes(), file
+# Spilled tracks are removed
+assert not any(x.name.startswith("ripper-stream-") for x in folder.iterdir())
+
+# Kept stores reproduce the run without BAM files
+stream.run(streaming, keep=folder / "store")
+reloaded = config(folder / "reloaded", False)
+saveto = dataclasses.replace(reloaded.saveto, pileup=None)
+ripper.fromtracks(dataclasses.replace(reloaded, treatment=[], control=[], saveto=saveto), TrackStore(folder / "store"))
+files = sorted(x.relative_to(folder / "reloaded") for x in (folder / "reloaded").rglob("*") if x.is_file())
+assert len(files) == 6
+for file in files:
+    original, reloaded = (folder / "inmemory" / file).read_bytes(), (folder / "reloaded" / file).read_bytes()
+    # Peaks are written in the order of contigs, which might differ
+    if file.suffix == ".narrowPeak":
+        original, reloaded = sorted(original.splitlines()), sorted(reloaded.splitlines())
+    assert original == reloaded, file